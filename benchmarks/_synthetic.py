@@ -0,0 +1,146 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from skbio import OrdinationResults
+
+from q2_protein_pca._ranking import AA_MAP
+
+SEQUENCE_COUNTS = [1_000, 10_000, 100_000, 1_000_000]
+WIDTHS = [100, 500, 2_000]
+
+# alignments with more cells than this are skipped - raise it on machines
+# with enough memory to run the largest parameter combinations
+MAX_CELLS = int(os.environ.get('Q2_PROTEIN_PCA_BENCH_MAX_CELLS', 4e8))
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'q2-protein-pca-benchmarks')
+
+AMINO_ACIDS = np.frombuffer(b'ACDEFGHIKLMNPQRSTVWY', dtype=np.uint8)
+GAP = ord('-')
+BLOCK_SIZE = 10_000
+
+
+def skip_if_too_large(n_sequences, width):
+    # asv skips a benchmark when its setup raises NotImplementedError
+    if n_sequences * width > MAX_CELLS:
+        raise NotImplementedError(
+            'Alignment of %s x %s exceeds the benchmark size limit.' % (
+                n_sequences, width))
+
+
+def cache_path(name):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, name)
+
+
+def aligned_matrix(n_sequences, width, mutation_rate=0.3, gap_rate=0.05,
+                   seed=0):
+    # A protein family: every sequence is a mutated copy of one consensus
+    # sequence, with random gaps. Returned as an ASCII-encoded uint8 matrix.
+    rng = np.random.default_rng(seed)
+    consensus = rng.choice(AMINO_ACIDS, size=width)
+    alignment = np.empty((n_sequences, width), dtype=np.uint8)
+    for start in range(0, n_sequences, BLOCK_SIZE):
+        block = alignment[start:start + BLOCK_SIZE]
+        block[:] = consensus
+        mutated = rng.random(block.shape) < mutation_rate
+        block[mutated] = rng.choice(AMINO_ACIDS, size=mutated.sum())
+        block[rng.random(block.shape) < gap_rate] = GAP
+    return alignment
+
+
+def sequence_ids(n_sequences, start=0):
+    return ['seq%d' % i for i in range(start, start + n_sequences)]
+
+
+def write_fasta(alignment, fp, aligned=True, first_id=0):
+    ids = sequence_ids(len(alignment), first_id)
+    with open(fp, 'wb') as fh:
+        for seq_id, row in zip(ids, alignment):
+            if not aligned:
+                row = row[row != GAP]
+            fh.write(b'>%s\n%s\n' % (seq_id.encode(), row.tobytes()))
+
+
+def aligned_fasta(n_sequences, width, aligned=True):
+    # FASTA files are cached between benchmark runs
+    kind = 'aligned' if aligned else 'unaligned'
+    fp = cache_path('%s-%s-%s.fasta' % (kind, n_sequences, width))
+    if not os.path.exists(fp):
+        write_fasta(aligned_matrix(n_sequences, width), fp + '.tmp',
+                    aligned=aligned)
+        os.replace(fp + '.tmp', fp)
+    return fp
+
+
+def added_fasta(n_sequences, n_added, width):
+    # an alignment and `n_added` more sequences of the same family, with
+    # distinct IDs, aligned to the same positions
+    name = '%s-%s-%s-%s.fasta'
+    fps = [cache_path(name % (kind, n_sequences, n_added, width))
+           for kind in ('reference', 'added')]
+    if not all(os.path.exists(fp) for fp in fps):
+        alignment = aligned_matrix(n_sequences + n_added, width)
+        for fp, rows, first_id in ((fps[0], alignment[:n_sequences], 0),
+                                   (fps[1], alignment[n_sequences:],
+                                    n_sequences)):
+            write_fasta(rows, fp + '.tmp', first_id=first_id)
+            os.replace(fp + '.tmp', fp)
+    return fps
+
+
+def ranks_frame(n_sequences, width):
+    # ranks of the synthetic alignment, computed by the ranking kernel
+    import aln_ranking
+
+    lut = np.zeros(256, dtype=np.uint32)
+    for aa, code in AA_MAP.items():
+        lut[ord(aa)] = code
+    codes = lut[aligned_matrix(n_sequences, width)]
+    ranks = pd.DataFrame(
+        aln_ranking.rank_sequences(codes),
+        index=pd.Index(sequence_ids(n_sequences), name='Sequence ID'),
+        columns=['pos%d' % (i + 1) for i in range(width)])
+    return ranks
+
+
+def positions_mapping(n_sequences, width):
+    alignment = aligned_matrix(n_sequences, width)
+    is_residue = alignment != GAP
+    positions = np.cumsum(is_residue, axis=1) - 1
+    mapping = pd.DataFrame(
+        np.where(is_residue, positions, -1).T,
+        columns=sequence_ids(n_sequences))
+    mapping = mapping.mask(mapping < 0).astype('Int64')
+    mapping.index.name = 'Alignment position'
+    return mapping
+
+
+def _ordination(index, n_components, seed):
+    rng = np.random.default_rng(seed)
+    eigvals = np.sort(rng.random(n_components))[::-1]
+    return OrdinationResults(
+        short_method_name='PCA',
+        long_method_name='Principal Components Analysis',
+        eigvals=pd.Series(eigvals),
+        samples=pd.DataFrame(
+            rng.normal(size=(len(index), n_components)), index=index),
+        proportion_explained=pd.Series(eigvals / eigvals.sum()))
+
+
+def loadings(width, n_components=10, seed=0):
+    return _ordination(['pos%d' % (i + 1) for i in range(width)],
+                       n_components, seed)
+
+
+def scores(n_sequences, n_components=10, seed=0):
+    return _ordination(sequence_ids(n_sequences), n_components, seed)
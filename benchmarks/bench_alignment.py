@@ -0,0 +1,77 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import shutil
+
+from q2_types.feature_data import (
+    AlignedProteinFASTAFormat, ProteinFASTAFormat)
+from q2_types.feature_data._transformer import AlignedProteinIterator
+
+from q2_protein_pca import filter_alignment, mafft, map_positions
+
+from ._synthetic import (
+    aligned_fasta, skip_if_too_large, SEQUENCE_COUNTS, WIDTHS)
+
+
+class Mafft:
+    # mafft is only run up to 10k sequences - larger sets take hours
+    params = ([1_000, 10_000], WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        if shutil.which('mafft') is None:
+            raise NotImplementedError('mafft is not installed.')
+        skip_if_too_large(n_sequences, width)
+        self.sequences = ProteinFASTAFormat(
+            aligned_fasta(n_sequences, width, aligned=False), mode='r')
+
+    def time_mafft(self, n_sequences, width):
+        mafft(self.sequences, n_threads='auto')
+
+    def peakmem_mafft(self, n_sequences, width):
+        mafft(self.sequences, n_threads='auto')
+
+
+class MapPositions:
+    params = (SEQUENCE_COUNTS, WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(n_sequences, width)
+        self.fp = aligned_fasta(n_sequences, width)
+
+    def _sequences(self):
+        return AlignedProteinFASTAFormat(
+            self.fp, mode='r').view(AlignedProteinIterator)
+
+    def time_map_positions(self, n_sequences, width):
+        map_positions(self._sequences())
+
+    def peakmem_map_positions(self, n_sequences, width):
+        map_positions(self._sequences())
+
+
+class FilterAlignment:
+    params = (SEQUENCE_COUNTS, WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(n_sequences, width)
+        self.sequences = AlignedProteinFASTAFormat(
+            aligned_fasta(n_sequences, width), mode='r')
+
+    def time_filter_alignment(self, n_sequences, width):
+        filter_alignment(self.sequences, max_sequence_gaps=0.1,
+                         max_position_gaps=0.1)
+
+    def peakmem_filter_alignment(self, n_sequences, width):
+        filter_alignment(self.sequences, max_sequence_gaps=0.1,
+                         max_position_gaps=0.1)
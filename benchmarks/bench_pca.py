@@ -0,0 +1,78 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from q2_types.feature_data import AlignedProteinFASTAFormat
+from q2_types.feature_data._transformer import AlignedProteinIterator
+
+from q2_protein_pca import create_ranking_state, pca, pca_bootstrap, project
+
+from ._synthetic import (
+    aligned_fasta, ranks_frame, skip_if_too_large, SEQUENCE_COUNTS, WIDTHS)
+
+
+class PCA:
+    params = (SEQUENCE_COUNTS, WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(n_sequences, width)
+        self.ranks = ranks_frame(n_sequences, width)
+
+    def time_pca(self, n_sequences, width):
+        pca(self.ranks)
+
+    def peakmem_pca(self, n_sequences, width):
+        pca(self.ranks)
+
+    def time_pca_10_components(self, n_sequences, width):
+        pca(self.ranks, n_components=10)
+
+
+class PCABootstrap:
+    params = ([1_000, 10_000, 100_000], WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(n_sequences, width)
+        self.ranks = ranks_frame(n_sequences, width)
+
+    def time_pca_bootstrap(self, n_sequences, width):
+        pca_bootstrap(self.ranks)
+
+    def peakmem_pca_bootstrap(self, n_sequences, width):
+        pca_bootstrap(self.ranks)
+
+    def time_pca_bootstrap_parallel(self, n_sequences, width):
+        pca_bootstrap(self.ranks, n_jobs='auto')
+
+
+class Project:
+    # sequences projected onto a model fitted on 10k sequences
+    params = (SEQUENCE_COUNTS, WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(n_sequences, width)
+        state = create_ranking_state(AlignedProteinFASTAFormat(
+            aligned_fasta(10_000, width), mode='r').view(
+                AlignedProteinIterator))
+        self.model = pca(state.matrix, ranking_state=state)[2]
+        self.fp = aligned_fasta(n_sequences, width)
+
+    def _sequences(self):
+        return AlignedProteinFASTAFormat(
+            self.fp, mode='r').view(AlignedProteinIterator)
+
+    def time_project(self, n_sequences, width):
+        project(self.model, self._sequences())
+
+    def peakmem_project(self, n_sequences, width):
+        project(self.model, self._sequences())
@@ -0,0 +1,65 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import tempfile
+
+import pandas as pd
+import qiime2
+
+from q2_protein_pca import plot_loadings, plot_scores
+
+from ._synthetic import (
+    loadings, positions_mapping, scores, sequence_ids, SEQUENCE_COUNTS)
+
+
+class PlotLoadings:
+    # the width is the number of alignment positions plotted; the number of
+    # sequences only affects the positions mapping
+    params = ([100, 2_000, 20_000, 100_000], [10, 100])
+    param_names = ['width', 'n_sequences']
+    timeout = 3600
+
+    def setup(self, width, n_sequences):
+        self.loadings = loadings(width)
+        self.mapping = positions_mapping(n_sequences, width)
+
+    def _plot(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            plot_loadings(output_dir, self.loadings, self.mapping.copy())
+
+    def time_plot_loadings(self, width, n_sequences):
+        self._plot()
+
+    def peakmem_plot_loadings(self, width, n_sequences):
+        self._plot()
+
+
+class PlotScores:
+    params = (SEQUENCE_COUNTS + [10_000_000], [False, True])
+    param_names = ['n_sequences', 'metadata']
+    timeout = 3600
+
+    def setup(self, n_sequences, metadata):
+        self.scores = scores(n_sequences)
+        self.metadata = None
+        if metadata:
+            # sequences coloured by one of ten groups
+            ids = pd.Index(sequence_ids(n_sequences), name='id')
+            self.metadata = qiime2.CategoricalMetadataColumn(pd.Series(
+                ['group%d' % (i % 10) for i in range(n_sequences)],
+                index=ids, name='group'))
+
+    def _plot(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            plot_scores(output_dir, self.scores, self.metadata)
+
+    def time_plot_scores(self, n_sequences, metadata):
+        self._plot()
+
+    def peakmem_plot_scores(self, n_sequences, metadata):
+        self._plot()
@@ -0,0 +1,116 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from q2_types.feature_data import AlignedProteinFASTAFormat
+from q2_types.feature_data._transformer import AlignedProteinIterator
+
+from q2_protein_pca import (
+    create_ranking_state, position_profile, rank_alignment, rank_alignments,
+    score_positions, update_ranks)
+
+from ._synthetic import (
+    added_fasta, aligned_fasta, skip_if_too_large, SEQUENCE_COUNTS, WIDTHS)
+
+
+def _iterator(fp):
+    return AlignedProteinFASTAFormat(fp, mode='r').view(AlignedProteinIterator)
+
+
+class RankAlignment:
+    params = (SEQUENCE_COUNTS, WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(n_sequences, width)
+        self.fp = aligned_fasta(n_sequences, width)
+
+    def time_rank_alignment(self, n_sequences, width):
+        rank_alignment(_iterator(self.fp))
+
+    def peakmem_rank_alignment(self, n_sequences, width):
+        rank_alignment(_iterator(self.fp))
+
+
+class RankAlignments:
+    # a collection of four alignments, ranked one at a time and in parallel
+    params = ([1_000, 10_000, 100_000], WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(4 * n_sequences, width)
+        fp = aligned_fasta(n_sequences, width)
+        self.sequences = {
+            'aln%d' % i: AlignedProteinFASTAFormat(fp, mode='r')
+            for i in range(4)}
+
+    def time_rank_alignments(self, n_sequences, width):
+        rank_alignments(self.sequences)
+
+    def peakmem_rank_alignments(self, n_sequences, width):
+        rank_alignments(self.sequences)
+
+    def time_rank_alignments_parallel(self, n_sequences, width):
+        rank_alignments(self.sequences, n_jobs='auto')
+
+
+class UpdateRanks:
+    # a ranking state created for an alignment, and 1k new sequences added
+    # to it
+    params = (SEQUENCE_COUNTS, WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(n_sequences, width)
+        self.reference_fp, self.added_fp = added_fasta(
+            n_sequences, 1_000, width)
+        self.state = create_ranking_state(_iterator(self.reference_fp))
+
+    def time_create_ranking_state(self, n_sequences, width):
+        create_ranking_state(_iterator(self.reference_fp))
+
+    def time_update_ranks(self, n_sequences, width):
+        update_ranks(self.state, _iterator(self.added_fp))
+
+    def peakmem_update_ranks(self, n_sequences, width):
+        update_ranks(self.state, _iterator(self.added_fp))
+
+
+class ScorePositions:
+    params = (SEQUENCE_COUNTS, WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(n_sequences, width)
+        self.fp = aligned_fasta(n_sequences, width)
+
+    def time_score_positions(self, n_sequences, width):
+        score_positions(_iterator(self.fp))
+
+    def peakmem_score_positions(self, n_sequences, width):
+        score_positions(_iterator(self.fp))
+
+
+class PositionProfile:
+    params = (SEQUENCE_COUNTS, WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(n_sequences, width)
+        self.sequences = AlignedProteinFASTAFormat(
+            aligned_fasta(n_sequences, width), mode='r')
+
+    def time_position_profile(self, n_sequences, width):
+        position_profile(self.sequences)
+
+    def peakmem_position_profile(self, n_sequences, width):
+        position_profile(self.sequences)
@@ -0,0 +1,102 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import pandas as pd
+
+from q2_protein_pca._format import (
+    PositionMappingFormat, RankedProteinAlignmentFormat)
+from q2_protein_pca._transformer import _1, _2, _3, _4
+
+from ._synthetic import (
+    cache_path, positions_mapping, ranks_frame, skip_if_too_large,
+    SEQUENCE_COUNTS, WIDTHS)
+
+
+class RankedProteinAlignmentIO:
+    # transformers _1 (format -> DataFrame) and _2 (DataFrame -> format)
+    # and format validation
+    params = (SEQUENCE_COUNTS, WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(n_sequences, width)
+        self.ranks = ranks_frame(n_sequences, width)
+        self.fp = cache_path('ranks-%s-%s.csv' % (n_sequences, width))
+        self.ranks.to_csv(self.fp)
+
+    def _format(self):
+        return RankedProteinAlignmentFormat(self.fp, mode='r')
+
+    def time_read(self, n_sequences, width):
+        _1(self._format())
+
+    def peakmem_read(self, n_sequences, width):
+        _1(self._format())
+
+    def time_write(self, n_sequences, width):
+        _2(self.ranks)
+
+    def peakmem_write(self, n_sequences, width):
+        _2(self.ranks)
+
+    def time_validate_min(self, n_sequences, width):
+        self._format().validate(level='min')
+
+    def time_validate_max(self, n_sequences, width):
+        self._format().validate(level='max')
+
+
+class PositionMappingIO:
+    # transformers _3 (format -> DataFrame) and _4 (DataFrame -> format)
+    # and format validation
+    params = ([100, 1_000, 10_000], WIDTHS)
+    param_names = ['n_sequences', 'width']
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(n_sequences, width)
+        self.mapping = positions_mapping(n_sequences, width)
+        self.fp = cache_path('mapping-%s-%s.csv' % (n_sequences, width))
+        self.mapping.to_csv(self.fp)
+
+    def _format(self):
+        return PositionMappingFormat(self.fp, mode='r')
+
+    def time_read(self, n_sequences, width):
+        _3(self._format())
+
+    def time_write(self, n_sequences, width):
+        _4(self.mapping)
+
+    def time_validate_min(self, n_sequences, width):
+        self._format().validate(level='min')
+
+    def time_validate_max(self, n_sequences, width):
+        self._format().validate(level='max')
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class RankedProteinAlignmentMemory:
+    # size of the DataFrame produced by transformer _1
+    params = ([1_000, 10_000, 100_000], WIDTHS)
+    param_names = ['n_sequences', 'width']
+    unit = 'bytes'
+    timeout = 3600
+
+    def setup(self, n_sequences, width):
+        skip_if_too_large(n_sequences, width)
+        self.fp = cache_path('ranks-%s-%s.csv' % (n_sequences, width))
+        ranks_frame(n_sequences, width).to_csv(self.fp)
+
+    def track_frame_size(self, n_sequences, width):
+        return _frame_bytes(
+            _1(RankedProteinAlignmentFormat(self.fp, mode='r')))
@@ -6,14 +6,22 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
-from ._alignment import mafft, map_positions
-from ._pca import pca
-from ._plot import plot_loadings
-from ._ranking import rank_alignment
+from ._actions import (
+    create_ranking_state, filter_alignment, mafft, map_positions, pca,
+    pca_bootstrap, plot_loadings, plot_scores, position_profile, project,
+    rank_alignment, rank_alignments, score_positions, update_ranks)
+from ._memo import clear_cache, disable_cache, enable_cache
+from ._pca_model import FittedPCA
+from ._rank_matrix import OccurrenceRanks, RankMatrix, SharedRankMatrix
 
 __version__ = "2020.08"
 
-__all__ = ['mafft', 'map_positions', 'pca', 'plot_loadings', 'rank_alignment']
+__all__ = ['create_ranking_state', 'filter_alignment', 'mafft',
+           'map_positions', 'pca', 'pca_bootstrap', 'plot_loadings',
+           'plot_scores', 'position_profile', 'project', 'rank_alignment',
+           'rank_alignments', 'score_positions', 'update_ranks', 'FittedPCA',
+           'OccurrenceRanks', 'RankMatrix', 'SharedRankMatrix',
+           'clear_cache', 'disable_cache', 'enable_cache']
 
 from ._version import get_versions
 __version__ = get_versions()['version']
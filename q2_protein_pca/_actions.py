@@ -0,0 +1,146 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+# Lightweight entry points for the plugin's actions. The implementation
+# modules pull in sklearn, q2templates, q2_alignment and the aln_ranking
+# extension, so they are only imported once an action is actually called.
+# Signatures here must match the implementations (see tests/test_startup.py).
+
+import pandas as pd
+import qiime2
+from q2_types.feature_data import (
+    AlignedProteinFASTAFormat, ProteinFASTAFormat)
+from q2_types.feature_data._transformer import AlignedProteinIterator
+from skbio import OrdinationResults
+
+from ._lazy import lazy
+from ._pca_model import FittedPCA
+from ._rank_matrix import OccurrenceRanks, RankMatrix
+
+
+@lazy('._alignment')
+def mafft(sequences: ProteinFASTAFormat,
+          n_threads: int = 1,
+          parttree: bool = False) -> AlignedProteinFASTAFormat:
+    ...
+
+
+@lazy('._alignment')
+def map_positions(
+        aligned_sequences: AlignedProteinIterator) -> pd.DataFrame:
+    ...
+
+
+@lazy('._filter')
+def filter_alignment(sequences: AlignedProteinFASTAFormat,
+                     max_sequence_gaps: float = 0.8,
+                     max_position_gaps: float = 1.0
+                     ) -> (AlignedProteinFASTAFormat, pd.DataFrame):
+    ...
+
+
+@lazy('._ranking')
+def rank_alignment(sequences: AlignedProteinIterator,
+                   weighting: str = 'none',
+                   identity_threshold: float = 0.8,
+                   weights: qiime2.NumericMetadataColumn = None
+                   ) -> pd.DataFrame:
+    ...
+
+
+@lazy('._ranking')
+def score_positions(sequences: AlignedProteinIterator,
+                    weighting: str = 'none',
+                    identity_threshold: float = 0.8,
+                    weights: qiime2.NumericMetadataColumn = None
+                    ) -> pd.DataFrame:
+    ...
+
+
+@lazy('._ranking')
+def position_profile(sequences: AlignedProteinFASTAFormat,
+                     weighting: str = 'none',
+                     identity_threshold: float = 0.8,
+                     weights: qiime2.NumericMetadataColumn = None,
+                     frequencies: bool = False
+                     ) -> (pd.DataFrame, AlignedProteinFASTAFormat):
+    ...
+
+
+@lazy('._ranking')
+def rank_alignments(sequences: AlignedProteinFASTAFormat,
+                    weighting: str = 'none',
+                    identity_threshold: float = 0.8,
+                    weights: qiime2.NumericMetadataColumn = None,
+                    n_jobs: int = 1) -> RankMatrix:
+    ...
+
+
+@lazy('._ranking')
+def create_ranking_state(
+        sequences: AlignedProteinIterator) -> OccurrenceRanks:
+    ...
+
+
+@lazy('._ranking')
+def update_ranks(ranking_state: OccurrenceRanks,
+                 sequences: AlignedProteinIterator
+                 ) -> (OccurrenceRanks, RankMatrix):
+    ...
+
+
+@lazy('._pca')
+def pca(ranks: RankMatrix,
+        n_components: int = None,
+        deduplicate: bool = False,
+        ranking_state: OccurrenceRanks = None
+        ) -> (OrdinationResults, OrdinationResults, FittedPCA):
+    ...
+
+
+@lazy('._bootstrap')
+def pca_bootstrap(ranks: RankMatrix,
+                  n_replicates: int = 100,
+                  n_components: int = 2,
+                  confidence: float = 0.95,
+                  random_seed: int = 0,
+                  n_jobs: int = 1) -> pd.DataFrame:
+    ...
+
+
+@lazy('._pca')
+def project(pca_model: FittedPCA,
+            sequences: AlignedProteinIterator) -> OrdinationResults:
+    ...
+
+
+@lazy('._plot')
+def plot_loadings(
+        output_dir: str,
+        pca_loadings: OrdinationResults,
+        positions_mapping: pd.DataFrame,
+        pdb_id: str = None,
+        nterm_offset: int = 1,
+        lod_threshold: int = 5000,
+        lod_bins: int = 100,
+        renderer: str = 'canvas',
+        pdb_file: str = None,
+        pdb_cache_dir: str = None,
+        loading_intervals: pd.DataFrame = None,
+        position_scores: pd.DataFrame = None) -> None:
+    ...
+
+
+@lazy('._plot')
+def plot_scores(
+        output_dir: str,
+        pca_scores: OrdinationResults,
+        metadata: qiime2.MetadataColumn = None,
+        x_component: int = 1,
+        y_component: int = 2) -> None:
+    ...
@@ -0,0 +1,126 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ._pca import _eigen_pca
+from ._rank_matrix import RankMatrix, SharedRankMatrix, _deduplicate_rows
+
+# number of replicates computed by a worker per task
+REPLICATES_PER_TASK = 8
+
+# state of the current process for _replicate_loadings: the unique ranked
+# sequences (in shared memory within pool workers), their multiplicities
+# and the reference loadings replicates are oriented by
+_replicate_data = {}
+
+
+def _loadings(components: np.ndarray, variance: np.ndarray) -> np.ndarray:
+    # (positions x components), as in _pca
+    return -1 * components.T * np.sqrt(variance)
+
+
+def _set_replicate_data(unique, counts, reference, shared=None):
+    _replicate_data.update(unique=unique, counts=counts, reference=reference,
+                           shared=shared)
+
+
+def _attach_replicate_data(shared: SharedRankMatrix, counts, reference):
+    # pool initializer; `shared` arrives mapped rather than copied
+    _set_replicate_data(shared.ranks, counts, reference, shared)
+
+
+def _replicate_loadings(replicates: range, random_seed: int) -> np.ndarray:
+    # (replicates x positions x components) loadings of PCAs of sequences
+    # resampled with replacement. Resampling only changes how often each
+    # unique sequence occurs, so every replicate is a weighted PCA of all
+    # unique sequences, those not drawn weighing zero; this avoids copying
+    # the drawn ones for every replicate.
+    unique, counts = _replicate_data['unique'], _replicate_data['counts']
+    reference = _replicate_data['reference']
+    n_sequences, n_components = counts.sum(), reference.shape[1]
+
+    loadings = np.empty((len(replicates),) + reference.shape,
+                        dtype=np.float32)
+    for i, replicate in enumerate(replicates):
+        # seeded by replicate, so results do not depend on the number of jobs
+        rng = np.random.default_rng([random_seed, replicate])
+        weights = rng.multinomial(n_sequences, counts / n_sequences)
+        components, variance, _, _, _ = _eigen_pca(
+            unique, weights, n_components)
+        replicate_loadings = _loadings(components, variance)
+
+        # axes are only defined up to their sign
+        signs = np.sign((replicate_loadings * reference).sum(axis=0))
+        signs[signs == 0] = 1
+        loadings[i] = replicate_loadings * signs
+    return loadings
+
+
+def _bootstrap_loadings(unique: RankMatrix, counts: np.ndarray,
+                        reference: np.ndarray, n_replicates: int,
+                        random_seed: int, n_jobs: int) -> np.ndarray:
+    tasks = [range(start, min(start + REPLICATES_PER_TASK, n_replicates))
+             for start in range(0, n_replicates, REPLICATES_PER_TASK)]
+    if n_jobs == 1 or len(tasks) == 1:
+        _set_replicate_data(unique.ranks, counts, reference)
+        try:
+            return np.concatenate(
+                [_replicate_loadings(task, random_seed) for task in tasks])
+        finally:
+            _replicate_data.clear()
+
+    # The ranks are copied into shared memory once and mapped by every
+    # worker, instead of being pickled to each of them.
+    with SharedRankMatrix.from_rank_matrix(unique) as shared, \
+            ProcessPoolExecutor(
+                max_workers=min(n_jobs, len(tasks)),
+                initializer=_attach_replicate_data,
+                initargs=(shared, counts, reference)) as pool:
+        return np.concatenate(list(pool.map(
+            _replicate_loadings, tasks, [random_seed] * len(tasks))))
+
+
+def _pca_bootstrap(ranks: RankMatrix, n_replicates: int = 100,
+                   n_components: int = 2, confidence: float = 0.95,
+                   random_seed: int = 0, n_jobs: int = 1) -> pd.DataFrame:
+    if isinstance(ranks, pd.DataFrame):
+        ranks = RankMatrix.from_dataframe(ranks)
+    if n_jobs == 'auto':
+        n_jobs = os.cpu_count()
+
+    unique, _, counts = _deduplicate_rows(ranks.ranks)
+    components, variance, _, _, _ = _eigen_pca(unique, counts, n_components)
+    reference = _loadings(components, variance)
+    unique = RankMatrix(np.arange(len(unique)), ranks.positions, unique)
+
+    loadings = _bootstrap_loadings(
+        unique, counts, reference, n_replicates, random_seed, n_jobs)
+    lower, upper = np.quantile(
+        loadings, [(1 - confidence) / 2, (1 + confidence) / 2], axis=0)
+
+    intervals = pd.DataFrame(
+        {f'PC{i + 1} {bound}': values[:, i]
+         for i in range(n_components)
+         for bound, values in (('lower', lower), ('upper', upper))},
+        index=pd.Index(ranks.positions, name='Position'))
+    return intervals
+
+
+def pca_bootstrap(ranks: RankMatrix,
+                  n_replicates: int = 100,
+                  n_components: int = 2,
+                  confidence: float = 0.95,
+                  random_seed: int = 0,
+                  n_jobs: int = 1) -> pd.DataFrame:
+    return _pca_bootstrap(ranks, n_replicates, n_components, confidence,
+                          random_seed, n_jobs)
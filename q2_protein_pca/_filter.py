@@ -0,0 +1,116 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+from q2_types.feature_data import AlignedProteinFASTAFormat
+
+from ._weighting import _row_blocks
+
+# alignment characters counted as gaps
+GAP_CODES = np.frombuffer(b'-.', dtype=np.uint8)
+
+
+def _read_alignment(path: str):
+    # (header lines, sequences x positions matrix of ASCII codes) of an
+    # aligned FASTA file; sequences may be wrapped over several lines
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    headers, sequences = [], []
+    data = data.lstrip()
+    if data.startswith(b'>'):
+        data = data[1:]
+    for record in data.split(b'\n>'):
+        if not record.strip():
+            continue
+        header, _, sequence = record.partition(b'\n')
+        headers.append(header.rstrip(b'\r'))
+        sequences.append(b''.join(sequence.split()))
+
+    lengths = {len(sequence) for sequence in sequences}
+    if len(lengths) > 1:
+        raise ValueError(
+            'The sequences are not aligned: found sequences of lengths %s.'
+            % ', '.join(map(str, sorted(lengths))))
+    length = lengths.pop() if lengths else 0
+    matrix = np.frombuffer(b''.join(sequences), dtype=np.uint8).reshape(
+        len(sequences), length)
+    return headers, matrix
+
+
+def _header_ids(headers: list) -> list:
+    # sequence IDs: the first word of every header line
+    return [(header.split(maxsplit=1) or [b''])[0].decode()
+            for header in headers]
+
+
+def _gap_fractions(matrix: np.ndarray):
+    # fractions of gaps in every sequence and at every position, counted in
+    # one pass over blocks of rows
+    sequence_gaps = np.zeros(matrix.shape[0], dtype=np.int64)
+    position_gaps = np.zeros(matrix.shape[1], dtype=np.int64)
+    for rows in _row_blocks(*matrix.shape):
+        gaps = np.isin(matrix[rows], GAP_CODES)
+        sequence_gaps[rows] = gaps.sum(axis=1)
+        position_gaps += gaps.sum(axis=0)
+    return (sequence_gaps / max(matrix.shape[1], 1),
+            position_gaps / max(matrix.shape[0], 1))
+
+
+def _write_alignment(path: str, headers: list, matrix: np.ndarray,
+                     sequences: np.ndarray, positions: np.ndarray):
+    # writes the given sequences (rows) restricted to the given positions
+    # (columns), a block of rows at a time
+    with open(path, 'wb') as fh:
+        for rows in _row_blocks(len(sequences), len(positions)):
+            block = matrix[sequences[rows]][:, positions]
+            for i, row in zip(sequences[rows], block):
+                fh.write(b'>%s\n%s\n' % (headers[i], row.tobytes()))
+
+
+def _filter_alignment(path: str, result_path: str,
+                      max_sequence_gaps: float = 0.8,
+                      max_position_gaps: float = 1.0) -> pd.DataFrame:
+    headers, matrix = _read_alignment(path)
+    sequence_gaps, position_gaps = _gap_fractions(matrix)
+
+    # both fractions refer to the unfiltered alignment
+    removed_sequences = sequence_gaps > max_sequence_gaps
+    removed_positions = position_gaps > max_position_gaps
+    if removed_sequences.all() or removed_positions.all():
+        raise ValueError(
+            'No %s would be left after filtering. Try a higher gap '
+            'threshold.' % ('sequences' if removed_sequences.all()
+                            else 'positions'))
+    _write_alignment(result_path, headers, matrix,
+                     np.flatnonzero(~removed_sequences),
+                     np.flatnonzero(~removed_positions))
+
+    # IDs are prefixed with their kind, so that a sequence named like a
+    # position cannot clash with it
+    ids = ['sequence:%s' % name for name in _header_ids(
+        [headers[i] for i in np.flatnonzero(removed_sequences)])]
+    positions = ['position:pos%s' % (j + 1)
+                 for j in np.flatnonzero(removed_positions)]
+    report = pd.DataFrame(
+        {'Kind': ['sequence'] * len(ids) + ['position'] * len(positions),
+         'Gap fraction': np.concatenate(
+             [sequence_gaps[removed_sequences],
+              position_gaps[removed_positions]])},
+        index=pd.Index(ids + positions, name='ID'))
+    return report
+
+
+def filter_alignment(sequences: AlignedProteinFASTAFormat,
+                     max_sequence_gaps: float = 0.8,
+                     max_position_gaps: float = 1.0
+                     ) -> (AlignedProteinFASTAFormat, pd.DataFrame):
+    result = AlignedProteinFASTAFormat()
+    report = _filter_alignment(str(sequences), str(result),
+                               max_sequence_gaps, max_position_gaps)
+    return result, report
@@ -7,10 +7,18 @@
 # ----------------------------------------------------------------------------
 
 import csv
+import io
+import zipfile
+from itertools import islice
 
+import numpy as np
+import pandas as pd
 from qiime2.core.exceptions import ValidationError
 from qiime2.plugin import model
 
+from ._pca_model import _NPY_HEADER_READERS
+from ._rank_matrix import ALPHABET, SCORE_COLUMNS
+
 
 class RankedProteinAlignmentFormat(model.TextFileFormat):
     HEADER = ["Sequence ID", "pos"]
@@ -92,34 +100,377 @@ def _validate_file_not_empty(has_data):
             "file in addition to the header line.")
 
 
+def _non_negative_numbers(values) -> bool:
+    try:
+        return all(float(x) >= 0 for x in values)
+    except ValueError:
+        return False
+
+
+class _PositionTableFormat(model.TextFileFormat):
+    # one line of values per alignment position under a fixed HEADER;
+    # subclasses check the values of each line in _check_values
+    HEADER = None
+
+    def _check_values(self, values, line_number):
+        raise NotImplementedError
+
+    def _check_n_records(self, n=None):
+        with self.open() as fh:
+            reader = csv.reader(fh, delimiter=',')
+            header = next(reader, None)
+            _validate_file_not_empty(bool(header))
+            if header != self.HEADER:
+                raise ValidationError(
+                    'The header must be %s. Found: %s.' % (
+                        ','.join(self.HEADER), ','.join(header)))
+
+            data_line_count = 0
+            for i, line in islice(enumerate(reader, start=2), n):
+                if len(line) != len(self.HEADER):
+                    raise ValidationError(
+                        'Number of values on line %s are not the same as '
+                        'number of header values. Found %s values, expected '
+                        '%s.' % (i, len(line), len(self.HEADER)))
+                self._check_values(line[1:], i)
+                data_line_count += 1
+
+            _validate_file_not_empty(data_line_count > 0)
+
+    def _validate_(self, level):
+        self._check_n_records(n={'min': 5, 'max': None}[level])
+
+
 class PositionMappingFormat(model.TextFileFormat):
+    HEADER = 'Alignment position'
+    # number of bytes parsed and checked at a time
+    CHUNK_BYTES = 2 ** 24
+
+    def _check_header(self, header):
+        if not header or header[0] != self.HEADER:
+            raise ValidationError(
+                '%s must be the first header value. The first header value '
+                'provided is: %s (on line 1).' % (
+                    self.HEADER, header[0] if header else ''))
+        if len(header) < 2:
+            raise ValidationError(
+                'The header must contain at least one sequence ID after %s.'
+                % self.HEADER)
+        seq_ids = header[1:]
+        if '' in seq_ids or len(set(seq_ids)) != len(seq_ids):
+            raise ValidationError(
+                'Sequence IDs in the header must be non-empty and unique.')
+
+    def _invalid_position(self, header, text, line_starts, line, offset,
+                          first_line):
+        start = line_starts[line]
+        col = text.count(b',', start, offset)
+        comma = text.rfind(b',', start, offset)
+        field_start = start if comma < 0 else comma + 1
+        field_end = min(i for i in (text.find(b',', offset),
+                                    text.find(b'\n', offset)) if i >= 0)
+        raise ValidationError(
+            'Expected positions to be non-negative integers%s. Found "%s" in '
+            'column %s on line %s.' % (
+                '' if col == 0 else ' or empty',
+                text[field_start:field_end].decode('utf-8', 'replace'),
+                header[col], first_line + line))
+
+    def _check_chunk(self, header, text, first_line, last_positions):
+        # Only digits, commas and newlines can appear after the header, so
+        # the chunk is checked byte-wise and then handed to pandas' C parser
+        # knowing it holds nothing but integers and empty cells.
+        data = np.frombuffer(text, dtype=np.uint8)
+        is_newline = data == ord('\n')
+        is_comma = data == ord(',')
+        line_ends = np.flatnonzero(is_newline)
+        line_starts = np.concatenate([[0], line_ends[:-1] + 1])
+
+        # field counts first, so that invalid values can be named by their
+        # column
+        n_commas = np.diff(
+            np.concatenate([[0], np.cumsum(is_comma)[line_ends]]))
+        wrong_len = np.flatnonzero(n_commas != len(header) - 1)
+        if wrong_len.size:
+            line = int(wrong_len[0])
+            raise ValidationError(
+                'Number of values on line %s are not the same as number of '
+                'header values. Found %s values, expected %s.' % (
+                    first_line + line, n_commas[line] + 1, len(header)))
+
+        invalid = ~(is_newline | is_comma |
+                    ((data >= ord('0')) & (data <= ord('9'))))
+        if invalid.any():
+            offset = int(np.argmax(invalid))
+            line = int(np.searchsorted(line_ends, offset))
+            self._invalid_position(
+                header, text, line_starts, line, offset, first_line)
+
+        values = pd.read_csv(
+            io.BytesIO(text), header=None, dtype=np.float64,
+            skip_blank_lines=False).to_numpy()
+
+        # alignment positions are required, sequence positions are missing
+        # where the sequence has a gap
+        missing = np.isnan(values[:, 0])
+        if missing.any():
+            line = int(np.argmax(missing))
+            self._invalid_position(
+                header, text, line_starts, line, line_starts[line],
+                first_line)
+
+        # positions within each sequence may repeat or skip gaps, but never
+        # go back
+        positions = np.nan_to_num(values[:, 1:], nan=-1)
+        previous = np.maximum.accumulate(
+            np.vstack([last_positions, positions]), axis=0)
+        decreasing = positions < previous[:-1]
+        decreasing &= ~np.isnan(values[:, 1:])
+        if decreasing.any():
+            row, col = np.argwhere(decreasing)[0]
+            raise ValidationError(
+                'Positions of sequence %s must not decrease. Found %d after '
+                '%d on line %s.' % (header[col + 1], positions[row, col],
+                                    previous[row, col], first_line + row))
+        return previous[-1]
+
     def _validate_(self, level):
-        # n_records = {'min': 10, 'max': None}[level]
-        with self.open():
-            # # validate header
-            # # for now we will not validate any information in the header.
-            # line = fh.readline()
-            #
-            # # validate body
-            # has_data = False
-            # for line_number, line in enumerate(fh, start=2):
-            #     cells = line.strip().split(',')
-            #     _validate_record_min_len(cells, line_number, 2)
-            #     for cell in cells[1:]:
-            #         try:
-            #             float(cell)
-            #         except ValueError:
-            #             raise ValidationError(
-            #                 "Expected data to be comprised of float values. "
-            #                 "Found non-float value {0} at line {1}"
-            #                 .format(cell, line_number))
-            #     has_data = True
-            #     if n_records is not None and (line_number - 1) >= n_records:
-            #         break
-            has_data = True
-            _validate_file_not_empty(has_data)
+        n_records = {'min': 10, 'max': None}[level]
+        with self.path.open('rb') as fh:
+            header_line = fh.readline().decode('utf-8')
+            header = next(csv.reader([header_line]), None)
+            _validate_file_not_empty(bool(header))
+            self._check_header(header)
+
+            last_positions = np.full(len(header) - 1, -1, dtype=np.float64)
+            first_line, n_rows = 2, 0
+            while n_records is None or n_rows < n_records:
+                lines = fh.readlines(self.CHUNK_BYTES)
+                if not lines:
+                    break
+                if n_records is not None:
+                    lines = lines[:n_records - n_rows]
+                text = b''.join(lines).replace(b'\r\n', b'\n')
+                if not text.endswith(b'\n'):
+                    text += b'\n'
+
+                last_positions = self._check_chunk(
+                    header, text, first_line, last_positions)
+                first_line += len(lines)
+                n_rows += len(lines)
+
+            _validate_file_not_empty(n_rows > 0)
 
 
 PositionMappingDirectoryFormat = model.SingleFileDirectoryFormat(
     'PositionMappingDirectoryFormat', 'position-mapping.csv',
     PositionMappingFormat)
+
+
+class OccurrenceCountsFormat(_PositionTableFormat):
+    HEADER = ['Position'] + list(ALPHABET)
+
+    def _check_values(self, values, line_number):
+        if not all(x.isdigit() for x in values):
+            raise ValidationError(
+                'Occurrence counts on line %s must be non-negative '
+                'integers.' % line_number)
+
+
+class PositionProfileFormat(_PositionTableFormat):
+    # (weighted) occurrence counts or frequencies of every symbol at every
+    # position
+    HEADER = ['Position'] + list(ALPHABET)
+
+    def _check_values(self, values, line_number):
+        if not _non_negative_numbers(values):
+            raise ValidationError(
+                'Occurrences on line %s must be non-negative numbers.'
+                % line_number)
+
+
+PositionProfileDirectoryFormat = model.SingleFileDirectoryFormat(
+    'PositionProfileDirectoryFormat', 'position-profile.csv',
+    PositionProfileFormat)
+
+
+class RankingStateDirectoryFormat(model.DirectoryFormat):
+    ranks = model.File('ranked-protein-alignment.tsv',
+                       format=RankedProteinAlignmentFormat)
+    occurrences = model.File('occurrence-counts.csv',
+                             format=OccurrenceCountsFormat)
+
+
+class PCAModelFormat(model.BinaryFileFormat):
+    # numpy .npz archive; symbol_ranks is optional
+    MEMBERS = {'positions': 1, 'mean': 1, 'components': 2, 'variance': 1,
+               'variance_ratio': 1}
+
+    def _member_headers(self):
+        # shape and dtype of every member from its .npy header, so that no
+        # array data are read
+        headers = {}
+        with zipfile.ZipFile(str(self)) as archive:
+            for info in archive.infolist():
+                with archive.open(info) as member:
+                    version = np.lib.format.read_magic(member)
+                    if version not in _NPY_HEADER_READERS:
+                        raise ValueError(
+                            'unsupported .npy format version %s.%s' % version)
+                    shape, _, dtype = _NPY_HEADER_READERS[version](member)
+                headers[info.filename[:-len('.npy')]] = shape, dtype
+        return headers
+
+    def _validate_(self, level):
+        if not zipfile.is_zipfile(str(self)):
+            raise ValidationError(
+                'The PCA model must be a numpy .npz archive.')
+        try:
+            headers = self._member_headers()
+        except (OSError, ValueError, zipfile.BadZipFile) as e:
+            raise ValidationError(
+                'The PCA model is not a valid numpy .npz archive: %s' % e)
+
+        missing = set(self.MEMBERS) - set(headers)
+        if missing:
+            raise ValidationError(
+                'The PCA model is missing %s.' % ', '.join(sorted(missing)))
+        if level == 'min':
+            return
+
+        shapes = {name: shape for name, (shape, _) in headers.items()}
+        for name, (shape, dtype) in headers.items():
+            if dtype.hasobject:
+                raise ValidationError(
+                    'The PCA model %s must not hold Python objects.' % name)
+        for name, ndim in self.MEMBERS.items():
+            if len(shapes[name]) != ndim:
+                raise ValidationError(
+                    'The PCA model %s must have %s dimension(s), found %s.'
+                    % (name, ndim, len(shapes[name])))
+
+        n_positions = shapes['positions'][0]
+        n_components = shapes['variance'][0]
+        if shapes['components'] != (n_components, n_positions):
+            raise ValidationError(
+                'The PCA model components of shape %s do not match %s '
+                'positions and %s components.' % (
+                    shapes['components'], n_positions, n_components))
+
+
+PCAModelDirectoryFormat = model.SingleFileDirectoryFormat(
+    'PCAModelDirectoryFormat', 'pca-model.npz', PCAModelFormat)
+
+
+class LoadingIntervalsFormat(model.TextFileFormat):
+    # lower and upper bound of the loadings of every position on each
+    # principal component, e.g. "PC1 lower,PC1 upper,PC2 lower,..."
+    HEADER = 'Position'
+
+    def _check_header(self, header):
+        if not header or header[0] != self.HEADER:
+            raise ValidationError(
+                '%s must be the first header value.' % self.HEADER)
+        n_components = (len(header) - 1) // 2
+        expected = [f'PC{i + 1} {bound}' for i in range(n_components)
+                    for bound in ('lower', 'upper')]
+        if n_components == 0 or header[1:] != expected:
+            raise ValidationError(
+                'The header must list the lower and upper bound of each '
+                'principal component in order (%s). Found: %s.' % (
+                    ','.join(expected or ['PC1 lower', 'PC1 upper']),
+                    ','.join(header[1:])))
+
+    def _validate_(self, level):
+        n_records = {'min': 10, 'max': None}[level]
+        with self.open() as fh:
+            header = next(csv.reader(fh), None)
+            _validate_file_not_empty(bool(header))
+            self._check_header(header)
+            try:
+                bounds = pd.read_csv(
+                    fh, header=None, names=header, index_col=0,
+                    nrows=n_records,
+                    dtype={name: np.float64 for name in header[1:]})
+            except ValueError as e:
+                raise ValidationError(
+                    'Could not parse the loading intervals: %s' % e)
+
+        _validate_file_not_empty(len(bounds) > 0)
+        if bounds.shape[1] != len(header) - 1 or \
+                bounds.isna().any(axis=None):
+            raise ValidationError(
+                'Every position needs exactly %s bounds.' % (len(header) - 1))
+        if (bounds.iloc[:, ::2].to_numpy() >
+                bounds.iloc[:, 1::2].to_numpy()).any():
+            raise ValidationError(
+                'Lower bounds must not exceed the upper bounds.')
+
+
+LoadingIntervalsDirectoryFormat = model.SingleFileDirectoryFormat(
+    'LoadingIntervalsDirectoryFormat', 'loading-intervals.csv',
+    LoadingIntervalsFormat)
+
+
+class PositionScoresFormat(_PositionTableFormat):
+    # Shannon entropy (bits) and gap-aware conservation of every position
+    HEADER = ['Position'] + SCORE_COLUMNS
+
+    def _check_values(self, values, line_number):
+        if not _non_negative_numbers(values):
+            raise ValidationError(
+                'Scores on line %s must be non-negative numbers.'
+                % line_number)
+
+
+PositionScoresDirectoryFormat = model.SingleFileDirectoryFormat(
+    'PositionScoresDirectoryFormat', 'position-scores.csv',
+    PositionScoresFormat)
+
+
+class AlignmentFilterReportFormat(model.TextFileFormat):
+    # sequences and positions removed by filter-alignment, with their gap
+    # fractions, identified as <kind>:<name>; a report of an alignment
+    # nothing was removed from only has the header
+    HEADER = ['ID', 'Kind', 'Gap fraction']
+    KINDS = ('sequence', 'position')
+
+    def _check_n_records(self, n=None):
+        with self.open() as fh:
+            reader = csv.reader(fh, delimiter=',')
+            header = next(reader, None)
+            if header != self.HEADER:
+                raise ValidationError(
+                    'The header must be %s. Found: %s.' % (
+                        ','.join(self.HEADER), ','.join(header or [])))
+
+            for i, line in islice(enumerate(reader, start=2), n):
+                if len(line) != len(self.HEADER):
+                    raise ValidationError(
+                        'Number of values on line %s are not the same as '
+                        'number of header values. Found %s values, expected '
+                        '%s.' % (i, len(line), len(self.HEADER)))
+                if line[1] not in self.KINDS:
+                    raise ValidationError(
+                        'Removed items on line %s must be a sequence or a '
+                        'position. Found: %s.' % (i, line[1]))
+                if not line[0].startswith(line[1] + ':'):
+                    raise ValidationError(
+                        'The ID on line %s must start with "%s:". Found: %s.'
+                        % (i, line[1], line[0]))
+                try:
+                    fraction = float(line[2])
+                except ValueError:
+                    fraction = np.nan
+                if not 0 <= fraction <= 1:
+                    raise ValidationError(
+                        'The gap fraction on line %s must be a number '
+                        'between 0 and 1. Found: %s.' % (i, line[2]))
+
+    def _validate_(self, level):
+        self._check_n_records(n={'min': 5, 'max': None}[level])
+
+
+AlignmentFilterReportDirectoryFormat = model.SingleFileDirectoryFormat(
+    'AlignmentFilterReportDirectoryFormat', 'alignment-filter-report.csv',
+    AlignmentFilterReportFormat)
@@ -0,0 +1,25 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import functools
+import importlib
+
+
+def lazy(module):
+    # Replaces the decorated stub with a shim that imports `module` (relative
+    # to this package) on first call and forwards to the function of the same
+    # name defined there. The stub's signature and annotations are kept, so
+    # QIIME 2 can register the shim without importing the implementation.
+    def decorator(stub):
+        @functools.wraps(stub)
+        def shim(*args, **kwargs):
+            impl = getattr(
+                importlib.import_module(module, __package__), stub.__name__)
+            return impl(*args, **kwargs)
+        return shim
+    return decorator
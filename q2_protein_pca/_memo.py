@@ -0,0 +1,216 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ._rank_matrix import OccurrenceRanks, RankMatrix
+
+# part of every key; bump it whenever a memoized function changes its
+# results, so that stale entries on disk are no longer found
+CACHE_VERSION = 1
+
+# Results are kept pickled, both in memory and on disk, so a hit always
+# returns a fresh object that callers are free to modify. Memoization is off
+# until enable_cache() is called.
+_cache = {'enabled': False, 'memory': OrderedDict(), 'memory_size': 0,
+          'memory_bytes': 0, 'directory': None, 'disk_bytes': 0}
+
+
+def enable_cache(directory: str = None, memory_bytes: int = 2 ** 28,
+                 disk_bytes: int = 2 ** 32):
+    # Memoizes ranking and PCA results: up to `memory_bytes` of them in
+    # this process and, if a directory is given, up to `disk_bytes` in it,
+    # evicting the least recently used first.
+    if directory is not None:
+        directory = os.path.expanduser(directory)
+        os.makedirs(directory, exist_ok=True)
+    _cache.update(enabled=True, memory_bytes=memory_bytes,
+                  directory=directory, disk_bytes=disk_bytes)
+    _evict_memory()
+
+
+def disable_cache():
+    _cache.update(enabled=False, directory=None)
+    _cache['memory'].clear()
+    _cache['memory_size'] = 0
+
+
+def clear_cache():
+    # drops every memoized result, including those on disk
+    _cache['memory'].clear()
+    _cache['memory_size'] = 0
+    for fp in _disk_entries():
+        os.remove(fp)
+
+
+def _update_digest(digest, value):
+    # feeds the type and content of `value` to `digest`; raises TypeError
+    # for values whose content cannot be digested
+    digest.update(type(value).__name__.encode())
+    if value is None or isinstance(
+            value, (bool, int, float, str, bytes, np.generic)):
+        digest.update(repr(value).encode())
+    elif isinstance(value, np.ndarray):
+        digest.update(repr(value.shape).encode())
+        if value.dtype == object:
+            digest.update(pd.util.hash_array(value.ravel()).tobytes())
+        else:
+            digest.update(value.dtype.str.encode())
+            digest.update(np.ascontiguousarray(value).data)
+    elif isinstance(value, (pd.DataFrame, pd.Series)):
+        names = value.columns if isinstance(value, pd.DataFrame) \
+            else [value.name]
+        _update_digest(digest, np.asarray(names, dtype=object))
+        _update_digest(digest, np.asarray(
+            value.dtypes if isinstance(value, pd.DataFrame)
+            else [value.dtype], dtype=str))
+        _update_digest(digest, np.asarray(value.index, dtype=object))
+        if (np.asarray(value.dtypes) == object).any():
+            _update_digest(
+                digest, pd.util.hash_pandas_object(value).to_numpy())
+        else:
+            _update_digest(digest, value.to_numpy())
+    elif isinstance(value, RankMatrix):
+        for array in (value.ids, value.positions, value.ranks):
+            _update_digest(digest, array)
+    elif isinstance(value, OccurrenceRanks):
+        _update_digest(digest, value.matrix)
+        _update_digest(digest, value.counts)
+    elif isinstance(value, (list, tuple)):
+        digest.update(repr(len(value)).encode())
+        for item in value:
+            _update_digest(digest, item)
+    else:
+        raise TypeError('Cannot digest values of type %s.' % type(value))
+
+
+def _key(function, arguments: dict) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    _update_digest(digest, (CACHE_VERSION, function.__module__,
+                            function.__qualname__))
+    for name, value in arguments.items():
+        _update_digest(digest, (name, value))
+    return digest.hexdigest()
+
+
+def _evict_memory():
+    memory = _cache['memory']
+    while memory and _cache['memory_size'] > _cache['memory_bytes']:
+        _, data = memory.popitem(last=False)
+        _cache['memory_size'] -= len(data)
+
+
+def _remember(key: str, data: bytes):
+    if len(data) <= _cache['memory_bytes']:
+        _cache['memory'][key] = data
+        _cache['memory_size'] += len(data)
+        _evict_memory()
+
+
+def _disk_entries():
+    directory = _cache['directory']
+    if directory is None:
+        return []
+    return [os.path.join(directory, name) for name in os.listdir(directory)
+            if name.endswith('.pickle')]
+
+
+def _touch(fp: str):
+    # the modification time orders entries for eviction; set explicitly as
+    # the file system's own timestamps can be too coarse to tell them apart
+    now = time.time_ns()
+    os.utime(fp, ns=(now, now))
+
+
+def _read_disk(key: str):
+    if _cache['directory'] is None:
+        return None
+    fp = os.path.join(_cache['directory'], key + '.pickle')
+    try:
+        with open(fp, 'rb') as fh:
+            data = fh.read()
+        _touch(fp)
+    except FileNotFoundError:
+        return None
+    return data
+
+
+def _write_disk(key: str, data: bytes):
+    directory = _cache['directory']
+    if directory is None or len(data) > _cache['disk_bytes']:
+        return
+    # written to a temporary file first so that readers (possibly in
+    # other processes) never see a partial entry
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(data)
+    fp = os.path.join(directory, key + '.pickle')
+    os.replace(tmp, fp)
+    _touch(fp)
+
+    entries = []
+    for fp in _disk_entries():
+        try:
+            stat = os.stat(fp)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, fp))
+    size = sum(entry[1] for entry in entries)
+    for _, entry_size, fp in sorted(entries):
+        if size <= _cache['disk_bytes']:
+            break
+        try:
+            os.remove(fp)
+        except FileNotFoundError:
+            pass
+        size -= entry_size
+
+
+def memoize(function):
+    # Returns the result of an earlier call of `function` with arguments of
+    # the same content, if it is still cached. Calls with arguments that
+    # cannot be digested are never memoized.
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _cache['enabled']:
+            return function(*args, **kwargs)
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        try:
+            key = _key(function, arguments.arguments)
+        except TypeError:
+            return function(*args, **kwargs)
+
+        memory = _cache['memory']
+        if key in memory:
+            memory.move_to_end(key)
+            return pickle.loads(memory[key])
+        data = _read_disk(key)
+        if data is not None:
+            _remember(key, data)
+            return pickle.loads(data)
+
+        result = function(*args, **kwargs)
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        _remember(key, data)
+        _write_disk(key, data)
+        return result
+
+    return wrapper
@@ -8,33 +8,177 @@
 
 import numpy as np
 import pandas as pd
+from q2_types.feature_data._transformer import AlignedProteinIterator
+from scipy.linalg import eigh
 from skbio import OrdinationResults
-from sklearn.decomposition import PCA
 
+from ._memo import memoize
+from ._pca_model import FittedPCA
+from ._rank_matrix import OccurrenceRanks, RankMatrix, _deduplicate_rows
+from ._ranking import (
+    _apply_symbol_ranks, _df_from_sequences, _encode_alignment,
+    _symbol_ranks)
 
-def _pca(ranks_df: pd.DataFrame,
-         n_components: int = None) -> (OrdinationResults, OrdinationResults):
-    # perform PCA
-    pca_result = PCA(n_components=n_components)
-    pca_result.fit(ranks_df)
+# number of matrix cells centred and multiplied at a time
+PCA_BLOCK_CELLS = 2 ** 22
 
-    # transform ranks
-    ranks_transformed = pd.DataFrame(pca_result.transform(ranks_df))
-    ranks_transformed.index = ranks_df.index
 
-    components_loadings = pd.DataFrame(-1 * pca_result.components_.T *
-                                       np.sqrt(pca_result.explained_variance_))
-    components_loadings.index = ranks_df.columns
-    eigenvalues = pd.Series(pca_result.explained_variance_)
+def _blocks(n_items: int, item_size: int):
+    # slices over n_items of item_size cells each, PCA_BLOCK_CELLS at a time
+    step = max(1, PCA_BLOCK_CELLS // max(item_size, 1))
+    return [slice(start, start + step) for start in range(0, n_items, step)]
 
-    ores_scores = OrdinationResults(
+
+def _top_eigenpairs(matrix: np.ndarray, k: int):
+    # eigenvalues in descending order, eigenvectors as columns
+    size = matrix.shape[0]
+    k = min(k, size)
+    values, vectors = eigh(matrix, subset_by_index=[size - k, size - 1])
+    return np.clip(values[::-1], 0, None), vectors[:, ::-1]
+
+
+def _eigen_pca(data: np.ndarray, weights: np.ndarray = None,
+               n_components: int = None):
+    # PCA of `data` (in which row i stands for weights[i] identical rows,
+    # possibly none) through the eigendecomposition of the smaller of the
+    # column covariance and the row Gram matrix. Both are accumulated
+    # block-wise from the raw ranks, so the data are never centred or copied
+    # as a whole, and the scores fall out of the decomposition.
+    n_rows, n_cols = data.shape
+    weights = np.ones(n_rows) if weights is None \
+        else np.asarray(weights, dtype=np.float64)
+    n_samples = weights.sum()
+    max_components = int(min(n_samples, n_cols))
+    if n_components is None:
+        n_components = max_components
+    elif not 1 <= n_components <= max_components:
+        raise ValueError(
+            'n_components=%s must be between 1 and min(n_samples, '
+            'n_features)=%s.' % (n_components, max_components))
+
+    mean = sum(weights[rows] @ data[rows] for rows in _blocks(n_rows, n_cols))
+    mean /= n_samples
+
+    if n_rows >= n_cols:
+        # covariance of the columns
+        covariance = np.zeros((n_cols, n_cols))
+        for rows in _blocks(n_rows, n_cols):
+            block = data[rows] - mean
+            covariance += block.T @ (block * weights[rows, np.newaxis])
+        covariance /= n_samples - 1
+        total_variance = np.trace(covariance)
+
+        variance, components = _top_eigenpairs(covariance, n_components)
+        scores = np.vstack([(data[rows] - mean) @ components
+                            for rows in _blocks(n_rows, n_cols)])
+    else:
+        # Gram matrix of the weighted rows; its eigenvectors are the left
+        # singular vectors of the data
+        scale = np.sqrt(weights)[:, np.newaxis]
+        gram = np.zeros((n_rows, n_rows))
+        for cols in _blocks(n_cols, n_rows):
+            block = (data[:, cols] - mean[cols]) * scale
+            gram += block @ block.T
+        gram /= n_samples - 1
+        total_variance = np.trace(gram)
+
+        # rows of zero weight add nothing but null eigenpairs to the Gram
+        # matrix
+        weighted = weights > 0
+        variance, left = _top_eigenpairs(
+            gram, min(n_components, np.count_nonzero(weighted)))
+        singular = np.sqrt(variance * (n_samples - 1))
+        left_scaled = np.divide(
+            left, singular, out=np.zeros_like(left), where=singular > 0)
+        components = np.vstack([
+            ((data[:, cols] - mean[cols]) * scale).T @ left_scaled
+            for cols in _blocks(n_cols, n_rows)])
+        scores = np.divide(left * singular, scale, out=np.zeros_like(left),
+                           where=scale > 0)
+        # and are projected like new rows
+        unweighted = np.flatnonzero(~weighted)
+        if len(unweighted):
+            scores[unweighted] = sum(
+                (data[unweighted, cols] - mean[cols]) @ components[cols]
+                for cols in _blocks(n_cols, len(unweighted)))
+
+    # components beyond the number of distinct rows carry no variance
+    padding = n_components - len(variance)
+    if padding > 0:
+        variance = np.concatenate([variance, np.zeros(padding)])
+        components = np.hstack([components, np.zeros((n_cols, padding))])
+        scores = np.hstack([scores, np.zeros((n_rows, padding))])
+
+    # sklearn's svd_flip convention: the largest absolute score of each
+    # component among the weighted rows is positive
+    weighted_scores = scores[weights > 0]
+    signs = np.sign(weighted_scores[
+        np.argmax(np.abs(weighted_scores), axis=0), range(n_components)])
+    signs[signs == 0] = 1
+    components *= signs
+    scores *= signs
+
+    return (components.T, variance, variance / total_variance, scores, mean)
+
+
+def _fit_pca(ranks: np.ndarray, n_components: int = None,
+             deduplicate: bool = False):
+    # (components, variance, variance ratio, scores, mean) as in _eigen_pca
+    if deduplicate:
+        # identical sequences are analysed once, weighted by multiplicity
+        unique, inverse, counts = _deduplicate_rows(ranks)
+        components, variance, variance_ratio, scores, mean = _eigen_pca(
+            unique, counts, n_components)
+        return components, variance, variance_ratio, scores[inverse], mean
+    return _eigen_pca(ranks, n_components=n_components)
+
+
+def _scores(ids, scores: np.ndarray, variance: np.ndarray,
+            variance_ratio: np.ndarray) -> OrdinationResults:
+    ranks_transformed = pd.DataFrame(scores)
+    ranks_transformed.index = pd.Index(ids, name=RankMatrix.index_name)
+
+    return OrdinationResults(
         short_method_name="PCA",
         long_method_name="Principal Components Analysis",
-        eigvals=eigenvalues,
+        eigvals=pd.Series(variance),
         samples=ranks_transformed,
         features=None,
         biplot_scores=None,
-        proportion_explained=pd.Series(pca_result.explained_variance_ratio_))
+        proportion_explained=pd.Series(variance_ratio))
+
+
+@memoize
+def _pca(ranks: RankMatrix, n_components: int = None,
+         deduplicate: bool = False, ranking_state: OccurrenceRanks = None
+         ) -> (OrdinationResults, OrdinationResults, FittedPCA):
+    if isinstance(ranks, pd.DataFrame):
+        ranks = RankMatrix.from_dataframe(ranks)
+
+    symbol_ranks = None
+    if ranking_state is not None:
+        # the symbol ranks are only those of the ranked alignment if the
+        # state holds exactly its sequences, positions and ranks
+        state = ranking_state.matrix
+        if not (np.array_equal(state.positions, ranks.positions) and
+                np.array_equal(state.ids, ranks.ids) and
+                np.array_equal(state.ranks, ranks.ranks)):
+            raise ValueError(
+                'The ranking state does not have the same sequences, '
+                'positions and ranks as the ranked alignment.')
+        symbol_ranks = _symbol_ranks(ranking_state.counts)
+
+    components, variance, variance_ratio, scores, mean = _fit_pca(
+        ranks.ranks, n_components, deduplicate)
+
+    model = FittedPCA(ranks.positions, mean, components, variance,
+                      variance_ratio, symbol_ranks)
+
+    components_loadings = pd.DataFrame(-1 * components.T * np.sqrt(variance))
+    components_loadings.index = pd.Index(ranks.positions)
+    eigenvalues = pd.Series(variance)
+
+    ores_scores = _scores(ranks.ids, scores, variance, variance_ratio)
 
     ores_loadings = OrdinationResults(
         short_method_name="PCA",
@@ -43,11 +187,39 @@ def _pca(ranks_df: pd.DataFrame,
         samples=components_loadings,
         features=None,
         biplot_scores=None,
-        proportion_explained=pd.Series(pca_result.explained_variance_ratio_))
+        proportion_explained=pd.Series(variance_ratio))
+
+    return ores_scores, ores_loadings, model
+
+
+def _project(model: FittedPCA, alignment_df: pd.DataFrame) -> np.ndarray:
+    if model.symbol_ranks is None:
+        raise ValueError(
+            'The PCA model does not record how the reference alignment was '
+            'ranked. Run pca with a ranking state to project new sequences.')
+    if alignment_df.shape[1] != len(model.positions):
+        raise ValueError(
+            'The new sequences are aligned to %s positions, but the PCA was '
+            'fitted to %s.' % (alignment_df.shape[1], len(model.positions)))
+
+    # ranked by the reference frequencies; residues never seen at a position
+    # in the reference rank like gaps
+    ranks = _apply_symbol_ranks(
+        _encode_alignment(alignment_df), model.symbol_ranks)
+    return model.transform(ranks)
+
 
-    return ores_scores, ores_loadings
+def pca(ranks: RankMatrix,
+        n_components: int = None,
+        deduplicate: bool = False,
+        ranking_state: OccurrenceRanks = None
+        ) -> (OrdinationResults, OrdinationResults, FittedPCA):
+    return _pca(ranks, n_components, deduplicate, ranking_state)
 
 
-def pca(ranks: pd.DataFrame,
-        n_components: int = None) -> (OrdinationResults, OrdinationResults):
-    return _pca(ranks, n_components)
+def project(pca_model: FittedPCA,
+            sequences: AlignedProteinIterator) -> OrdinationResults:
+    alignment_df = _df_from_sequences(sequences)
+    scores = _project(pca_model, alignment_df)
+    return _scores(alignment_df.index, scores, pca_model.variance,
+                   pca_model.variance_ratio)
@@ -0,0 +1,106 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import mmap
+import struct
+import zipfile
+
+import numpy as np
+
+from ._rank_matrix import ALPHABET
+
+_NPY_HEADER_READERS = {(1, 0): np.lib.format.read_array_header_1_0,
+                       (2, 0): np.lib.format.read_array_header_2_0}
+
+
+def _map_npz(path: str) -> dict:
+    # Arrays of an .npz archive as read-only views on a single memory map of
+    # the file, so opening a model is cheap and its arrays are only read from
+    # disk as they are used. Compressed members cannot be mapped and are
+    # read as usual.
+    arrays = {}
+    with open(path, 'rb') as fh, zipfile.ZipFile(fh) as archive:
+        buffer = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(
+                        member, allow_pickle=False)
+                continue
+
+            # the member's data follow its local file header
+            start = info.header_offset
+            name_len, extra_len = struct.unpack(
+                '<HH', buffer[start + 26:start + 30])
+            fh.seek(start + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(fh)
+            if version not in _NPY_HEADER_READERS:
+                fh.seek(start + 30 + name_len + extra_len)
+                arrays[name] = np.lib.format.read_array(
+                    fh, allow_pickle=False)
+                continue
+            shape, fortran_order, dtype = _NPY_HEADER_READERS[version](fh)
+            if dtype.hasobject:
+                raise ValueError('Object arrays cannot be memory-mapped.')
+
+            array = np.frombuffer(buffer, dtype=dtype,
+                                  count=int(np.prod(shape)),
+                                  offset=fh.tell())
+            arrays[name] = array.reshape(
+                shape, order='F' if fortran_order else 'C')
+    return arrays
+
+
+class FittedPCA:
+    # A PCA fitted to ranked alignment positions: the mean ranks, the
+    # (components x positions) principal axes and the variance they explain.
+    # symbol_ranks, when known, holds the (positions x symbols) rank of every
+    # symbol in the reference alignment, so that new sequences can be ranked
+    # the same way before they are projected.
+
+    def __init__(self, positions, mean, components, variance,
+                 variance_ratio, symbol_ranks=None):
+        self.positions = np.asarray(positions, dtype=str)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.components = np.asarray(components, dtype=np.float64)
+        self.variance = np.asarray(variance, dtype=np.float64)
+        self.variance_ratio = np.asarray(variance_ratio, dtype=np.float64)
+        self.symbol_ranks = None if symbol_ranks is None \
+            else np.asarray(symbol_ranks, dtype=np.uint8)
+
+        n_positions = len(self.positions)
+        n_components = len(self.variance)
+        expected = {
+            'mean': (n_positions,),
+            'components': (n_components, n_positions),
+            'variance_ratio': (n_components,)}
+        if self.symbol_ranks is not None:
+            expected['symbol_ranks'] = (n_positions, len(ALPHABET))
+        for name, shape in expected.items():
+            if getattr(self, name).shape != shape:
+                raise ValueError(
+                    'PCA %s of shape %s do not match %s positions and %s '
+                    'components.' % (name, getattr(self, name).shape,
+                                     n_positions, n_components))
+
+    @property
+    def n_components(self):
+        return len(self.variance)
+
+    def transform(self, ranks: np.ndarray) -> np.ndarray:
+        # scores of (sequences x positions) ranks on the fitted axes
+        if ranks.shape[1] != len(self.positions):
+            raise ValueError(
+                'Ranks of %s positions cannot be projected onto a PCA of %s '
+                'positions.' % (ranks.shape[1], len(self.positions)))
+        return ranks @ self.components.T - self.mean @ self.components.T
+
+    def inverse_transform(self, scores: np.ndarray) -> np.ndarray:
+        # ranks approximated from scores on the fitted axes
+        return scores @ self.components + self.mean
@@ -6,27 +6,357 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import base64
+import gzip
+import hashlib
 import json
 import numpy as np
 import os
+import shutil
+import warnings
 from distutils.dir_util import copy_tree
 
 import pkg_resources
 import q2templates
+import qiime2
 from skbio import OrdinationResults
 import pandas as pd
 
 TEMPLATES = pkg_resources.resource_filename('q2_protein_pca', 'assets')
 
+# d3's category20 scheme
+CATEGORICAL_PALETTE = [
+    '#1f77b4', '#aec7e8', '#ff7f0e', '#ffbb78', '#2ca02c', '#98df8a',
+    '#d62728', '#ff9896', '#9467bd', '#c5b0d5', '#8c564b', '#c49c94',
+    '#e377c2', '#f7b6d2', '#7f7f7f', '#c7c7c7', '#bcbd22', '#dbdb8d',
+    '#17becf', '#9edae5']
+MISSING_CATEGORY = np.iinfo(np.uint16).max
+
+STRUCTURE_EXTENSIONS = {'.pdb': 'pdb', '.ent': 'pdb',
+                        '.cif': 'mmcif', '.mmcif': 'mmcif'}
+
 
 def _euclidean_distance(x, y):
     return np.sqrt(x**2 + y**2)
 
 
+def _structure_format(structure_fp: str) -> (str, str):
+    # returns the structure ID guessed from the file name and its format
+    name = os.path.basename(structure_fp).lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    stem, ext = os.path.splitext(name)
+    if ext not in STRUCTURE_EXTENSIONS:
+        raise ValueError(
+            'Unrecognized structure file extension: "%s". Supported '
+            'extensions are: %s (optionally gzipped).' % (
+                ext, ', '.join(STRUCTURE_EXTENSIONS)))
+    if ext == '.ent' and stem.startswith('pdb'):
+        stem = stem[3:]
+    return stem, STRUCTURE_EXTENSIONS[ext]
+
+
+def _find_cached_structure(cache_dir: str, pdb_id: str) -> str:
+    # look for the file names used by the PDB archive and by the RCSB/PDBe
+    # download services
+    pdb_id = pdb_id.lower()
+    candidates = [f'pdb{pdb_id}.ent', f'{pdb_id}.pdb', f'{pdb_id}.cif']
+    for candidate in candidates:
+        for name in (candidate, candidate.upper()):
+            for fp in (os.path.join(cache_dir, name),
+                       os.path.join(cache_dir, name + '.gz')):
+                if os.path.isfile(fp):
+                    return fp
+    return None
+
+
+def _structure_checksum(structure_fp: str) -> str:
+    # SHA-256 of the structure file as given; local files are plain paths,
+    # not artifacts, so this is all that records which structure was shown
+    sha256 = hashlib.sha256()
+    with open(structure_fp, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(2 ** 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _bundle_structure(output_dir: str, structure_fp: str) -> str:
+    # store a gzipped copy of the structure within the visualization
+    _, fmt = _structure_format(structure_fp)
+    name = 'structure.%s.gz' % ('pdb' if fmt == 'pdb' else 'cif')
+    with open(structure_fp, 'rb') as fh:
+        is_gzipped = fh.read(2) == b'\x1f\x8b'
+    if is_gzipped:
+        shutil.copyfile(structure_fp, os.path.join(output_dir, name))
+    else:
+        with open(structure_fp, 'rb') as fh_in, \
+                gzip.open(os.path.join(output_dir, name), 'wb') as fh_out:
+            shutil.copyfileobj(fh_in, fh_out)
+    return name
+
+
+def _encode_array(values, dtype: str) -> str:
+    # base64-encoded little-endian buffer, decoded into a typed array in JS
+    values = np.ascontiguousarray(values, dtype=np.dtype(dtype))
+    return base64.b64encode(values.tobytes()).decode('ascii')
+
+
+def _relative_distances(plot_values: pd.DataFrame) -> np.ndarray:
+    return (plot_values['euclid_dist'] /
+            plot_values['max_distance']).fillna(0).values
+
+
+def _conservation_index(
+        plot_values: pd.DataFrame) -> (np.ndarray, np.ndarray):
+    # positions sorted by their relative distance from the origin, so that
+    # the positions passing any conservation threshold form a prefix
+    rel_dist = _relative_distances(plot_values)
+    order = np.argsort(rel_dist, kind='stable')
+    return order, rel_dist[order]
+
+
+def _bin_loadings(plot_values: pd.DataFrame,
+                  x_col_name: str,
+                  y_col_name: str,
+                  n_bins: int) -> pd.DataFrame:
+    # aggregate positions into a 2D grid used for the zoomed-out view
+    x, y = plot_values[x_col_name].values, plot_values[y_col_name].values
+    rel_dist = _relative_distances(plot_values)
+    x_edges = np.histogram_bin_edges(x, bins=n_bins)
+    y_edges = np.histogram_bin_edges(y, bins=n_bins)
+    x_idx = np.clip(np.searchsorted(x_edges, x, side='right') - 1,
+                    0, n_bins - 1)
+    y_idx = np.clip(np.searchsorted(y_edges, y, side='right') - 1,
+                    0, n_bins - 1)
+
+    bins = pd.DataFrame({'bin': x_idx * n_bins + y_idx,
+                         'rel_dist': rel_dist})
+    bins = bins.groupby('bin')['rel_dist'].agg(['size', 'min'])
+    bins.columns = ['count', 'min_rel_dist']
+    x_idx, y_idx = np.divmod(bins.index.values, n_bins)
+    bins['x0'], bins['x1'] = x_edges[x_idx], x_edges[x_idx + 1]
+    bins['y0'], bins['y1'] = y_edges[y_idx], y_edges[y_idx + 1]
+    return bins.reset_index(drop=True)[
+        ['x0', 'x1', 'y0', 'y1', 'count', 'min_rel_dist']]
+
+
+def _add_component_selectors(spec: dict,
+                             components: list,
+                             x_col_name: str,
+                             y_col_name: str):
+    # the loadings of the selected components are swapped into the x/y
+    # fields by the page itself
+    for axis, component in zip(('x', 'y'), components[:2]):
+        spec['signals'].append({
+            'name': f'{axis}Component',
+            'description': f'{axis.upper()} axis',
+            'value': component,
+            'bind': {
+                'input': 'select',
+                'options': components,
+                'element': f'#{axis}-component-selector'
+            }
+        })
+    spec['axes'][0]['title'] = {'signal': 'xComponent'}
+    spec['axes'][1]['title'] = {'signal': 'yComponent'}
+    spec['marks'][0]['encode']['update']['tooltip'] = {
+        'signal': f"{{'title': 'position ' + datum['id'], "
+                  f"'components': xComponent + ' / ' + yComponent, "
+                  f"'{x_col_name}': datum['{x_col_name}'], "
+                  f"'{y_col_name}': datum['{y_col_name}']}}"}
+
+
+def _add_lod_to_spec(spec: dict,
+                     bins: pd.DataFrame,
+                     x_col_name: str,
+                     y_col_name: str,
+                     lod_threshold: int):
+    # Level-of-detail rendering: the plot can be zoomed and panned; while
+    # more than `lod_threshold` positions would be visible, the precomputed
+    # bins are drawn instead of individual points.
+    n_positions = len(spec['data'][0]['values'])
+    spec['data'][0]['transform'] = [
+        {'type': 'extent', 'field': x_col_name, 'signal': 'xext'},
+        {'type': 'extent', 'field': y_col_name, 'signal': 'yext'}]
+    spec['data'].extend([
+        {'name': 'visible',
+         'source': 'values',
+         'transform': [
+             {'type': 'filter',
+              'expr': f"!lodActive "
+                      f"&& inrange(datum['{x_col_name}'], xdom) "
+                      f"&& inrange(datum['{y_col_name}'], ydom)"}]},
+        {'name': 'bins',
+         'values': bins.to_dict(orient='records'),
+         'transform': [{'type': 'filter', 'expr': 'lodActive'}]}])
+
+    for scale, signal in zip(spec['scales'], ('xdom', 'ydom')):
+        scale['domain'] = {'signal': signal}
+        scale['zero'] = False
+
+    spec['signals'].extend([
+        {'name': 'lodThreshold', 'value': lod_threshold},
+        {'name': 'nPositions', 'value': n_positions},
+        {'name': 'maxBinCount', 'value': int(bins['count'].max())},
+        {'name': 'down', 'value': None,
+         'on': [{'events': 'touchend', 'update': 'null'},
+                {'events': 'mousedown, touchstart', 'update': 'xy()'}]},
+        {'name': 'xcur', 'value': None,
+         'on': [{'events': 'mousedown, touchstart, touchend',
+                 'update': 'slice(xdom)'}]},
+        {'name': 'ycur', 'value': None,
+         'on': [{'events': 'mousedown, touchstart, touchend',
+                 'update': 'slice(ydom)'}]},
+        {'name': 'delta', 'value': [0, 0],
+         'on': [{'events': [{'source': 'window', 'type': 'mousemove',
+                             'consume': True,
+                             'between': [{'type': 'mousedown'},
+                                         {'source': 'window',
+                                          'type': 'mouseup'}]},
+                            {'type': 'touchmove', 'consume': True,
+                             'filter': 'event.touches.length === 1'}],
+                 'update': 'down ? [down[0]-x(), y()-down[1]] : [0,0]'}]},
+        {'name': 'anchor', 'value': [0, 0],
+         'on': [{'events': 'wheel',
+                 'update': "[invert('xScale', x()), "
+                           "invert('yScale', y())]"}]},
+        {'name': 'zoom', 'value': 1,
+         'on': [{'events': 'wheel!', 'force': True,
+                 'update': 'pow(1.001, event.deltaY * '
+                           'pow(16, event.deltaMode))'}]},
+        {'name': 'xdom', 'update': 'slice(xext)',
+         'on': [{'events': {'signal': 'delta'},
+                 'update': '[xcur[0] + span(xcur) * delta[0] / width, '
+                           'xcur[1] + span(xcur) * delta[0] / width]'},
+                {'events': {'signal': 'zoom'},
+                 'update': '[anchor[0] + (xdom[0] - anchor[0]) * zoom, '
+                           'anchor[0] + (xdom[1] - anchor[0]) * zoom]'},
+                {'events': 'dblclick', 'update': 'slice(xext)'}]},
+        {'name': 'ydom', 'update': 'slice(yext)',
+         'on': [{'events': {'signal': 'delta'},
+                 'update': '[ycur[0] + span(ycur) * delta[1] / height, '
+                           'ycur[1] + span(ycur) * delta[1] / height]'},
+                {'events': {'signal': 'zoom'},
+                 'update': '[anchor[1] + (ydom[0] - anchor[1]) * zoom, '
+                           'anchor[1] + (ydom[1] - anchor[1]) * zoom]'},
+                {'events': 'dblclick', 'update': 'slice(yext)'}]},
+        # estimated number of positions within the current viewport
+        {'name': 'lodActive',
+         'update': 'nPositions * span(xdom) * span(ydom) / '
+                   'max(span(xext) * span(yext), 1e-12) > lodThreshold'}])
+
+    points = spec['marks'][0]
+    points['from'] = {'data': 'visible'}
+    points['clip'] = True
+    spec['marks'].insert(0, {
+        'type': 'rect',
+        'from': {'data': 'bins'},
+        'clip': True,
+        'encode': {
+            'update': {
+                'x': {'scale': 'xScale', 'field': 'x0'},
+                'x2': {'scale': 'xScale', 'field': 'x1'},
+                'y': {'scale': 'yScale', 'field': 'y0'},
+                'y2': {'scale': 'yScale', 'field': 'y1'},
+                'fill': [
+                    {'test': 'datum.min_rel_dist '
+                             '<= (1 - conservationLevel / 100)',
+                     'value': '#3182bd'},
+                    {'value': 'black'}],
+                'opacity': {
+                    'signal': '0.2 + 0.8 * log(datum.count + 1) / '
+                              'log(maxBinCount + 1)'},
+                'tooltip': {
+                    'signal': "{'positions': datum.count}"}},
+            'hover': {'fill': {'value': '#d62728'}}}})
+
+
+def _interval_bounds(intervals: pd.DataFrame,
+                     loadings: pd.DataFrame) -> np.ndarray:
+    # (lower/upper x components x positions) bounds of the loadings; NaN for
+    # components without intervals
+    if list(map(str, intervals.index)) != list(map(str, loadings.index)):
+        raise ValueError(
+            'The loading intervals must cover the same positions as the '
+            'loadings.')
+    bounds = np.full((2,) + loadings.T.shape, np.nan)
+    for i, component in enumerate(loadings.columns):
+        for j, bound in enumerate(('lower', 'upper')):
+            column = f'{component} {bound}'
+            if column in intervals.columns:
+                bounds[j, i] = intervals[column].values
+    return bounds
+
+
+def _add_interval_marks(spec: dict):
+    # error bars spanning the lower and upper bound of the loadings on the
+    # x and y axes, drawn under the points
+    points = spec['marks'][-1]
+    rules = [
+        {'x': {'scale': 'xScale', 'field': 'x_lower'},
+         'x2': {'scale': 'xScale', 'field': 'x_upper'},
+         'y': {'scale': 'yScale', 'field': 'y'}},
+        {'x': {'scale': 'xScale', 'field': 'x'},
+         'y': {'scale': 'yScale', 'field': 'y_lower'},
+         'y2': {'scale': 'yScale', 'field': 'y_upper'}}]
+    for rule, axis in zip(rules, ('x', 'y')):
+        rule['stroke'] = {'value': '#969696'}
+        rule['strokeOpacity'] = [
+            {'test': f'datum.{axis}_lower == null', 'value': 0.0},
+            {'value': 0.5}]
+        spec['marks'].insert(len(spec['marks']) - 1, {
+            'type': 'rule',
+            'from': points['from'],
+            'clip': True,
+            'encode': {'update': rule}})
+
+
+def _score_values(scores: pd.DataFrame,
+                  loadings: pd.DataFrame) -> pd.DataFrame:
+    if list(map(str, scores.index)) != list(map(str, loadings.index)):
+        raise ValueError(
+            'The position scores must cover the same positions as the '
+            'loadings.')
+    return scores.set_axis(loadings.index, axis=0)
+
+
+def _add_score_colouring(spec: dict, scores: pd.DataFrame):
+    # positions can be coloured by any of the scores instead of by the
+    # conservation level
+    points = spec['marks'][-1]
+    names = list(scores.columns)
+    spec['signals'].extend([
+        {'name': 'colourBy',
+         'value': 'Conservation level',
+         'bind': {'input': 'select',
+                  'options': ['Conservation level'] + names,
+                  'element': '#colour-by-selector'}},
+        {'name': 'scoreDomains',
+         'value': {name: [float(min(scores[name].min(), 0)),
+                          float(scores[name].max())] for name in names}}])
+    spec['scales'].append(
+        {'name': 'scoreColour',
+         'type': 'linear',
+         'domain': {'signal': 'scoreDomains[colourBy] || [0, 1]'},
+         'range': {'scheme': 'viridis'}})
+
+    update = points['encode']['update']
+    update['fill'].insert(
+        0, {'test': "colourBy != 'Conservation level'",
+            'scale': 'scoreColour', 'signal': 'datum[colourBy]'})
+    update['tooltip']['signal'] = update['tooltip']['signal'][:-1] + ''.join(
+        f", '{name}': datum['{name}']" for name in names) + '}'
+
+
 def _generate_spec(plot_values: pd.DataFrame,
                    x_col_name: str,
                    y_col_name: str,
-                   sequence_ids: list) -> dict:
+                   sequence_ids: list,
+                   bins: pd.DataFrame = None,
+                   lod_threshold: int = None,
+                   components: list = None,
+                   show_intervals: bool = False,
+                   scores: pd.DataFrame = None) -> dict:
     # replace NaNs
     plot_values = plot_values.replace({np.nan: None})
     # convert types to object (json.dumps cannot dump pandas' Int64)
@@ -88,10 +418,11 @@ def _generate_spec(plot_values: pd.DataFrame,
                  'hover': {
                      'fill': {'value': '#d62728'},
                      'opacity': {'value': 0.8}},
-                 'enter': {
-                     'x': {'scale': 'xScale', 'field': x_col_name},
-                     'y': {'scale': 'yScale', 'field': y_col_name}},
+                 # positions are encoded on update, as the components shown
+                 # and the zoomed scales change for existing points
                  'update': {
+                     'x': {'scale': 'xScale', 'field': x_col_name},
+                     'y': {'scale': 'yScale', 'field': y_col_name},
                      'fill': [
                          {
                              'test': "datum.euclid_dist / datum.max_distance "
@@ -112,6 +443,14 @@ def _generate_spec(plot_values: pd.DataFrame,
                                    f"'{x_col_name}': datum['{x_col_name}'], "
                                    f"'{y_col_name}': datum['{y_col_name}']}}"}
                  }}}]}
+    if components is not None:
+        _add_component_selectors(spec, components, x_col_name, y_col_name)
+    if bins is not None:
+        _add_lod_to_spec(spec, bins, x_col_name, y_col_name, lod_threshold)
+    if show_intervals:
+        _add_interval_marks(spec)
+    if scores is not None:
+        _add_score_colouring(spec, scores)
     return spec
 
 
@@ -120,42 +459,119 @@ def _plot_loadings(
         pca_loadings_df: pd.DataFrame,
         positions_mapping: pd.DataFrame,
         pdb_id: str,
-        nterm_offset: int):
+        nterm_offset: int,
+        lod_threshold: int = 5000,
+        lod_bins: int = 100,
+        renderer: str = 'canvas',
+        pdb_file: str = None,
+        pdb_cache_dir: str = None,
+        loading_intervals: pd.DataFrame = None,
+        position_scores: pd.DataFrame = None):
     context = dict()
 
+    if pdb_cache_dir and not pdb_file:
+        if not pdb_id:
+            raise ValueError(
+                'A PDB ID is required to look up a structure in the '
+                'structure cache directory.')
+        pdb_file = _find_cached_structure(pdb_cache_dir, pdb_id)
+        if pdb_file is None:
+            warnings.warn(
+                'Structure %s was not found in %s - it will be downloaded '
+                'from PDBe when the visualization is viewed.' % (
+                    pdb_id, pdb_cache_dir), UserWarning)
+
     # convert to 1-based indexing
     positions_mapping += 1
     context['position_data'] = positions_mapping.to_json(orient='records')
 
-    positions_mapping.index = pca_loadings_df.index
+    if pca_loadings_df.shape[1] < 2:
+        raise ValueError(
+            'At least two principal components are required to plot the '
+            'loadings. Found %s.' % pca_loadings_df.shape[1])
+    loadings = pca_loadings_df.copy()
+    loadings.columns = [f"PC{x+1}" for x in range(loadings.shape[1])]
+    loadings.index.name = 'id'
+    components = list(loadings.columns)
+    positions_mapping.index = loadings.index
 
-    plot_values = pca_loadings_df.iloc[:, :2]
-    plot_values.columns = [f"PC{x+1}" for x in plot_values.columns]
-    x_col, y_col = 'PC1', 'PC2'
+    # all retained components are written once, component-major, so that
+    # the page can switch between any pair of them
+    loadings.values.T.astype('<f4').tofile(
+        os.path.join(output_dir, 'loadings.bin'))
 
-    plot_values.index.name = 'id'
+    # the x/y fields hold the components currently selected on the page
+    x_col, y_col = 'x', 'y'
+    plot_values = loadings[components[:2]].copy()
+    plot_values.columns = [x_col, y_col]
 
     # calculate euclidean distances from (0,0) for each pair
-    plot_values['euclid_dist'] = plot_values.apply(
-        lambda x: _euclidean_distance(x[x_col], x[y_col]), axis=1)
+    plot_values['euclid_dist'] = _euclidean_distance(
+        plot_values[x_col], plot_values[y_col])
     plot_values['max_distance'] = plot_values['euclid_dist'].max()
 
-    plot_values = pd.concat([plot_values, positions_mapping], axis=1)
-    plot_values.to_csv(os.path.join(output_dir, 'data.tsv'),
-                       header=True, index=True, sep='\t')
+    # bootstrap intervals, stored like the loadings (lower bounds first);
+    # those of the selected components are swapped in by the page
+    interval_values = None
+    if loading_intervals is not None:
+        bounds = _interval_bounds(loading_intervals, loadings)
+        bounds.astype('<f4').tofile(
+            os.path.join(output_dir, 'intervals.bin'))
+        interval_values = pd.DataFrame(
+            {'x_lower': bounds[0, 0], 'x_upper': bounds[1, 0],
+             'y_lower': bounds[0, 1], 'y_upper': bounds[1, 1]},
+            index=loadings.index)
+        loading_intervals = loading_intervals.set_axis(
+            loadings.index, axis=0)
+
+    if position_scores is not None:
+        position_scores = _score_values(position_scores, loadings)
+
+    pd.concat([loadings, plot_values.iloc[:, 2:], positions_mapping,
+               loading_intervals, position_scores],
+              axis=1).to_csv(os.path.join(output_dir, 'data.tsv'),
+                             header=True, index=True, sep='\t')
+
+    plot_values = pd.concat([plot_values, positions_mapping, interval_values,
+                             position_scores], axis=1)
     plot_values = plot_values.reset_index(drop=False)
 
+    # switch to binned rendering for wide alignments
+    bins = None
+    if plot_values.shape[0] > lod_threshold:
+        bins = _bin_loadings(plot_values, x_col, y_col, lod_bins)
+
     spec = _generate_spec(
         plot_values=plot_values,
         x_col_name=x_col,
         y_col_name=y_col,
         sequence_ids=list(
-            positions_mapping.columns))
+            positions_mapping.columns),
+        bins=bins,
+        lod_threshold=lod_threshold,
+        components=components,
+        show_intervals=interval_values is not None,
+        scores=position_scores)
 
     context['vega_spec'] = json.dumps(spec)
+    context['has_intervals'] = json.dumps(interval_values is not None)
+    context['renderer'] = renderer
+    context['component_names'] = json.dumps(components)
+    context['lod_bins'] = lod_bins
+
+    order, rel_dist = _conservation_index(plot_values)
+    context['conservation_order'] = _encode_array(order, '<u4')
+    context['conservation_distances'] = _encode_array(rel_dist, '<f8')
     context['max_count'] = plot_values.shape[0]
-    context['max_distance'] = plot_values['euclid_dist'].max()
-    if pdb_id:
+    if pdb_file:
+        structure_id, structure_format = _structure_format(pdb_file)
+        context['pdb_id'] = pdb_id or structure_id
+        context['nterm_offset'] = nterm_offset
+        context['structure_file'] = _bundle_structure(output_dir, pdb_file)
+        context['structure_format'] = structure_format
+        context['structure_source'] = os.path.basename(pdb_file)
+        context['structure_sha256'] = _structure_checksum(pdb_file)
+    elif pdb_id:
         context['pdb_id'] = pdb_id
         context['nterm_offset'] = nterm_offset
 
@@ -170,7 +586,143 @@ def plot_loadings(
         pca_loadings: OrdinationResults,
         positions_mapping: pd.DataFrame,
         pdb_id: str = None,
-        nterm_offset: int = 1) -> None:
+        nterm_offset: int = 1,
+        lod_threshold: int = 5000,
+        lod_bins: int = 100,
+        renderer: str = 'canvas',
+        pdb_file: str = None,
+        pdb_cache_dir: str = None,
+        loading_intervals: pd.DataFrame = None,
+        position_scores: pd.DataFrame = None) -> None:
     loadings_df = pca_loadings.samples
     _plot_loadings(
-        output_dir, loadings_df, positions_mapping, pdb_id, nterm_offset)
+        output_dir, loadings_df, positions_mapping, pdb_id, nterm_offset,
+        lod_threshold, lod_bins, renderer, pdb_file, pdb_cache_dir,
+        loading_intervals, position_scores)
+
+
+def _grid_index(x: np.ndarray,
+                y: np.ndarray,
+                grid_size: int) -> (np.ndarray, np.ndarray, list):
+    # Assign points to the cells of a grid_size x grid_size grid spanning
+    # the data extent. Returns the order that groups the points by cell
+    # (cells in row-major order, x first), the offsets of every cell
+    # within that order and the extent of the grid.
+    extent = [float(x.min()), float(x.max()), float(y.min()), float(y.max())]
+    for i in (0, 2):
+        if extent[i] == extent[i + 1]:
+            extent[i], extent[i + 1] = extent[i] - 0.5, extent[i + 1] + 0.5
+    cx = np.floor((x - extent[0]) / (extent[1] - extent[0]) * grid_size)
+    cy = np.floor((y - extent[2]) / (extent[3] - extent[2]) * grid_size)
+    cells = (np.clip(cx, 0, grid_size - 1).astype(np.int64) * grid_size +
+             np.clip(cy, 0, grid_size - 1).astype(np.int64))
+
+    order = np.argsort(cells, kind='stable')
+    offsets = np.zeros(grid_size ** 2 + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cells, minlength=grid_size ** 2), out=offsets[1:])
+    return order, offsets, extent
+
+
+def _encode_metadata_column(
+        metadata: qiime2.MetadataColumn,
+        ids: pd.Index) -> (np.ndarray, dict):
+    # per-point colour attribute (category codes or numeric values) and
+    # its description for the page
+    if metadata is None:
+        return None, {'type': 'none'}
+
+    values = metadata.to_series().reindex(ids)
+    description = {'type': metadata.type, 'name': metadata.name}
+    if metadata.type == 'categorical':
+        codes, categories = pd.factorize(values, sort=True)
+        if len(categories) >= MISSING_CATEGORY:
+            raise ValueError(
+                'Too many categories in metadata column "%s" (%s).' % (
+                    metadata.name, len(categories)))
+        codes = np.where(codes < 0, MISSING_CATEGORY, codes)
+        description['categories'] = [str(x) for x in categories]
+        description['palette'] = [
+            CATEGORICAL_PALETTE[i % len(CATEGORICAL_PALETTE)]
+            for i in range(len(categories))]
+        return codes.astype('<u2'), description
+    else:
+        values = values.astype(float).values
+        if np.isnan(values).all():
+            description['range'] = [0.0, 0.0]
+        else:
+            description['range'] = [float(np.nanmin(values)),
+                                    float(np.nanmax(values))]
+        return values.astype('<f4'), description
+
+
+def _plot_scores(
+        output_dir: str,
+        pca_scores: OrdinationResults,
+        metadata: qiime2.MetadataColumn,
+        x_component: int,
+        y_component: int,
+        chunk_size: int = 65536,
+        points_per_cell: int = 64):
+    scores_df = pca_scores.samples
+    n_components = scores_df.shape[1]
+    for component in (x_component, y_component):
+        if component > n_components:
+            raise ValueError(
+                'Component %s was requested but only %s components were '
+                'retained.' % (component, n_components))
+
+    x = scores_df.iloc[:, x_component - 1].values
+    y = scores_df.iloc[:, y_component - 1].values
+    n_points = len(x)
+    grid_size = int(np.clip(np.ceil(np.sqrt(n_points / points_per_cell)),
+                            1, 1024))
+    order, offsets, extent = _grid_index(x, y, grid_size)
+    colors, color_description = _encode_metadata_column(
+        metadata, scores_df.index)
+
+    # points are stored grouped by grid cell, so that the page only needs to
+    # look at the cells intersecting the viewport
+    offsets.astype('<u4').tofile(os.path.join(output_dir, 'cells.bin'))
+    xy = np.column_stack([x, y])[order].astype('<f4')
+    ids = scores_df.index[order]
+    if colors is not None:
+        colors = colors[order]
+    n_chunks = int(np.ceil(n_points / chunk_size))
+    for i in range(n_chunks):
+        chunk = slice(i * chunk_size, (i + 1) * chunk_size)
+        xy[chunk].tofile(os.path.join(output_dir, f'chunk-{i}.xy.bin'))
+        if colors is not None:
+            colors[chunk].tofile(
+                os.path.join(output_dir, f'chunk-{i}.color.bin'))
+        with open(os.path.join(output_dir, f'chunk-{i}.ids.json'), 'w') as fh:
+            json.dump([str(_id) for _id in ids[chunk]], fh)
+
+    proportion_explained = pca_scores.proportion_explained
+    # the manifest is embedded in a script element, so a "</script>" in a
+    # metadata column or category name must not end it early
+    context = {
+        'manifest': json.dumps({
+            'n_points': n_points,
+            'n_chunks': n_chunks,
+            'chunk_size': chunk_size,
+            'grid_size': grid_size,
+            'extent': extent,
+            'axes': [
+                'PC%s (%.2f%%)' % (c, 100 * proportion_explained.iloc[c - 1])
+                if proportion_explained is not None else 'PC%s' % c
+                for c in (x_component, y_component)],
+            'color': color_description}).replace('<', '\\u003c')}
+
+    copy_tree(os.path.join(TEMPLATES, 'scores'), output_dir)
+
+    index = os.path.join(TEMPLATES, 'scores', 'index.html')
+    q2templates.render(index, output_dir, context=context)
+
+
+def plot_scores(
+        output_dir: str,
+        pca_scores: OrdinationResults,
+        metadata: qiime2.MetadataColumn = None,
+        x_component: int = 1,
+        y_component: int = 2) -> None:
+    _plot_scores(output_dir, pca_scores, metadata, x_component, y_component)
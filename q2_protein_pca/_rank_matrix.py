@@ -0,0 +1,158 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+# alignment symbols in the order they are encoded in for ranking, gap first
+ALPHABET = '-ABCDEFGHIKLMNPQRSTVWXYZ'
+
+# the most frequent of the other symbols at a position can rank at most this
+MAX_RANK = len(ALPHABET) - 1
+
+# per-position scores computed by aln_ranking next to the ranks
+SCORE_COLUMNS = ['Entropy', 'Conservation']
+
+
+def _deduplicate_rows(matrix: np.ndarray):
+    # Collapses identical rows, returning the unique rows, the index of each
+    # original row within them and how many times each unique row occurs.
+    matrix = np.ascontiguousarray(matrix)
+    rows = matrix.view(
+        np.dtype((np.void, matrix.dtype.itemsize * matrix.shape[1])))
+    _, first, inverse, counts = np.unique(
+        rows.ravel(), return_index=True, return_inverse=True,
+        return_counts=True)
+    return matrix[first], inverse.ravel(), counts
+
+
+def _check_ranks(ranks) -> np.ndarray:
+    # ranks as uint8, which out-of-range or fractional ranks would not
+    # survive unchanged
+    ranks = np.asarray(ranks)
+    if ranks.dtype == np.uint8:
+        valid = not ranks.size or ranks.max() <= MAX_RANK
+    else:
+        valid = not ranks.size or ranks.dtype.kind in 'uif' and np.all(
+            (ranks >= 0) & (ranks <= MAX_RANK) & (ranks == np.round(ranks)))
+        ranks = ranks.astype(np.uint8) if valid else ranks
+    if not valid:
+        raise ValueError(
+            'Ranks must be whole numbers between 0 and %s.' % MAX_RANK)
+    return ranks
+
+
+class RankMatrix:
+    # Ranks of an alignment as a (sequences x positions) uint8 array with
+    # the sequence IDs and position names alongside, for consumers that do
+    # not need a pandas DataFrame.
+
+    index_name = 'Sequence ID'
+
+    def __init__(self, ids, positions, ranks):
+        self.ids = np.asarray(ids, dtype=object)
+        self.positions = np.asarray(positions, dtype=object)
+        self.ranks = _check_ranks(ranks)
+
+        if self.ranks.shape != (len(self.ids), len(self.positions)):
+            raise ValueError(
+                'Rank matrix of shape %s does not match %s sequence IDs and '
+                '%s positions.' % (self.ranks.shape, len(self.ids),
+                                   len(self.positions)))
+
+    @property
+    def shape(self):
+        return self.ranks.shape
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame):
+        return cls(df.index, df.columns, df.to_numpy())
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            self.ranks, columns=pd.Index(self.positions),
+            index=pd.Index(self.ids, name=self.index_name), copy=False)
+
+
+class SharedRankMatrix(RankMatrix):
+    # A RankMatrix whose ranks live in a shared memory block. Pickling it,
+    # e.g. to pass it to pool workers, only sends the name of the block with
+    # the IDs and positions; workers map the same ranks instead of receiving
+    # a copy. The process that created the block frees it on close(), so it
+    # must outlive its workers' use of the ranks.
+
+    def __init__(self, ids, positions, ranks):
+        super().__init__(ids, positions, ranks)
+        self._shared_memory = SharedMemory(create=True,
+                                           size=max(self.ranks.nbytes, 1))
+        self._owner = True
+        shared = np.ndarray(self.shape, dtype=np.uint8,
+                            buffer=self._shared_memory.buf)
+        shared[:] = self.ranks
+        self.ranks = shared
+
+    @classmethod
+    def from_rank_matrix(cls, matrix: RankMatrix):
+        return cls(matrix.ids, matrix.positions, matrix.ranks)
+
+    @classmethod
+    def _attach(cls, name, shape, ids, positions):
+        matrix = cls.__new__(cls)
+        matrix._shared_memory = SharedMemory(name=name)
+        matrix._owner = False
+        RankMatrix.__init__(matrix, ids, positions, np.ndarray(
+            shape, dtype=np.uint8, buffer=matrix._shared_memory.buf))
+        return matrix
+
+    @property
+    def name(self):
+        return self._shared_memory.name
+
+    def __reduce__(self):
+        return (SharedRankMatrix._attach,
+                (self.name, self.shape, self.ids, self.positions))
+
+    def close(self):
+        # views of the ranks (including DataFrames from to_dataframe) must
+        # be released first, as the block cannot be unmapped while in use
+        if self._shared_memory is None:
+            return
+        self.ranks = np.empty((0, len(self.positions)), dtype=np.uint8)
+        self._shared_memory.close()
+        if self._owner:
+            self._shared_memory.unlink()
+        self._shared_memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class OccurrenceRanks:
+    # Ranks of an alignment together with the (positions x symbols)
+    # occurrence counts they were derived from, so that the ranks can be
+    # updated as sequences are appended without counting all of them again.
+
+    def __init__(self, matrix: RankMatrix, counts):
+        self.matrix = matrix
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+        if self.counts.shape != (matrix.shape[1], len(ALPHABET)):
+            raise ValueError(
+                'Occurrence counts of shape %s do not match %s positions and '
+                '%s symbols.' % (self.counts.shape, matrix.shape[1],
+                                 len(ALPHABET)))
+
+    def counts_to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            self.counts, columns=list(ALPHABET),
+            index=pd.Index(self.matrix.positions, name='Position'))
@@ -6,12 +6,31 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import aln_ranking as rank
 import numpy as np
 import pandas as pd
+import qiime2
+import skbio
+import skbio.io
+from q2_types.feature_data import AlignedProteinFASTAFormat
 from q2_types.feature_data._transformer import AlignedProteinIterator
 
-AA_MAP = {y: x for (x, y) in enumerate(list("-ABCDEFGHIKLMNPQRSTVWXYZ"))}
+from ._filter import _header_ids, _read_alignment
+from ._memo import memoize
+from ._rank_matrix import (
+    ALPHABET, SCORE_COLUMNS, OccurrenceRanks, RankMatrix, _deduplicate_rows)
+from ._weighting import (
+    N_SYMBOLS, _column_counts, _henikoff_weights, _identity_weights,
+    _metadata_weights, _row_blocks)
+
+AA_MAP = {y: x for (x, y) in enumerate(ALPHABET)}
+
+# AA_MAP as a lookup table over ASCII codes; other characters map to 255
+_AA_LOOKUP = np.full(256, 255, dtype=np.uint8)
+_AA_LOOKUP[[ord(aa) for aa in AA_MAP]] = list(AA_MAP.values())
 
 
 def _df_from_sequences(sequences: AlignedProteinIterator) -> pd.DataFrame:
@@ -25,23 +44,276 @@ def _df_from_sequences(sequences: AlignedProteinIterator) -> pd.DataFrame:
 
 
 def _get_occurrences(df: pd.DataFrame) -> pd.DataFrame:
-    return df.apply(pd.value_counts).fillna(0).astype("int")
+    # (symbols x positions) counts of the symbols occurring in `df`
+    counts = _column_counts(_encode_alignment(df), np.ones(len(df)))
+    present = np.flatnonzero(counts.sum(axis=0))
+    return pd.DataFrame(counts[:, present].T.astype(int),
+                        index=[ALPHABET[i] for i in present],
+                        columns=df.columns)
+
+
+def _encode_alignment(alignment_df: pd.DataFrame) -> np.ndarray:
+    return _encode_residues(alignment_df.to_numpy(dtype='S1').view(np.uint8))
+
+
+def _encode_residues(residues: np.ndarray) -> np.ndarray:
+    # ASCII codes to AA_MAP symbols
+    encoded = _AA_LOOKUP[residues]
+    if (encoded == 255).any():
+        unknown = sorted(set(residues[encoded == 255].tobytes().decode()))
+        raise ValueError(
+            'Unexpected characters in the alignment: %s.' % ', '.join(unknown))
+    return encoded
+
+
+def _sequence_weights(unique: np.ndarray, inverse: np.ndarray,
+                      counts: np.ndarray, weighting: str,
+                      identity_threshold: float,
+                      weights: pd.Series, ids: pd.Index) -> np.ndarray:
+    # total weight of every distinct sequence
+    if weights is not None:
+        return np.bincount(
+            inverse, weights=_metadata_weights(weights, ids),
+            minlength=len(unique))
+    if weighting == 'henikoff':
+        return counts * _henikoff_weights(unique, counts)
+    if weighting == 'identity':
+        return counts * _identity_weights(unique, counts, identity_threshold)
+    return counts.astype(np.float64)
+
+
+def _weighted_unique_sequences(encoded: np.ndarray, weighting: str,
+                               identity_threshold: float, weights: pd.Series,
+                               ids: pd.Index):
+    # (distinct sequences, index of every sequence's distinct sequence,
+    # total weight of every distinct sequence)
+    if weights is not None and weighting != 'none':
+        raise ValueError(
+            'Sequence weights can either be provided or computed with a '
+            'weighting scheme, not both.')
+    unique, inverse, counts = _deduplicate_rows(encoded)
+    sequence_weights = _sequence_weights(
+        unique, inverse, counts, weighting, identity_threshold, weights, ids)
+    return unique, inverse, sequence_weights
 
 
-def _rank_columns(alignment_df: pd.DataFrame) -> pd.DataFrame:
-    aln_unranked = alignment_df.replace(AA_MAP).astype(np.uint32).values
-    aln_ranked = rank.rank_sequences(aln_unranked)
+@memoize
+def _rank_and_score_columns(alignment_df: pd.DataFrame,
+                            weighting: str = 'none',
+                            identity_threshold: float = 0.8,
+                            weights: pd.Series = None
+                            ) -> (pd.DataFrame, pd.DataFrame):
+    # identical sequences are ranked once, weighted by their multiplicity
+    unique, inverse, sequence_weights = _weighted_unique_sequences(
+        _encode_alignment(alignment_df), weighting, identity_threshold,
+        weights, alignment_df.index)
+    # ranks and scores come from the same occurrence counts
+    aln_ranked, scores = rank.rank_and_score_sequences_weighted(
+        unique.astype(np.uint32), sequence_weights)
     aln_df_ranked = pd.DataFrame(
-        aln_ranked, columns=alignment_df.columns, index=alignment_df.index)
+        aln_ranked[inverse], columns=alignment_df.columns,
+        index=alignment_df.index)
     aln_df_ranked.index.name = "Sequence ID"
-    return aln_df_ranked.astype("int")
+    scores_df = pd.DataFrame(
+        scores, columns=SCORE_COLUMNS,
+        index=pd.Index(alignment_df.columns, name='Position'))
+    return aln_df_ranked.astype(np.uint8), scores_df
 
 
-def _rank(sequences: AlignedProteinIterator) -> pd.DataFrame:
+def _rank_columns(alignment_df: pd.DataFrame, weighting: str = 'none',
+                  identity_threshold: float = 0.8,
+                  weights: pd.Series = None) -> pd.DataFrame:
+    return _rank_and_score_columns(
+        alignment_df, weighting, identity_threshold, weights)[0]
+
+
+def _rank(sequences: AlignedProteinIterator, weighting: str = 'none',
+          identity_threshold: float = 0.8,
+          weights: pd.Series = None) -> pd.DataFrame:
     alignment_df = _df_from_sequences(sequences)
-    ranking_table = _rank_columns(alignment_df)
-    return ranking_table.astype("int")
+    return _rank_columns(alignment_df, weighting, identity_threshold, weights)
+
+
+def rank_alignment(sequences: AlignedProteinIterator,
+                   weighting: str = 'none',
+                   identity_threshold: float = 0.8,
+                   weights: qiime2.NumericMetadataColumn = None
+                   ) -> pd.DataFrame:
+    if weights is not None:
+        weights = weights.to_series()
+    return _rank(sequences, weighting, identity_threshold, weights)
+
+
+def score_positions(sequences: AlignedProteinIterator,
+                    weighting: str = 'none',
+                    identity_threshold: float = 0.8,
+                    weights: qiime2.NumericMetadataColumn = None
+                    ) -> pd.DataFrame:
+    if weights is not None:
+        weights = weights.to_series()
+    return _rank_and_score_columns(
+        _df_from_sequences(sequences), weighting, identity_threshold,
+        weights)[1]
+
+
+def _position_profile(encoded: np.ndarray, ids: pd.Index,
+                      weighting: str = 'none',
+                      identity_threshold: float = 0.8,
+                      weights: pd.Series = None,
+                      frequencies: bool = False) -> (pd.DataFrame, str):
+    # (positions x symbols) weighted occurrence counts, counted in a single
+    # bincount over the distinct sequences, and the consensus: the most
+    # frequent symbol at every position, gaps included, ties going to the
+    # earlier symbol
+    unique, _, sequence_weights = _weighted_unique_sequences(
+        encoded, weighting, identity_threshold, weights, ids)
+    counts = _column_counts(unique, sequence_weights)
+    consensus = np.frombuffer(ALPHABET.encode(), dtype=np.uint8)[
+        counts.argmax(axis=1)].tobytes().decode()
+    if frequencies:
+        counts /= max(sequence_weights.sum(), np.finfo(float).tiny)
+
+    profile = pd.DataFrame(
+        counts, columns=list(ALPHABET),
+        index=pd.Index([f"pos{x+1}" for x in range(encoded.shape[1])],
+                       name='Position'))
+    return profile, consensus
+
+
+def position_profile(sequences: AlignedProteinFASTAFormat,
+                     weighting: str = 'none',
+                     identity_threshold: float = 0.8,
+                     weights: qiime2.NumericMetadataColumn = None,
+                     frequencies: bool = False
+                     ) -> (pd.DataFrame, AlignedProteinFASTAFormat):
+    if weights is not None:
+        weights = weights.to_series()
+    # read straight into a matrix, without a DataFrame of characters
+    headers, residues = _read_alignment(str(sequences))
+    profile, consensus = _position_profile(
+        _encode_residues(residues), pd.Index(_header_ids(headers)),
+        weighting, identity_threshold, weights, frequencies)
+
+    result = AlignedProteinFASTAFormat()
+    with result.open() as fh:
+        fh.write('>consensus\n%s\n' % consensus)
+    return profile, result
+
+
+def _rank_file(path: str, weighting: str, identity_threshold: float,
+               weights: pd.Series) -> RankMatrix:
+    # read in the worker, so only paths and compact uint8 ranks travel
+    # between processes
+    sequences = skbio.io.read(path, format='fasta', constructor=skbio.Protein)
+    return RankMatrix.from_dataframe(
+        _rank(sequences, weighting, identity_threshold, weights))
+
+
+def rank_alignments(sequences: AlignedProteinFASTAFormat,
+                    weighting: str = 'none',
+                    identity_threshold: float = 0.8,
+                    weights: qiime2.NumericMetadataColumn = None,
+                    n_jobs: int = 1) -> RankMatrix:
+    # `sequences` is a collection: a dict of alignments by name
+    if weights is not None:
+        weights = weights.to_series()
+    if n_jobs == 'auto':
+        n_jobs = os.cpu_count()
+    paths = {name: str(alignment) for name, alignment in sequences.items()}
+    args = (weighting, identity_threshold, weights)
+
+    if n_jobs == 1 or len(paths) <= 1:
+        return {name: _rank_file(path, *args) for name, path in paths.items()}
+
+    # workers started by fork inherit the already imported aln_ranking
+    # extension instead of loading it again
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(paths))) as pool:
+        futures = {name: pool.submit(_rank_file, path, *args)
+                   for name, path in paths.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def _symbol_ranks(counts: np.ndarray) -> np.ndarray:
+    # (positions x symbols) rank of every symbol given its occurrence counts,
+    # as assigned by aln_ranking: the most frequent residue at a position
+    # gets the highest rank, ties go to the earlier symbol, and gaps and
+    # absent residues get 0.
+    counts = counts.copy()
+    counts[:, 0] = 0
+    symbols = np.broadcast_to(np.arange(N_SYMBOLS), counts.shape)
+    order = np.lexsort((symbols, -counts), axis=1)
+    place = np.empty_like(order)
+    np.put_along_axis(place, order, symbols, axis=1)
+    n_types = (counts > 0).sum(axis=1, keepdims=True)
+    return np.where(counts > 0, n_types - place, 0).astype(np.uint8)
+
+
+def _apply_symbol_ranks(encoded: np.ndarray,
+                        symbol_ranks: np.ndarray) -> np.ndarray:
+    n_rows, n_cols = encoded.shape
+    offsets = N_SYMBOLS * np.arange(n_cols)
+    ranks = np.empty(encoded.shape, dtype=np.uint8)
+    for rows in _row_blocks(n_rows, n_cols):
+        ranks[rows] = symbol_ranks.ravel()[encoded[rows] + offsets]
+    return ranks
+
+
+def _ranking_state(alignment_df: pd.DataFrame) -> OccurrenceRanks:
+    encoded = _encode_alignment(alignment_df)
+    counts = _column_counts(encoded, np.ones(len(encoded)))
+    ranks = _apply_symbol_ranks(encoded, _symbol_ranks(counts))
+    return OccurrenceRanks(
+        RankMatrix(alignment_df.index, alignment_df.columns, ranks), counts)
+
+
+def _update_ranks(state: OccurrenceRanks,
+                  alignment_df: pd.DataFrame) -> OccurrenceRanks:
+    matrix = state.matrix
+    if alignment_df.shape[1] != matrix.shape[1]:
+        raise ValueError(
+            'The new sequences are aligned to %s positions, but the ranked '
+            'alignment has %s. Sequences must be added to the alignment '
+            'without inserting positions.'
+            % (alignment_df.shape[1], matrix.shape[1]))
+    ranked = alignment_df.index.intersection(pd.Index(matrix.ids))
+    if len(ranked):
+        raise ValueError(
+            '%s sequence(s) have already been ranked, e.g. %s.'
+            % (len(ranked), ', '.join(map(str, ranked[:5]))))
+
+    # only the new sequences are counted
+    encoded = _encode_alignment(alignment_df)
+    counts = state.counts + _column_counts(
+        encoded, np.ones(len(encoded))).astype(np.int64)
+    old_ranks, new_ranks = _symbol_ranks(state.counts), _symbol_ranks(counts)
+
+    ranks = np.vstack([matrix.ranks, _apply_symbol_ranks(encoded, new_ranks)])
+
+    # existing ranks are translated only at positions whose order changed,
+    # going from each old rank to its symbol's new rank
+    changed = np.flatnonzero((old_ranks != new_ranks).any(axis=1))
+    if changed.size:
+        translation = np.zeros((changed.size, N_SYMBOLS), dtype=np.uint8)
+        np.put_along_axis(
+            translation, old_ranks[changed], new_ranks[changed], axis=1)
+        translation[:, 0] = 0
+        n_ranked = matrix.shape[0]
+        ranks[:n_ranked, changed] = translation[
+            np.arange(changed.size), ranks[:n_ranked, changed]]
+
+    return OccurrenceRanks(
+        RankMatrix(np.concatenate([matrix.ids, alignment_df.index]),
+                   matrix.positions, ranks),
+        counts)
+
+
+def create_ranking_state(
+        sequences: AlignedProteinIterator) -> OccurrenceRanks:
+    return _ranking_state(_df_from_sequences(sequences))
 
 
-def rank_alignment(sequences: AlignedProteinIterator) -> pd.DataFrame:
-    return _rank(sequences)
+def update_ranks(ranking_state: OccurrenceRanks,
+                 sequences: AlignedProteinIterator
+                 ) -> (OccurrenceRanks, RankMatrix):
+    state = _update_ranks(ranking_state, _df_from_sequences(sequences))
+    return state, state.matrix
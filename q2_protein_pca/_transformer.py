@@ -6,27 +6,123 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import csv
+import re
+
+import numpy as np
 import pandas as pd
+import qiime2
 
-from ._format import RankedProteinAlignmentFormat, PositionMappingFormat
+from ._format import (
+    AlignmentFilterReportFormat, LoadingIntervalsFormat, PCAModelFormat,
+    PositionProfileFormat, PositionScoresFormat, RankedProteinAlignmentFormat,
+    PositionMappingFormat, RankingStateDirectoryFormat)
+from ._pca_model import FittedPCA, _map_npz
+from ._rank_matrix import (
+    ALPHABET, MAX_RANK, OccurrenceRanks, RankMatrix, _check_ranks)
 from q2_protein_pca.plugin_setup import plugin
 
+# number of values parsed at a time when pyarrow is not available
+RANKS_CHUNK_CELLS = 2 ** 24
+
+# number of values formatted per written block (~10 bytes each in flight)
+RANKS_WRITE_CELLS = 2 ** 21
+
+# ",<rank>" for every rank as one space-padded 4-byte word, so that a block
+# of ranks is formatted with a single lookup and the padding dropped after
+_PADDING = ord(' ')
+_RANK_WORDS = np.frombuffer(
+    b''.join((',%-3d' % rank).encode('ascii')
+             for rank in range(MAX_RANK + 1)), dtype='<u4')
+_NEWLINE_WORD = np.frombuffer(b'\n   ', dtype='<u4')[0]
+
+
+def _read_ranks(fp: str) -> RankMatrix:
+    # Ranks are within 0-23 (see RankedProteinAlignmentFormat), so they are
+    # parsed straight into a uint8 matrix instead of inferring int64 for each
+    # of the possibly thousands of positions.
+    with open(fp, newline='') as fh:
+        header = next(csv.reader(fh))
+    index_col, positions = header[0], header[1:]
+
+    try:
+        import pyarrow
+        from pyarrow import csv as pa_csv
+    except ImportError:
+        dtype = {col: np.uint8 for col in positions}
+        dtype[index_col] = str
+        # IDs such as NA or null are kept as they are, like pyarrow does
+        chunks = pd.read_csv(
+            fp, sep=",", index_col=index_col, dtype=dtype,
+            keep_default_na=False, na_filter=False,
+            chunksize=max(1, RANKS_CHUNK_CELLS // max(len(positions), 1)))
+        df = pd.concat(chunks)
+        return RankMatrix(df.index, positions, df.to_numpy())
+
+    column_types = {col: pyarrow.uint8() for col in positions}
+    column_types[index_col] = pyarrow.string()
+    table = pa_csv.read_csv(
+        fp, convert_options=pa_csv.ConvertOptions(column_types=column_types))
+
+    ranks = np.empty((table.num_rows, len(positions)), dtype=np.uint8)
+    for i, col in enumerate(table.columns[1:]):
+        ranks[:, i] = col.to_numpy()
+    ids = table.column(0).to_numpy()
+    return RankMatrix(ids, positions, ranks)
+
+
+# values DataFrame.to_csv quotes under csv.QUOTE_MINIMAL
+_NEEDS_QUOTING = re.compile('[,"\r\n]')
+
+
+def _csv_field(value) -> str:
+    value = str(value)
+    if _NEEDS_QUOTING.search(value):
+        return '"%s"' % value.replace('"', '""')
+    return value
+
+
+def _write_ranks(fh, ids, positions, values, index_name=None):
+    values = _check_ranks(values)
+
+    index_name = '' if index_name is None else index_name
+    header = ','.join(_csv_field(x) for x in [index_name, *positions])
+    fh.write((header + '\n').encode('utf-8'))
+
+    n_rows, n_cols = values.shape
+    block_size = max(1, RANKS_WRITE_CELLS // max(n_cols, 1))
+    for start in range(0, n_rows, block_size):
+        block = values[start:start + block_size]
+        block_ids = [_csv_field(seq_id).encode('utf-8')
+                     for seq_id in ids[start:start + block_size]]
+
+        # one row of text per sequence: the rank words and a newline
+        words = np.empty((len(block), n_cols + 1), dtype='<u4')
+        np.take(_RANK_WORDS, block, out=words[:, :-1], mode='clip')
+        words[:, -1] = _NEWLINE_WORD
+        text = words.view(np.uint8)
+        text = text[text != _PADDING].tobytes()
+
+        # each rank takes two or three bytes and the newline one
+        lengths = 2 * n_cols + 1 + (block > 9).sum(axis=1)
+        ends = np.cumsum(lengths).tolist()
+        fh.write(b''.join(
+            seq_id + text[begin:end]
+            for seq_id, begin, end in zip(block_ids, [0] + ends[:-1], ends)))
+
 
 @plugin.register_transformer
 def _1(ff: RankedProteinAlignmentFormat) -> pd.DataFrame:
-    with ff.open() as fh:
-        df = pd.read_csv(fh, sep=",", index_col="Sequence ID")
-        df = df.astype('int64')
-        return df
+    return _read_ranks(str(ff)).to_dataframe()
 
 
 @plugin.register_transformer
 def _2(data: pd.DataFrame) -> RankedProteinAlignmentFormat:
     ff = RankedProteinAlignmentFormat()
-    with ff.open() as fh:
-        data = data.astype('int64')
-        data.to_csv(fh, sep=",", header=True, index=True)
-        return ff
+    with open(str(ff), 'wb') as fh:
+        _write_ranks(fh, data.index, data.columns, data.to_numpy(),
+                     data.index.name)
+    return ff
 
 
 @plugin.register_transformer
@@ -44,3 +140,164 @@ def _4(data: pd.DataFrame) -> PositionMappingFormat:
         data = data.astype('Int64')
         data.to_csv(fh, sep=",", header=True, index=True)
         return ff
+
+
+@plugin.register_transformer
+def _5(ff: RankedProteinAlignmentFormat) -> RankMatrix:
+    return _read_ranks(str(ff))
+
+
+@plugin.register_transformer
+def _6(data: RankMatrix) -> RankedProteinAlignmentFormat:
+    ff = RankedProteinAlignmentFormat()
+    with open(str(ff), 'wb') as fh:
+        _write_ranks(fh, data.ids, data.positions, data.ranks,
+                     data.index_name)
+    return ff
+
+
+@plugin.register_transformer
+def _7(ff: RankedProteinAlignmentFormat) -> np.ndarray:
+    return _read_ranks(str(ff)).ranks
+
+
+@plugin.register_transformer
+def _8(ff: RankingStateDirectoryFormat) -> OccurrenceRanks:
+    matrix = _read_ranks(str(ff.path / 'ranked-protein-alignment.tsv'))
+    counts = pd.read_csv(
+        ff.path / 'occurrence-counts.csv', index_col=0,
+        dtype={'Position': str, **{symbol: np.int64 for symbol in ALPHABET}})
+    return OccurrenceRanks(matrix, counts.to_numpy())
+
+
+@plugin.register_transformer
+def _9(data: OccurrenceRanks) -> RankingStateDirectoryFormat:
+    ff = RankingStateDirectoryFormat()
+    matrix = data.matrix
+    with open(ff.path / 'ranked-protein-alignment.tsv', 'wb') as fh:
+        _write_ranks(fh, matrix.ids, matrix.positions, matrix.ranks,
+                     matrix.index_name)
+    data.counts_to_dataframe().to_csv(ff.path / 'occurrence-counts.csv')
+    return ff
+
+
+@plugin.register_transformer
+def _10(ff: PCAModelFormat) -> FittedPCA:
+    # memory-mapped, see _map_npz
+    arrays = _map_npz(str(ff))
+    return FittedPCA(
+        arrays['positions'], arrays['mean'], arrays['components'],
+        arrays['variance'], arrays['variance_ratio'],
+        arrays.get('symbol_ranks'))
+
+
+@plugin.register_transformer
+def _11(data: FittedPCA) -> PCAModelFormat:
+    ff = PCAModelFormat()
+    arrays = {'positions': data.positions, 'mean': data.mean,
+              'components': data.components, 'variance': data.variance,
+              'variance_ratio': data.variance_ratio}
+    if data.symbol_ranks is not None:
+        arrays['symbol_ranks'] = data.symbol_ranks
+    with open(str(ff), 'wb') as fh:
+        np.savez(fh, **arrays)
+    return ff
+
+
+@plugin.register_transformer
+def _12(ff: LoadingIntervalsFormat) -> pd.DataFrame:
+    with ff.open() as fh:
+        return pd.read_csv(fh, index_col=0, dtype={'Position': str})
+
+
+@plugin.register_transformer
+def _13(data: pd.DataFrame) -> LoadingIntervalsFormat:
+    ff = LoadingIntervalsFormat()
+    with ff.open() as fh:
+        data.to_csv(fh, index_label='Position')
+    return ff
+
+
+def _read_filter_report(ff: AlignmentFilterReportFormat) -> pd.DataFrame:
+    with ff.open() as fh:
+        return pd.read_csv(fh, index_col=0, dtype={'ID': str, 'Kind': str,
+                                                   'Gap fraction': float},
+                           keep_default_na=False, na_filter=False)
+
+
+@plugin.register_transformer
+def _14(ff: AlignmentFilterReportFormat) -> pd.DataFrame:
+    return _read_filter_report(ff)
+
+
+@plugin.register_transformer
+def _15(data: pd.DataFrame) -> AlignmentFilterReportFormat:
+    ff = AlignmentFilterReportFormat()
+    with ff.open() as fh:
+        data.to_csv(fh, index_label='ID')
+    return ff
+
+
+@plugin.register_transformer
+def _16(ff: AlignmentFilterReportFormat) -> qiime2.Metadata:
+    report = _read_filter_report(ff)
+    # metadata cannot be empty
+    if report.empty:
+        raise ValueError(
+            'Nothing was removed by filter-alignment, so the report has no '
+            'sequences or positions to show as metadata.')
+    return qiime2.Metadata(report)
+
+
+def _read_position_scores(ff: PositionScoresFormat) -> pd.DataFrame:
+    with ff.open() as fh:
+        return pd.read_csv(fh, index_col=0, dtype={'Position': str})
+
+
+@plugin.register_transformer
+def _17(ff: PositionScoresFormat) -> pd.DataFrame:
+    return _read_position_scores(ff)
+
+
+@plugin.register_transformer
+def _18(data: pd.DataFrame) -> PositionScoresFormat:
+    ff = PositionScoresFormat()
+    with ff.open() as fh:
+        data.to_csv(fh, index_label='Position')
+    return ff
+
+
+@plugin.register_transformer
+def _19(ff: PositionScoresFormat) -> qiime2.Metadata:
+    # "Position" is not one of the ID headers metadata recognises
+    return qiime2.Metadata(_read_position_scores(ff).rename_axis('id'))
+
+
+def _read_position_profile(ff: PositionProfileFormat) -> pd.DataFrame:
+    with ff.open() as fh:
+        return pd.read_csv(
+            fh, index_col=0,
+            dtype={'Position': str,
+                   **{symbol: np.float64 for symbol in ALPHABET}})
+
+
+@plugin.register_transformer
+def _20(ff: PositionProfileFormat) -> pd.DataFrame:
+    return _read_position_profile(ff)
+
+
+@plugin.register_transformer
+def _21(data: pd.DataFrame) -> PositionProfileFormat:
+    ff = PositionProfileFormat()
+    # columns of whole numbers, e.g. unweighted counts, are written as
+    # integers, the others in full precision
+    integral = ((data % 1 == 0) & np.isfinite(data)).all()
+    data = data.astype({col: np.int64 for col in data.columns[integral]})
+    with ff.open() as fh:
+        data.to_csv(fh, index_label='Position')
+    return ff
+
+
+@plugin.register_transformer
+def _22(ff: PositionProfileFormat) -> qiime2.Metadata:
+    return qiime2.Metadata(_read_position_profile(ff).rename_axis('id'))
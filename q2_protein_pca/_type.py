@@ -14,3 +14,18 @@ RankedProteinAlignment = SemanticType('RankedProteinAlignment',
 
 PositionMapping = SemanticType('PositionMapping',
                                variant_of=FeatureData.field['type'])
+
+LoadingIntervals = SemanticType('LoadingIntervals',
+                                variant_of=FeatureData.field['type'])
+
+PositionScores = SemanticType('PositionScores',
+                              variant_of=FeatureData.field['type'])
+
+PositionProfile = SemanticType('PositionProfile',
+                               variant_of=FeatureData.field['type'])
+
+RankingState = SemanticType('RankingState')
+
+PCAModel = SemanticType('PCAModel')
+
+AlignmentFilterReport = SemanticType('AlignmentFilterReport')
@@ -0,0 +1,96 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# number of symbols in an encoded alignment (see _ranking.AA_MAP); 0 is a gap
+N_SYMBOLS = 24
+
+# number of alignment cells processed at a time
+WEIGHTING_BLOCK_CELLS = 2 ** 22
+
+# number of sequence pairs compared at a time in _identity_weights
+IDENTITY_BLOCK_PAIRS = 2 ** 24
+
+
+def _row_blocks(n_rows: int, n_cols: int):
+    step = max(1, WEIGHTING_BLOCK_CELLS // max(n_cols, 1))
+    return [slice(start, start + step) for start in range(0, n_rows, step)]
+
+
+def _column_counts(encoded: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # (positions x symbols) occurrence counts, rows weighted by `counts`
+    n_rows, n_cols = encoded.shape
+    offsets = N_SYMBOLS * np.arange(n_cols)
+    occurrences = np.zeros(n_cols * N_SYMBOLS)
+    for rows in _row_blocks(n_rows, n_cols):
+        block = encoded[rows]
+        occurrences += np.bincount(
+            (block + offsets).ravel(),
+            weights=np.repeat(counts[rows], n_cols),
+            minlength=n_cols * N_SYMBOLS)
+    return occurrences.reshape(n_cols, N_SYMBOLS)
+
+
+def _henikoff_weights(encoded: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # Position-based weights (Henikoff & Henikoff, 1994) of the distinct
+    # sequences in `encoded`, each occurring counts[i] times: at every
+    # position, a sequence gets 1 / (r * n), where r is the number of residue
+    # types at that position and n the number of sequences sharing its
+    # residue. Gaps contribute nothing.
+    occurrences = _column_counts(encoded, counts)
+    occurrences[:, 0] = 0
+    n_types = (occurrences > 0).sum(axis=1)
+    with np.errstate(divide='ignore'):
+        share = 1 / (n_types[:, np.newaxis] * occurrences)
+    share[~np.isfinite(share)] = 0
+
+    n_rows, n_cols = encoded.shape
+    positions = np.arange(n_cols)
+    weights = np.concatenate([
+        share[positions, encoded[rows]].sum(axis=1)
+        for rows in _row_blocks(n_rows, n_cols)])
+    return weights / (weights @ counts) * counts.sum()
+
+
+def _identity_weights(encoded: np.ndarray, counts: np.ndarray,
+                      threshold: float) -> np.ndarray:
+    # Weights of 1 / (number of sequences at least `threshold` identical to
+    # it, itself included) for the distinct sequences in `encoded`, each
+    # occurring counts[i] times. Identities are the fraction of matching
+    # alignment positions, counted through a sparse one-hot encoding.
+    n_rows, n_cols = encoded.shape
+    one_hot = sparse.csr_matrix(
+        (np.ones(encoded.size, dtype=np.float32),
+         (encoded.astype(np.int64) + N_SYMBOLS * np.arange(n_cols)).ravel(),
+         np.arange(0, encoded.size + 1, n_cols)),
+        shape=(n_rows, n_cols * N_SYMBOLS))
+    min_matches = threshold * n_cols
+
+    neighbours = np.empty(n_rows)
+    block_size = max(1, IDENTITY_BLOCK_PAIRS // n_rows)
+    for start in range(0, n_rows, block_size):
+        matches = (one_hot[start:start + block_size] @ one_hot.T).toarray()
+        neighbours[start:start + block_size] = \
+            (matches >= min_matches - 1e-6) @ counts
+    return 1 / neighbours
+
+
+def _metadata_weights(weights: pd.Series, ids: pd.Index) -> np.ndarray:
+    missing = ids.difference(weights.dropna().index)
+    if len(missing):
+        raise ValueError(
+            'Weights are missing for %s sequence(s), e.g. %s.'
+            % (len(missing), ', '.join(map(str, missing[:5]))))
+    weights = weights.reindex(ids).to_numpy(dtype=np.float64)
+    if (weights < 0).any() or weights.sum() <= 0:
+        raise ValueError(
+            'Sequence weights must be non-negative and not all zero.')
+    return weights
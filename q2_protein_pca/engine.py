@@ -0,0 +1,103 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+# The stages of the plugin on plain NumPy arrays, for embedding them without
+# QIIME 2 artifacts or pandas DataFrames:
+#
+#   ids, matrix = encode('aligned.fasta')
+#   ranks = rank(matrix, weighting='henikoff')
+#   scores, loadings, model = pca(ranks, n_components=2)
+#   mapping = map_positions(matrix)
+#
+# An alignment is a (sequences x positions) uint8 matrix of symbol codes,
+# i.e. indices into ALPHABET, so 0 is a gap. Unlike the actions, these
+# functions are not memoized (see enable_cache).
+
+import aln_ranking as rank_kernel
+import numpy as np
+import pandas as pd
+
+from ._filter import _header_ids, _read_alignment
+from ._pca import _fit_pca
+from ._pca_model import FittedPCA
+from ._rank_matrix import ALPHABET
+from ._ranking import _encode_residues, _weighted_unique_sequences
+from ._weighting import N_SYMBOLS
+
+__all__ = ['ALPHABET', 'encode', 'rank', 'pca', 'map_positions']
+
+
+def _check_matrix(matrix) -> np.ndarray:
+    matrix = np.asarray(matrix)
+    if matrix.ndim != 2 or matrix.dtype.kind not in 'ui' or (
+            matrix.size and (matrix.min() < 0 or
+                             matrix.max() >= N_SYMBOLS)):
+        raise ValueError(
+            'An encoded alignment must be a 2-dimensional array of symbol '
+            'codes between 0 and %s.' % (N_SYMBOLS - 1))
+    return matrix.astype(np.uint8, copy=False)
+
+
+def encode(fasta_path: str) -> (np.ndarray, np.ndarray):
+    # (sequence IDs, encoded alignment) of an aligned protein FASTA file
+    headers, residues = _read_alignment(fasta_path)
+    return (np.array(_header_ids(headers), dtype=object),
+            _encode_residues(residues))
+
+
+def rank(matrix: np.ndarray, weighting: str = 'none',
+         identity_threshold: float = 0.8,
+         weights: np.ndarray = None) -> np.ndarray:
+    # (sequences x positions) uint8 ranks, as rank-alignment computes them;
+    # `weights` holds one non-negative weight per sequence (row)
+    matrix = _check_matrix(matrix)
+    ids = None
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.shape != (len(matrix),):
+            raise ValueError(
+                'Expected %s sequence weights, found %s.'
+                % (len(matrix), weights.size))
+        ids = pd.RangeIndex(len(matrix))
+        weights = pd.Series(weights, index=ids)
+
+    # identical sequences are ranked once, weighted by their multiplicity
+    unique, inverse, sequence_weights = _weighted_unique_sequences(
+        matrix, weighting, identity_threshold, weights, ids)
+    ranks = rank_kernel.rank_sequences_weighted(
+        unique.astype(np.uint32), sequence_weights)
+    return ranks.astype(np.uint8)[inverse]
+
+
+def pca(ranks: np.ndarray, n_components: int = None,
+        deduplicate: bool = False,
+        positions=None) -> (np.ndarray, np.ndarray, FittedPCA):
+    # (sequences x components) scores, (positions x components) loadings
+    # and the fitted model, as the pca action computes them. Positions are
+    # named pos1, pos2, ... unless given.
+    ranks = np.asarray(ranks)
+    if ranks.ndim != 2:
+        raise ValueError('Ranks must be a 2-dimensional array.')
+    if positions is None:
+        positions = [f"pos{x+1}" for x in range(ranks.shape[1])]
+
+    components, variance, variance_ratio, scores, mean = _fit_pca(
+        ranks, n_components, deduplicate)
+    loadings = -1 * components.T * np.sqrt(variance)
+    model = FittedPCA(positions, mean, components, variance, variance_ratio)
+    return scores, loadings, model
+
+
+def map_positions(matrix: np.ndarray) -> np.ndarray:
+    # (sequences x positions) index of every residue within its ungapped
+    # sequence, -1 at gaps; map-positions reports the same, transposed
+    matrix = _check_matrix(matrix)
+    residues = matrix != 0
+    mapping = np.cumsum(residues, axis=1, dtype=np.int64) - 1
+    mapping[~residues] = -1
+    return mapping
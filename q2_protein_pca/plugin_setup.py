@@ -9,16 +9,31 @@
 import importlib
 
 from q2_protein_pca._format import (
+    AlignmentFilterReportDirectoryFormat, AlignmentFilterReportFormat,
+    LoadingIntervalsDirectoryFormat, LoadingIntervalsFormat,
+    OccurrenceCountsFormat, PCAModelDirectoryFormat, PCAModelFormat,
     PositionMappingFormat, PositionMappingDirectoryFormat,
-    RankedProteinAlignmentDirectoryFormat, RankedProteinAlignmentFormat)
-from q2_protein_pca._type import PositionMapping, RankedProteinAlignment
+    PositionProfileDirectoryFormat, PositionProfileFormat,
+    PositionScoresDirectoryFormat, PositionScoresFormat,
+    RankedProteinAlignmentDirectoryFormat, RankedProteinAlignmentFormat,
+    RankingStateDirectoryFormat)
+from q2_protein_pca._type import (
+    AlignmentFilterReport, LoadingIntervals, PCAModel, PositionMapping,
+    PositionProfile, PositionScores, RankedProteinAlignment, RankingState)
 from q2_types.feature_data._type import (
     ProteinSequence, AlignedProteinSequence, FeatureData)
 from q2_types.ordination import PCoAResults
-from qiime2.plugin import (Str, Plugin, Choices, Bool, Citations, Int, Range)
+from qiime2.plugin import (Str, Plugin, Choices, Bool, Citations, Int, Range,
+                           Float, MetadataColumn, Categorical, Numeric)
 
 import q2_protein_pca
 
+try:
+    from qiime2.plugin import Collection
+except ImportError:
+    # collections of artifacts need QIIME 2 2023.9 or newer
+    Collection = None
+
 citations = Citations.load('citations.bib', package='q2_protein_pca')
 
 plugin = Plugin(
@@ -52,32 +67,232 @@ plugin.methods.register_function(
     citations=[citations['katoh2013mafft']]
 )
 
+plugin.methods.register_function(
+    function=q2_protein_pca.filter_alignment,
+    inputs={'sequences': FeatureData[AlignedProteinSequence]},
+    parameters={'max_sequence_gaps': Float % Range(0, 1, inclusive_end=True),
+                'max_position_gaps': Float % Range(0, 1, inclusive_end=True)},
+    outputs=[('filtered_sequences', FeatureData[AlignedProteinSequence]),
+             ('report', AlignmentFilterReport)],
+    input_descriptions={'sequences': 'Aligned protein sequences.'},
+    parameter_descriptions={
+        'max_sequence_gaps': 'Sequences with a larger fraction of gaps are '
+                             'removed.',
+        'max_position_gaps': 'Alignment positions with a larger fraction of '
+                             'gaps are removed. By default, all positions '
+                             'are kept.'},
+    output_descriptions={
+        'filtered_sequences': 'The remaining sequences at the remaining '
+                              'positions.',
+        'report': 'The removed sequences and positions with their gap '
+                  'fractions, identified as "sequence:<ID>" and '
+                  '"position:pos<number>". Positions are numbered as in the '
+                  'unfiltered alignment. If nothing was removed, the report '
+                  'is empty and cannot be viewed as metadata.'},
+    name='Remove gappy sequences and positions',
+    description=(
+        "Remove sequences (e.g. badly aligned fragments) and alignment "
+        "positions whose fraction of gaps exceeds the given thresholds. "
+        "Both fractions are computed on the unfiltered alignment."),
+)
+
 plugin.methods.register_function(
     function=q2_protein_pca.rank_alignment,
     inputs={'sequences': FeatureData[AlignedProteinSequence]},
-    parameters={},
+    parameters={
+        'weighting': Str % Choices(['none', 'henikoff', 'identity']),
+        'identity_threshold': Float % Range(0, 1, inclusive_end=True),
+        'weights': MetadataColumn[Numeric]},
     outputs=[('ranked_alignment', FeatureData[RankedProteinAlignment])],
     input_descriptions={'sequences': 'Aligned protein sequences.'},
-    parameter_descriptions={},
+    parameter_descriptions={
+        'weighting': 'Sequence weighting scheme used to correct for '
+                     'redundant (e.g. over-sampled) sequences when counting '
+                     'amino acid occurrences. "henikoff" uses position-based '
+                     'weights, "identity" weighs every sequence by the '
+                     'inverse of the number of sequences at least '
+                     '`identity_threshold` identical to it.',
+        'identity_threshold': 'Fraction of identical alignment positions '
+                              'above which two sequences count as redundant '
+                              'for the "identity" weighting.',
+        'weights': 'Precomputed, non-negative sequence weights. Cannot be '
+                   'combined with a weighting scheme.'},
     output_descriptions={'ranked_alignment': 'Ranked protein alignment.'},
     name='Protein alignment ranking',
     description=(
         "Perform protein alignment ranking based on amino acid "
         "occurrence frequency."),
+    citations=[citations['Wang2014'], citations['Henikoff1994']]
+)
+
+plugin.methods.register_function(
+    function=q2_protein_pca.score_positions,
+    inputs={'sequences': FeatureData[AlignedProteinSequence]},
+    parameters={
+        'weighting': Str % Choices(['none', 'henikoff', 'identity']),
+        'identity_threshold': Float % Range(0, 1, inclusive_end=True),
+        'weights': MetadataColumn[Numeric]},
+    outputs=[('position_scores', FeatureData[PositionScores])],
+    input_descriptions={'sequences': 'Aligned protein sequences.'},
+    parameter_descriptions={
+        'weighting': 'Sequence weighting scheme, as in `rank-alignment`.',
+        'identity_threshold': 'Identity threshold for the "identity" '
+                              'weighting, as in `rank-alignment`.',
+        'weights': 'Precomputed, non-negative sequence weights. Cannot be '
+                   'combined with a weighting scheme.'},
+    output_descriptions={
+        'position_scores': 'Shannon entropy (in bits) of the amino acids '
+                           'at every alignment position, gaps excluded, '
+                           'and its gap-aware conservation score between '
+                           '0 and 1.'},
+    name='Position entropy and conservation scores',
+    description=(
+        "Score the conservation of every alignment position from the same "
+        "(weighted) amino acid occurrence counts that ranking uses. The "
+        "conservation score is one minus the entropy relative to its "
+        "maximum, scaled by the fraction of sequences without a gap at the "
+        "position. The scores can be shown in `plot-loadings`."),
+    citations=[citations['Capra2007']]
+)
+
+plugin.methods.register_function(
+    function=q2_protein_pca.position_profile,
+    inputs={'sequences': FeatureData[AlignedProteinSequence]},
+    parameters={
+        'weighting': Str % Choices(['none', 'henikoff', 'identity']),
+        'identity_threshold': Float % Range(0, 1, inclusive_end=True),
+        'weights': MetadataColumn[Numeric],
+        'frequencies': Bool},
+    outputs=[('profile', FeatureData[PositionProfile]),
+             ('consensus', FeatureData[AlignedProteinSequence])],
+    input_descriptions={'sequences': 'Aligned protein sequences.'},
+    parameter_descriptions={
+        'weighting': 'Sequence weighting scheme, as in `rank-alignment`.',
+        'identity_threshold': 'Identity threshold for the "identity" '
+                              'weighting, as in `rank-alignment`.',
+        'weights': 'Precomputed, non-negative sequence weights. Cannot be '
+                   'combined with a weighting scheme.',
+        'frequencies': 'Report the fraction of the (weighted) sequences '
+                       'with each symbol instead of their counts.'},
+    output_descriptions={
+        'profile': 'Occurrences of every amino acid and the gap at every '
+                   'alignment position.',
+        'consensus': 'The most frequent symbol at every alignment position, '
+                     'as a single aligned sequence.'},
+    name='Residue profile and consensus sequence',
+    description=(
+        "Count how often every amino acid (and the gap) occurs at every "
+        "alignment position, optionally weighting the sequences as in "
+        "`rank-alignment`, and derive the consensus sequence. The profile "
+        "can be used to draw sequence logos or to filter positions."),
+)
+
+if Collection is not None:
+    plugin.methods.register_function(
+        function=q2_protein_pca.rank_alignments,
+        inputs={
+            'sequences': Collection[FeatureData[AlignedProteinSequence]]},
+        parameters={
+            'weighting': Str % Choices(['none', 'henikoff', 'identity']),
+            'identity_threshold': Float % Range(0, 1, inclusive_end=True),
+            'weights': MetadataColumn[Numeric],
+            'n_jobs': Int % Range(1, None) | Str % Choices(['auto'])},
+        outputs=[('ranked_alignments',
+                  Collection[FeatureData[RankedProteinAlignment]])],
+        input_descriptions={
+            'sequences': 'Aligned protein sequences, e.g. one alignment per '
+                         'protein family.'},
+        parameter_descriptions={
+            'weighting': 'Sequence weighting scheme, as in '
+                         '`rank-alignment`.',
+            'identity_threshold': 'Identity threshold for the "identity" '
+                                  'weighting, as in `rank-alignment`.',
+            'weights': 'Precomputed, non-negative sequence weights covering '
+                       'the sequences of all alignments.',
+            'n_jobs': 'The number of alignments ranked in parallel, each in '
+                      'its own process. (Use `auto` to use all available '
+                      'cores)'},
+        output_descriptions={
+            'ranked_alignments': 'Ranked protein alignments, keyed like the '
+                                 'input alignments.'},
+        name='Batch protein alignment ranking',
+        description=(
+            "Rank a collection of protein alignments based on amino acid "
+            "occurrence frequency, in parallel."),
+        citations=[citations['Wang2014'], citations['Henikoff1994']]
+    )
+
+plugin.methods.register_function(
+    function=q2_protein_pca.create_ranking_state,
+    inputs={'sequences': FeatureData[AlignedProteinSequence]},
+    parameters={},
+    outputs=[('ranking_state', RankingState)],
+    input_descriptions={'sequences': 'Aligned protein sequences.'},
+    parameter_descriptions={},
+    output_descriptions={
+        'ranking_state': 'Ranked protein alignment together with the amino '
+                         'acid occurrence counts of every position.'},
+    name='Updatable protein alignment ranking',
+    description=(
+        "Rank a protein alignment like `rank-alignment`, keeping the amino "
+        "acid occurrence counts so that sequences can later be added with "
+        "`update-ranks`."),
+    citations=[citations['Wang2014']]
+)
+
+plugin.methods.register_function(
+    function=q2_protein_pca.update_ranks,
+    inputs={'ranking_state': RankingState,
+            'sequences': FeatureData[AlignedProteinSequence]},
+    parameters={},
+    outputs=[('updated_ranking_state', RankingState),
+             ('ranked_alignment', FeatureData[RankedProteinAlignment])],
+    input_descriptions={
+        'ranking_state': 'Ranking state of the alignment so far.',
+        'sequences': 'New sequences, aligned to the same positions as the '
+                     'ranked alignment (e.g. with `mafft --add` and '
+                     '`--keeplength`).'},
+    parameter_descriptions={},
+    output_descriptions={
+        'updated_ranking_state': 'Ranking state including the new '
+                                 'sequences.',
+        'ranked_alignment': 'Ranked protein alignment including the new '
+                            'sequences.'},
+    name='Add sequences to a ranked protein alignment',
+    description=(
+        "Add sequences to a ranked protein alignment. Only the new sequences "
+        "are counted, and existing ranks are only re-mapped at positions "
+        "where the order of amino acid frequencies changed. The result is "
+        "identical to ranking the whole alignment again."),
     citations=[citations['Wang2014']]
 )
 
 plugin.methods.register_function(
     function=q2_protein_pca.pca,
-    inputs={'ranks': FeatureData[RankedProteinAlignment]},
-    parameters={'n_components': Int % Range(1, None)},
-    outputs=[('pca_scores', PCoAResults), ('pca_loadings', PCoAResults)],
-    input_descriptions={'ranks': 'Ranked protein alignment.'},
+    inputs={'ranks': FeatureData[RankedProteinAlignment],
+            'ranking_state': RankingState},
+    parameters={'n_components': Int % Range(1, None),
+                'deduplicate': Bool},
+    outputs=[('pca_scores', PCoAResults), ('pca_loadings', PCoAResults),
+             ('pca_model', PCAModel)],
+    input_descriptions={
+        'ranks': 'Ranked protein alignment.',
+        'ranking_state': 'Ranking state the ranked alignment was created '
+                         'with; it must hold the same sequences, positions '
+                         'and ranks. Required to later project new sequences '
+                         'with `project`, which ranks them like the '
+                         'reference alignment.'},
     parameter_descriptions={
-        'n_components': 'The number of principal components to retain.'},
+        'n_components': 'The number of principal components to retain.',
+        'deduplicate': 'Collapse identical ranked sequences and run a PCA '
+                       'weighted by their multiplicity. Gives the same '
+                       'result, but is much faster for redundant '
+                       'alignments.'},
     output_descriptions={
         'pca_scores': 'PCA scores.',
-        'pca_loadings': 'PCA loadings.'},
+        'pca_loadings': 'PCA loadings.',
+        'pca_model': 'The fitted PCA: mean ranks, principal axes and '
+                     'explained variance.'},
     name='Principal Component Analysis of ranked protein alignment',
     description=(
         "Perform PCA on protein alignment ranked according to amino acid "
@@ -85,6 +300,58 @@ plugin.methods.register_function(
     citations=[citations['Wang2014']]
 )
 
+plugin.methods.register_function(
+    function=q2_protein_pca.pca_bootstrap,
+    inputs={'ranks': FeatureData[RankedProteinAlignment]},
+    parameters={'n_replicates': Int % Range(1, None),
+                'n_components': Int % Range(1, None),
+                'confidence': Float % Range(0, 1, inclusive_start=False),
+                'random_seed': Int,
+                'n_jobs': Int % Range(1, None) | Str % Choices(['auto'])},
+    outputs=[('loading_intervals', FeatureData[LoadingIntervals])],
+    input_descriptions={'ranks': 'Ranked protein alignment.'},
+    parameter_descriptions={
+        'n_replicates': 'The number of bootstrap replicates.',
+        'n_components': 'The number of principal components to compute '
+                        'intervals for.',
+        'confidence': 'Confidence level of the percentile intervals.',
+        'random_seed': 'Seed of the resampling. Results do not depend on '
+                       'n_jobs.',
+        'n_jobs': 'The number of processes computing replicates. The rank '
+                  'matrix is shared between them, not copied. (Use `auto` '
+                  'to use all available cores)'},
+    output_descriptions={
+        'loading_intervals': 'Lower and upper bound of the loadings of '
+                             'every position on each principal component.'},
+    name='Bootstrap intervals of PCA loadings',
+    description=(
+        "Resample the sequences of a ranked alignment with replacement, run "
+        "a PCA on every replicate and report percentile intervals of the "
+        "loadings of each position. Replicate axes are oriented by the PCA "
+        "of all sequences. The intervals can be shown in `plot-loadings`."),
+    citations=[citations['Wang2014']]
+)
+
+plugin.methods.register_function(
+    function=q2_protein_pca.project,
+    inputs={'pca_model': PCAModel,
+            'sequences': FeatureData[AlignedProteinSequence]},
+    parameters={},
+    outputs=[('pca_scores', PCoAResults)],
+    input_descriptions={
+        'pca_model': 'PCA model fitted with a ranking state.',
+        'sequences': 'New sequences, aligned to the same positions as the '
+                     'reference alignment.'},
+    parameter_descriptions={},
+    output_descriptions={'pca_scores': 'PCA scores of the new sequences.'},
+    name='Project sequences onto a fitted PCA',
+    description=(
+        "Rank new sequences by the amino acid frequencies of the reference "
+        "alignment and project them onto the principal axes of a fitted "
+        "PCA, without fitting it again."),
+    citations=[citations['Wang2014']]
+)
+
 plugin.methods.register_function(
     function=q2_protein_pca.map_positions,
     inputs={'aligned_sequences': FeatureData[AlignedProteinSequence]},
@@ -104,16 +371,58 @@ plugin.methods.register_function(
 plugin.visualizers.register_function(
     function=q2_protein_pca.plot_loadings,
     inputs={'pca_loadings': PCoAResults,
-            'positions_mapping': FeatureData[PositionMapping]},
-    parameters={'pdb_id': Str, 'nterm_offset': Int % Range(0, None)},
+            'positions_mapping': FeatureData[PositionMapping],
+            'loading_intervals': FeatureData[LoadingIntervals],
+            'position_scores': FeatureData[PositionScores]},
+    parameters={'pdb_id': Str, 'nterm_offset': Int % Range(0, None),
+                'lod_threshold': Int % Range(0, None),
+                'lod_bins': Int % Range(2, None),
+                'renderer': Str % Choices(['canvas', 'svg']),
+                'pdb_file': Str, 'pdb_cache_dir': Str},
     input_descriptions={'pca_loadings': 'PCA loadings.',
-                        'positions_mapping': 'Amino acid positions mapping.'},
+                        'positions_mapping': 'Amino acid positions mapping.',
+                        'loading_intervals': 'Bootstrap intervals of the '
+                                             'loadings (see `pca-bootstrap`) '
+                                             'to draw as error bars.',
+                        'position_scores': 'Entropy and conservation scores '
+                                           '(see `score-positions`) the '
+                                           'positions can be coloured by.'},
     parameter_descriptions={'pdb_id': 'PDB ID of the protein structure to '
                                       'display conserved positions on.',
                             'nterm_offset': 'Number of the amino acids that'
                                             'are missing from the N-terminus'
                                             'of the PDB structure. Defaults'
-                                            'to 1.'},
+                                            'to 1.',
+                            'lod_threshold': 'Maximum number of positions '
+                                             'drawn as individual points. '
+                                             'Wider alignments are shown as '
+                                             'a binned density grid until '
+                                             'the plot is zoomed in far '
+                                             'enough.',
+                            'lod_bins': 'Number of bins along each axis of '
+                                        'the density grid.',
+                            'renderer': 'Vega renderer used to draw the '
+                                        'plot.',
+                            'pdb_file': 'Local protein structure file (PDB '
+                                        'or mmCIF, optionally gzipped) to '
+                                        'display conserved positions on. '
+                                        'The structure is bundled with the '
+                                        'visualization instead of being '
+                                        'downloaded from PDBe. As a file '
+                                        'path, it is not tracked in '
+                                        'provenance; only its file name and '
+                                        'SHA-256 checksum are shown in the '
+                                        'visualization.',
+                            'pdb_cache_dir': 'Directory with local copies '
+                                             'of PDB entries (e.g. '
+                                             'pdb2trx.ent.gz or 2trx.cif) '
+                                             'in which the structure given '
+                                             'by pdb_id is looked up and '
+                                             'bundled with the '
+                                             'visualization. As with '
+                                             'pdb_file, the structure is not '
+                                             'tracked in provenance; only '
+                                             'its checksum is shown.'},
     name='PCA loadings plot',
     description=(
         'Visualise principal component loadings to find which positions '
@@ -122,14 +431,51 @@ plugin.visualizers.register_function(
         'least conserved within a protein sequence.')
 )
 
+plugin.visualizers.register_function(
+    function=q2_protein_pca.plot_scores,
+    inputs={'pca_scores': PCoAResults},
+    parameters={'metadata': MetadataColumn[Categorical | Numeric],
+                'x_component': Int % Range(1, None),
+                'y_component': Int % Range(1, None)},
+    input_descriptions={'pca_scores': 'PCA scores.'},
+    parameter_descriptions={'metadata': 'Metadata column used to colour '
+                                        'the sequences.',
+                            'x_component': 'Principal component shown on '
+                                           'the x axis.',
+                            'y_component': 'Principal component shown on '
+                                           'the y axis.'},
+    name='PCA scores plot',
+    description=(
+        'Visualise principal component scores of the protein sequences, '
+        'optionally coloured by a metadata column. Scores are stored in '
+        'binary chunks together with a spatial grid index, so that only '
+        'the sequences within the current view are drawn - the plot stays '
+        'responsive with hundreds of thousands of sequences.')
+)
+
 # Registrations
 plugin.register_formats(PositionMappingFormat, PositionMappingDirectoryFormat)
 plugin.register_formats(
     RankedProteinAlignmentFormat,
     RankedProteinAlignmentDirectoryFormat)
+plugin.register_formats(OccurrenceCountsFormat, RankingStateDirectoryFormat)
+plugin.register_formats(PCAModelFormat, PCAModelDirectoryFormat)
+plugin.register_formats(
+    LoadingIntervalsFormat, LoadingIntervalsDirectoryFormat)
+plugin.register_formats(
+    AlignmentFilterReportFormat, AlignmentFilterReportDirectoryFormat)
+plugin.register_formats(PositionScoresFormat, PositionScoresDirectoryFormat)
+plugin.register_formats(
+    PositionProfileFormat, PositionProfileDirectoryFormat)
 
 plugin.register_semantic_types(PositionMapping)
 plugin.register_semantic_types(RankedProteinAlignment)
+plugin.register_semantic_types(RankingState)
+plugin.register_semantic_types(PCAModel)
+plugin.register_semantic_types(LoadingIntervals)
+plugin.register_semantic_types(AlignmentFilterReport)
+plugin.register_semantic_types(PositionScores)
+plugin.register_semantic_types(PositionProfile)
 
 plugin.register_semantic_type_to_format(
     FeatureData[PositionMapping],
@@ -137,5 +483,21 @@ plugin.register_semantic_type_to_format(
 plugin.register_semantic_type_to_format(
     FeatureData[RankedProteinAlignment],
     artifact_format=RankedProteinAlignmentDirectoryFormat)
+plugin.register_semantic_type_to_format(
+    RankingState, artifact_format=RankingStateDirectoryFormat)
+plugin.register_semantic_type_to_format(
+    PCAModel, artifact_format=PCAModelDirectoryFormat)
+plugin.register_semantic_type_to_format(
+    FeatureData[LoadingIntervals],
+    artifact_format=LoadingIntervalsDirectoryFormat)
+plugin.register_semantic_type_to_format(
+    AlignmentFilterReport,
+    artifact_format=AlignmentFilterReportDirectoryFormat)
+plugin.register_semantic_type_to_format(
+    FeatureData[PositionScores],
+    artifact_format=PositionScoresDirectoryFormat)
+plugin.register_semantic_type_to_format(
+    FeatureData[PositionProfile],
+    artifact_format=PositionProfileDirectoryFormat)
 
 importlib.import_module('q2_protein_pca._transformer')
@@ -85,11 +85,9 @@ EXPECTED_SPEC = {
                     'fill': {'value': '#d62728'},
                     'opacity': {'value': 0.8}
                 },
-                'enter': {
-                    'x': {'scale': 'xScale', 'field': 'PC1'},
-                    'y': {'scale': 'yScale', 'field': 'PC2'}
-                },
                 'update': {
+                    'x': {'scale': 'xScale', 'field': 'PC1'},
+                    'y': {'scale': 'yScale', 'field': 'PC2'},
                     'fill': [
                         {
                             'test': "datum.euclid_dist / datum.max_distance <= (1 - conservationLevel / 100)",
@@ -0,0 +1,71 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_protein_pca import RankMatrix, pca_bootstrap
+from q2_protein_pca._pca import _pca
+
+
+class BootstrapTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(0)
+        # redundant sequences with a few variable positions
+        base = rng.integers(0, 6, (20, 30))
+        ranks = base[rng.integers(0, 20, 200)]
+        ranks[:, :5] = rng.integers(0, 6, (200, 5))
+        self.ranks = RankMatrix([f's{i}' for i in range(200)],
+                                [f'pos{i + 1}' for i in range(30)], ranks)
+
+    def test_pca_bootstrap(self):
+        obs = pca_bootstrap(self.ranks, n_replicates=50)
+
+        self.assertListEqual(
+            list(obs.columns),
+            ['PC1 lower', 'PC1 upper', 'PC2 lower', 'PC2 upper'])
+        self.assertListEqual(list(obs.index), list(self.ranks.positions))
+        self.assertEqual(obs.index.name, 'Position')
+        self.assertTrue((obs.iloc[:, ::2].values <=
+                         obs.iloc[:, 1::2].values).all())
+
+        # the loadings of all sequences mostly lie within the intervals
+        _, loadings, _ = _pca(self.ranks, 2)
+        lower, upper = obs.values[:, ::2], obs.values[:, 1::2]
+        inside = (lower <= loadings.samples.values) & \
+            (loadings.samples.values <= upper)
+        self.assertGreater(inside.mean(), 0.9)
+
+    def test_pca_bootstrap_confidence(self):
+        wide = pca_bootstrap(self.ranks, n_replicates=50, confidence=0.99)
+        narrow = pca_bootstrap(self.ranks, n_replicates=50, confidence=0.5)
+
+        self.assertTrue((wide['PC1 lower'] <= narrow['PC1 lower']).all())
+        self.assertTrue((wide['PC1 upper'] >= narrow['PC1 upper']).all())
+
+    def test_pca_bootstrap_parallel(self):
+        with patch('q2_protein_pca._bootstrap.REPLICATES_PER_TASK', 3):
+            exp = pca_bootstrap(self.ranks, n_replicates=10, n_jobs=1)
+            obs = pca_bootstrap(self.ranks, n_replicates=10, n_jobs=2)
+
+        pd.testing.assert_frame_equal(obs, exp)
+
+    def test_pca_bootstrap_seed(self):
+        exp = pca_bootstrap(self.ranks, n_replicates=10, random_seed=1)
+        obs = pca_bootstrap(self.ranks, n_replicates=10, random_seed=1)
+        other = pca_bootstrap(self.ranks, n_replicates=10, random_seed=2)
+
+        pd.testing.assert_frame_equal(obs, exp)
+        self.assertFalse(np.allclose(other, exp))
@@ -0,0 +1,101 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+from q2_types.feature_data import AlignedProteinFASTAFormat
+from q2_types.feature_data._transformer import AlignedProteinIterator
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_protein_pca import engine
+from q2_protein_pca._alignment import _map_positions
+from q2_protein_pca._pca import _pca
+from q2_protein_pca._ranking import (
+    _df_from_sequences, _encode_alignment, _rank_columns)
+
+
+class EngineTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.fasta_fp = self.get_data_path('aligned-protein-sequences-1.fasta')
+        self.alignment_df = _df_from_sequences(self._sequences())
+
+    def _sequences(self):
+        return AlignedProteinFASTAFormat(
+            self.fasta_fp, mode='r').view(AlignedProteinIterator)
+
+    def test_encode(self):
+        ids, matrix = engine.encode(self.fasta_fp)
+
+        self.assertListEqual(list(ids), list(self.alignment_df.index))
+        self.assertEqual(matrix.dtype, np.uint8)
+        np.testing.assert_array_equal(
+            matrix, _encode_alignment(self.alignment_df))
+
+    def test_rank(self):
+        _, matrix = engine.encode(self.fasta_fp)
+
+        obs = engine.rank(matrix)
+
+        self.assertEqual(obs.dtype, np.uint8)
+        np.testing.assert_array_equal(
+            obs, _rank_columns(self.alignment_df).to_numpy())
+        np.testing.assert_array_equal(
+            engine.rank(matrix, weighting='henikoff'),
+            _rank_columns(self.alignment_df, weighting='henikoff'))
+
+    def test_rank_weights(self):
+        _, matrix = engine.encode(self.fasta_fp)
+        weights = np.linspace(1, 2, len(matrix))
+
+        obs = engine.rank(matrix, weights=weights)
+
+        exp = _rank_columns(
+            self.alignment_df,
+            weights=pd.Series(weights, index=self.alignment_df.index))
+        np.testing.assert_array_equal(obs, exp.to_numpy())
+        with self.assertRaisesRegex(ValueError, 'Expected 20 sequence'):
+            engine.rank(matrix, weights=weights[:5])
+
+    def test_rank_invalid_matrix(self):
+        for matrix in (np.array([[0, 24]]), np.array([1, 2]),
+                       np.array([[0.5]])):
+            with self.assertRaisesRegex(ValueError, 'symbol codes'):
+                engine.rank(matrix)
+
+    def test_pca(self):
+        ranks_df = _rank_columns(self.alignment_df)
+
+        for deduplicate in (False, True):
+            scores, loadings, model = engine.pca(
+                ranks_df.to_numpy(), n_components=3, deduplicate=deduplicate)
+
+            exp_scores, exp_loadings, _ = _pca(
+                ranks_df, 3, deduplicate=deduplicate)
+            np.testing.assert_allclose(scores, exp_scores.samples.values)
+            np.testing.assert_allclose(loadings, exp_loadings.samples.values)
+            self.assertListEqual(list(model.positions),
+                                 list(ranks_df.columns))
+            np.testing.assert_allclose(
+                model.transform(ranks_df.to_numpy()), scores, atol=1e-10)
+
+    def test_map_positions(self):
+        _, matrix = engine.encode(self.fasta_fp)
+        matrix[0, :3] = 0
+
+        obs = engine.map_positions(matrix)
+
+        exp = _map_positions(self._sequences()).T.to_numpy(
+            dtype=np.float64, na_value=np.nan)
+        exp[0, :3] = np.nan
+        exp[0, 3:] = np.arange(6)
+        np.testing.assert_array_equal(
+            obs, np.nan_to_num(exp, nan=-1).astype(np.int64))
@@ -0,0 +1,86 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+
+import pandas as pd
+from q2_types.feature_data import AlignedProteinFASTAFormat
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_protein_pca import filter_alignment
+
+
+class FilterAlignmentTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def _alignment(self, content):
+        fp = os.path.join(self.temp_dir.name, 'alignment.fasta')
+        with open(fp, 'w') as fh:
+            fh.write(content)
+        return AlignedProteinFASTAFormat(fp, mode='r')
+
+    def setUp(self):
+        super().setUp()
+        self.sequences = self._alignment(
+            '>seq1 first sequence\nAC-D\nEF\n'
+            '>seq2\n-----A\n'
+            '>seq3\nACD-EF\n'
+            '>seq4\n---DEF\n')
+
+    def test_filter_alignment(self):
+        obs, report = filter_alignment(
+            self.sequences, max_sequence_gaps=0.5, max_position_gaps=0.5)
+
+        obs.validate()
+        with obs.open() as fh:
+            self.assertEqual(
+                fh.read(),
+                '>seq1 first sequence\nACDEF\n>seq3\nAC-EF\n>seq4\n--DEF\n')
+        exp_report = pd.DataFrame(
+            {'Kind': ['sequence', 'position'], 'Gap fraction': [5 / 6, .75]},
+            index=pd.Index(['sequence:seq2', 'position:pos3'], name='ID'))
+        pd.testing.assert_frame_equal(report, exp_report)
+
+    def test_filter_alignment_defaults(self):
+        obs, report = filter_alignment(self.sequences)
+
+        with obs.open() as fh:
+            self.assertEqual(
+                fh.read(),
+                '>seq1 first sequence\nAC-DEF\n>seq3\nACD-EF\n'
+                '>seq4\n---DEF\n')
+        self.assertListEqual(list(report.index), ['sequence:seq2'])
+
+    def test_filter_alignment_nothing_removed(self):
+        _, report = filter_alignment(
+            self.sequences, max_sequence_gaps=1, max_position_gaps=1)
+
+        self.assertEqual(len(report), 0)
+        self.assertListEqual(list(report.columns), ['Kind', 'Gap fraction'])
+
+    def test_filter_alignment_sequence_named_like_position(self):
+        _, report = filter_alignment(
+            self._alignment('>pos3\n----A\n>seq2\nAC-DE\n'),
+            max_sequence_gaps=0.5, max_position_gaps=0.5)
+
+        self.assertListEqual(list(report.index),
+                             ['sequence:pos3', 'position:pos3'])
+
+    def test_filter_alignment_everything_removed(self):
+        with self.assertRaisesRegex(ValueError, 'No sequences'):
+            filter_alignment(self.sequences, max_sequence_gaps=0)
+        with self.assertRaisesRegex(ValueError, 'No positions'):
+            filter_alignment(self._alignment('>seq1\nA-\n>seq2\n-A\n'),
+                             max_position_gaps=0.4)
+
+    def test_filter_alignment_not_aligned(self):
+        sequences = self._alignment('>seq1\nACD\n>seq2\nAC\n')
+
+        with self.assertRaisesRegex(ValueError, 'lengths 2, 3'):
+            filter_alignment(sequences)
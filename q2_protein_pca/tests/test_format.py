@@ -0,0 +1,363 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+from unittest.mock import patch
+
+import numpy as np
+from qiime2.core.exceptions import ValidationError
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_protein_pca._format import (
+    AlignmentFilterReportFormat, LoadingIntervalsFormat,
+    OccurrenceCountsFormat, PCAModelFormat, PositionMappingFormat,
+    PositionProfileFormat, PositionScoresFormat)
+
+
+class PositionMappingFormatTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def _format(self, content):
+        fp = os.path.join(self.temp_dir.name, 'mapping.csv')
+        with open(fp, 'w') as fh:
+            fh.write(content)
+        return PositionMappingFormat(fp, mode='r')
+
+    def test_valid(self):
+        for i in range(1, 4):
+            fp = self.get_data_path('positions-mapping-%s.csv' % i)
+            for level in ('min', 'max'):
+                PositionMappingFormat(fp, mode='r').validate(level=level)
+
+    def test_valid_across_chunks(self):
+        ff = self._format(
+            'Alignment position,seq0,seq1\n' +
+            ''.join('%s,%s,\n' % (i, i // 2) for i in range(100)))
+        ff.CHUNK_BYTES = 16
+
+        ff.validate(level='max')
+
+    def test_invalid_header(self):
+        ff = self._format('Position,seq0\n0,0\n')
+        with self.assertRaisesRegex(ValidationError, 'first header value'):
+            ff.validate()
+
+    def test_duplicate_sequence_ids(self):
+        ff = self._format('Alignment position,seq0,seq0\n0,0,0\n')
+        with self.assertRaisesRegex(ValidationError, 'unique'):
+            ff.validate()
+
+    def test_extra_values_with_invalid_position(self):
+        ff = self._format('Alignment position,a,b\n0,1,2,x\n')
+        with self.assertRaisesRegex(ValidationError, 'Found 4 values'):
+            ff.validate()
+
+    def test_header_only(self):
+        ff = self._format('Alignment position,seq0\n')
+        with self.assertRaisesRegex(ValidationError, 'one data record'):
+            ff.validate()
+
+    def test_wrong_number_of_values(self):
+        ff = self._format('Alignment position,seq0,seq1\n0,0,0\n1,1\n')
+        with self.assertRaisesRegex(ValidationError, 'line 3.*Found 2'):
+            ff.validate()
+
+    def test_non_integer_position(self):
+        ff = self._format('Alignment position,seq0,seq1\n0,0,\n1,1.5,0\n')
+        with self.assertRaisesRegex(
+                ValidationError, '"1.5" in column seq0 on line 3'):
+            ff.validate()
+
+    def test_negative_position(self):
+        ff = self._format('Alignment position,seq0,seq1\n0,0,-1\n')
+        with self.assertRaisesRegex(
+                ValidationError, '"-1" in column seq1 on line 2'):
+            ff.validate()
+
+    def test_missing_alignment_position(self):
+        ff = self._format('Alignment position,seq0\n0,0\n,1\n')
+        with self.assertRaisesRegex(
+                ValidationError, 'column Alignment position on line 3'):
+            ff.validate()
+
+    def test_decreasing_positions(self):
+        ff = self._format(
+            'Alignment position,seq0,seq1\n0,0,0\n1,,1\n2,3,\n3,2,2\n')
+        with self.assertRaisesRegex(
+                ValidationError, 'seq0 must not decrease.*2 after 3 on line'):
+            ff.validate()
+
+    def test_min_level_checks_first_records_only(self):
+        ff = self._format(
+            'Alignment position,seq0\n' +
+            ''.join('%s,%s\n' % (i, i) for i in range(10)) + '10,x\n')
+
+        ff.validate(level='min')
+        with self.assertRaisesRegex(ValidationError, '"x"'):
+            ff.validate(level='max')
+
+
+class OccurrenceCountsFormatTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def _format(self, content):
+        fp = os.path.join(self.temp_dir.name, 'occurrence-counts.csv')
+        with open(fp, 'w') as fh:
+            fh.write(content)
+        return OccurrenceCountsFormat(fp, mode='r')
+
+    def _header(self):
+        return ','.join(OccurrenceCountsFormat.HEADER) + '\n'
+
+    def test_valid(self):
+        ff = self._format(
+            self._header() +
+            ''.join('pos%s,%s\n' % (i, ','.join(['1'] * 24))
+                    for i in range(1, 4)))
+
+        ff.validate(level='max')
+
+    def test_invalid_header(self):
+        ff = self._format('Position,A,B\npos1,0,1\n')
+        with self.assertRaisesRegex(ValidationError, 'header must be'):
+            ff.validate()
+
+    def test_wrong_number_of_values(self):
+        ff = self._format(self._header() + 'pos1,1,2\n')
+        with self.assertRaisesRegex(ValidationError, 'line 2.*Found 3'):
+            ff.validate()
+
+    def test_negative_counts(self):
+        ff = self._format(
+            self._header() + 'pos1,-1,%s\n' % ','.join(['0'] * 23))
+        with self.assertRaisesRegex(ValidationError, 'non-negative'):
+            ff.validate()
+
+    def test_header_only(self):
+        ff = self._format(self._header())
+        with self.assertRaisesRegex(ValidationError, 'one data record'):
+            ff.validate()
+
+
+class AlignmentFilterReportFormatTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def _format(self, content):
+        fp = os.path.join(self.temp_dir.name, 'alignment-filter-report.csv')
+        with open(fp, 'w') as fh:
+            fh.write(content)
+        return AlignmentFilterReportFormat(fp, mode='r')
+
+    def test_valid(self):
+        ff = self._format('ID,Kind,Gap fraction\nsequence:seq2,sequence,0.9\n'
+                          'position:pos3,position,1.0\n')
+
+        ff.validate(level='max')
+
+    def test_header_only(self):
+        self._format('ID,Kind,Gap fraction\n').validate(level='max')
+
+    def test_invalid_header(self):
+        ff = self._format('ID,Gap fraction\nseq2,0.9\n')
+        with self.assertRaisesRegex(ValidationError, 'header must be'):
+            ff.validate()
+
+    def test_invalid_kind(self):
+        ff = self._format('ID,Kind,Gap fraction\ncolumn:seq2,column,0.9\n')
+        with self.assertRaisesRegex(ValidationError, 'line 2.*column'):
+            ff.validate()
+
+    def test_invalid_id(self):
+        ff = self._format('ID,Kind,Gap fraction\nseq2,sequence,0.9\n')
+        with self.assertRaisesRegex(ValidationError, 'line 2.*"sequence:"'):
+            ff.validate()
+
+    def test_invalid_fraction(self):
+        for fraction in ('1.5', 'a', ''):
+            ff = self._format(
+                'ID,Kind,Gap fraction\nsequence:seq2,sequence,%s\n'
+                % fraction)
+            with self.assertRaisesRegex(ValidationError, 'between 0 and 1'):
+                ff.validate()
+
+
+class PositionProfileFormatTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def _format(self, values):
+        fp = os.path.join(self.temp_dir.name, 'position-profile.csv')
+        with open(fp, 'w') as fh:
+            fh.write('Position,%s\n' % ','.join('-ABCDEFGHIKLMNPQRSTVWXYZ'))
+            for i, row in enumerate(values):
+                fh.write('pos%s,%s\n' % (i + 1, ','.join(row)))
+        return PositionProfileFormat(fp, mode='r')
+
+    def test_valid(self):
+        ff = self._format([['3', '1'] + ['0'] * 22,
+                           ['0.25', '0.75'] + ['0'] * 22])
+
+        ff.validate(level='max')
+
+    def test_header_only(self):
+        with self.assertRaisesRegex(ValidationError, 'one data record'):
+            self._format([]).validate()
+
+    def test_missing_symbol(self):
+        with self.assertRaisesRegex(ValidationError, 'line 2'):
+            self._format([['3'] * 23]).validate()
+
+    def test_invalid_values(self):
+        for value in ('-1', 'a', ''):
+            ff = self._format([[value] + ['0'] * 23])
+            with self.assertRaisesRegex(ValidationError, 'non-negative'):
+                ff.validate()
+
+
+class PositionScoresFormatTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def _format(self, content):
+        fp = os.path.join(self.temp_dir.name, 'position-scores.csv')
+        with open(fp, 'w') as fh:
+            fh.write(content)
+        return PositionScoresFormat(fp, mode='r')
+
+    def test_valid(self):
+        ff = self._format('Position,Entropy,Conservation\n'
+                          'pos1,0.0,1.0\npos2,1.58,0.41\n')
+
+        ff.validate(level='max')
+
+    def test_header_only(self):
+        ff = self._format('Position,Entropy,Conservation\n')
+        with self.assertRaisesRegex(ValidationError, 'one data record'):
+            ff.validate()
+
+    def test_invalid_header(self):
+        ff = self._format('Position,Conservation,Entropy\npos1,1.0,0.0\n')
+        with self.assertRaisesRegex(ValidationError, 'header must be'):
+            ff.validate()
+
+    def test_invalid_scores(self):
+        for scores in ('-0.1,0.5', 'a,0.5', '0.5,'):
+            ff = self._format(
+                'Position,Entropy,Conservation\npos1,%s\n' % scores)
+            with self.assertRaisesRegex(ValidationError, 'non-negative'):
+                ff.validate()
+
+
+class LoadingIntervalsFormatTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def _format(self, content):
+        fp = os.path.join(self.temp_dir.name, 'loading-intervals.csv')
+        with open(fp, 'w') as fh:
+            fh.write(content)
+        return LoadingIntervalsFormat(fp, mode='r')
+
+    def test_valid(self):
+        ff = self._format(
+            'Position,PC1 lower,PC1 upper,PC2 lower,PC2 upper\n'
+            'pos1,-0.5,0.1,0.2,0.3\n'
+            'pos2,0.0,0.0,-1e-3,2e-3\n')
+
+        ff.validate(level='max')
+
+    def test_invalid_header(self):
+        ff = self._format('Position,PC1 upper,PC1 lower\npos1,0.1,0.2\n')
+        with self.assertRaisesRegex(ValidationError, 'PC1 lower,PC1 upper'):
+            ff.validate()
+
+    def test_missing_bound(self):
+        ff = self._format('Position,PC1 lower,PC1 upper\npos1,0.1\n')
+        with self.assertRaisesRegex(ValidationError, 'exactly 2 bounds'):
+            ff.validate()
+
+    def test_not_numeric(self):
+        ff = self._format('Position,PC1 lower,PC1 upper\npos1,a,0.2\n')
+        with self.assertRaisesRegex(ValidationError, 'Could not parse'):
+            ff.validate()
+
+    def test_lower_exceeds_upper(self):
+        ff = self._format('Position,PC1 lower,PC1 upper\npos1,0.3,0.2\n')
+        with self.assertRaisesRegex(ValidationError, 'must not exceed'):
+            ff.validate()
+
+
+class PCAModelFormatTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def _format(self, **arrays):
+        fp = os.path.join(self.temp_dir.name, 'pca-model.npz')
+        with open(fp, 'wb') as fh:
+            np.savez(fh, **arrays)
+        return PCAModelFormat(fp, mode='r')
+
+    def _arrays(self):
+        return {'positions': np.array(['pos1', 'pos2', 'pos3']),
+                'mean': np.zeros(3), 'components': np.zeros((2, 3)),
+                'variance': np.ones(2), 'variance_ratio': np.ones(2) / 2}
+
+    def test_valid(self):
+        for level in ('min', 'max'):
+            self._format(**self._arrays()).validate(level=level)
+
+    def test_reads_headers_only(self):
+        ff = self._format(**self._arrays())
+
+        with patch('numpy.lib.format.read_array') as read_array, \
+                patch('numpy.load') as load:
+            ff.validate(level='max')
+        read_array.assert_not_called()
+        load.assert_not_called()
+
+    def test_not_npz(self):
+        fp = os.path.join(self.temp_dir.name, 'pca-model.npz')
+        with open(fp, 'w') as fh:
+            fh.write('mean,components\n')
+
+        with self.assertRaisesRegex(ValidationError, '.npz archive'):
+            PCAModelFormat(fp, mode='r').validate()
+
+    def test_missing_members(self):
+        arrays = self._arrays()
+        del arrays['mean'], arrays['variance']
+
+        with self.assertRaisesRegex(ValidationError, 'missing mean, variance'):
+            self._format(**arrays).validate()
+
+    def test_components_shape(self):
+        arrays = self._arrays()
+        arrays['components'] = np.zeros((3, 2))
+
+        ff = self._format(**arrays)
+
+        ff.validate(level='min')
+        with self.assertRaisesRegex(ValidationError, r'\(3, 2\)'):
+            ff.validate(level='max')
+
+    def test_member_dimensions(self):
+        arrays = self._arrays()
+        arrays['mean'] = np.zeros((1, 3))
+
+        with self.assertRaisesRegex(ValidationError, 'mean must have 1'):
+            self._format(**arrays).validate()
+
+    def test_object_member(self):
+        arrays = self._arrays()
+        arrays['positions'] = np.array(['pos1', 'pos2', 'pos3'], dtype=object)
+
+        with self.assertRaisesRegex(ValidationError, 'Python objects'):
+            self._format(**arrays).validate()
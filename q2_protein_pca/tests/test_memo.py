@@ -0,0 +1,149 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+import pandas as pd
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_protein_pca import (
+    RankMatrix, clear_cache, disable_cache, enable_cache)
+from q2_protein_pca._memo import _cache, memoize
+from q2_protein_pca._pca import _pca
+
+calls = []
+
+
+@memoize
+def _column_sums(ranks: RankMatrix, scale: int = 1) -> pd.Series:
+    calls.append(scale)
+    return pd.Series(ranks.ranks.sum(axis=0) * scale, index=ranks.positions)
+
+
+@memoize
+def _column_count(ranks: RankMatrix, token: object) -> int:
+    calls.append(token)
+    return ranks.shape[1]
+
+
+class MemoizeTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+        self.cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        self.ranks = RankMatrix(['seq1', 'seq2', 'seq3'],
+                                ['pos1', 'pos2', 'pos3'],
+                                [[1, 2, 0], [1, 1, 2], [2, 1, 1]])
+
+    def tearDown(self):
+        disable_cache()
+        super().tearDown()
+
+    def test_disabled(self):
+        _column_sums(self.ranks)
+        _column_sums(self.ranks)
+
+        self.assertListEqual(calls, [1, 1])
+
+    def test_memory(self):
+        enable_cache()
+        exp = _column_sums(self.ranks)
+        obs = _column_sums(RankMatrix(self.ranks.ids, self.ranks.positions,
+                                      self.ranks.ranks.copy()))
+
+        self.assertListEqual(calls, [1])
+        pd.testing.assert_series_equal(obs, exp)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_arguments_are_part_of_the_key(self):
+        enable_cache()
+        _column_sums(self.ranks)
+        _column_sums(self.ranks, scale=2)
+        _column_sums(RankMatrix(['seq1', 'seq2', 'seq4'],
+                                self.ranks.positions, self.ranks.ranks))
+        changed = self.ranks.ranks.copy()
+        changed[0, 0] = 0
+        _column_sums(RankMatrix(self.ranks.ids, self.ranks.positions,
+                                changed))
+
+        self.assertListEqual(calls, [1, 2, 1, 1])
+
+    def test_results_are_copies(self):
+        enable_cache()
+        _column_sums(self.ranks)['pos1'] = 100
+        obs = _column_sums(self.ranks)
+        obs['pos2'] = 100
+
+        self.assertEqual(_column_sums(self.ranks)['pos1'], 4)
+        self.assertEqual(_column_sums(self.ranks)['pos2'], 4)
+
+    def test_disk(self):
+        enable_cache(self.cache_dir)
+        exp = _column_sums(self.ranks)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        # a new process starts with an empty memory tier
+        _cache['memory'].clear()
+        obs = _column_sums(self.ranks)
+
+        self.assertListEqual(calls, [1])
+        pd.testing.assert_series_equal(obs, exp)
+
+        clear_cache()
+        self.assertListEqual(os.listdir(self.cache_dir), [])
+        _column_sums(self.ranks)
+        self.assertListEqual(calls, [1, 1])
+
+    def test_memory_limit(self):
+        enable_cache(memory_bytes=1)
+        _column_sums(self.ranks)
+        _column_sums(self.ranks)
+
+        self.assertListEqual(calls, [1, 1])
+
+    def test_disk_limit(self):
+        enable_cache(self.cache_dir, memory_bytes=0)
+        _column_sums(self.ranks, scale=1)
+        entry_size = os.path.getsize(
+            os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0]))
+        enable_cache(self.cache_dir, memory_bytes=0,
+                     disk_bytes=int(entry_size * 2.5))
+        _column_sums(self.ranks, scale=2)
+        _column_sums(self.ranks, scale=1)
+        _column_sums(self.ranks, scale=3)
+
+        # the least recently used entry (scale=2) was evicted
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        _column_sums(self.ranks, scale=1)
+        _column_sums(self.ranks, scale=3)
+        _column_sums(self.ranks, scale=2)
+        self.assertListEqual(calls, [1, 2, 3, 2])
+
+    def test_undigestable_arguments(self):
+        enable_cache()
+        _column_count(self.ranks, object())
+        _column_count(self.ranks, object())
+
+        self.assertEqual(len(calls), 2)
+
+    def test_pca(self):
+        enable_cache(self.cache_dir)
+        exp_scores, exp_loadings, exp_model = _pca(self.ranks, 2)
+        _cache['memory'].clear()
+        obs_scores, obs_loadings, obs_model = _pca(self.ranks, 2)
+
+        pd.testing.assert_frame_equal(obs_scores.samples, exp_scores.samples)
+        pd.testing.assert_frame_equal(obs_loadings.samples,
+                                      exp_loadings.samples)
+        np.testing.assert_array_equal(obs_model.components,
+                                      exp_model.components)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
@@ -6,13 +6,21 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+from unittest.mock import patch
+
+import numpy as np
+import numpy.testing as npt
 import pandas as pd
 import skbio
 from qiime2.plugin.testing import TestPluginBase
 from skbio import OrdinationResults
+from sklearn.decomposition import PCA
 
-from q2_protein_pca import pca
+from q2_protein_pca import pca, FittedPCA, RankMatrix
 from q2_protein_pca._format import RankedProteinAlignmentFormat
+from q2_protein_pca._pca import _pca, _eigen_pca, _project
+from q2_protein_pca._rank_matrix import _deduplicate_rows
+from q2_protein_pca._ranking import _ranking_state
 
 
 class PCATests(TestPluginBase):
@@ -43,7 +51,199 @@ class PCATests(TestPluginBase):
     def test_pca(self):
         input_ranks, expected_scores, expected_loadings = \
             self._prepare_sequences()
-        result_scores, result_loadings = pca(input_ranks)
+        result_scores, result_loadings, _ = pca(input_ranks)
+
+        self.assertEqual(str(result_scores), str(expected_scores))
+        self.assertEqual(str(result_loadings), str(expected_loadings))
+
+    def test_pca_rank_matrix(self):
+        _, expected_scores, expected_loadings = self._prepare_sequences()
+        input_ranks = RankedProteinAlignmentFormat(
+            self.get_data_path('aligned-protein-ranks-1.csv'),
+            mode='r').view(RankMatrix)
+
+        result_scores, result_loadings, _ = pca(input_ranks)
 
         self.assertEqual(str(result_scores), str(expected_scores))
         self.assertEqual(str(result_loadings), str(expected_loadings))
+
+    def test_deduplicate_rows(self):
+        matrix = np.array([[1, 2], [3, 4], [1, 2], [0, 0], [3, 4], [1, 2]],
+                          dtype=np.uint8)
+
+        unique, inverse, counts = _deduplicate_rows(matrix)
+
+        npt.assert_array_equal(unique, [[0, 0], [1, 2], [3, 4]])
+        npt.assert_array_equal(counts, [1, 3, 2])
+        npt.assert_array_equal(unique[inverse], matrix)
+
+    def test_weighted_pca_matches_repeated_rows(self):
+        unique = np.array([[1, 0, 2], [2, 2, 1], [0, 1, 1], [3, 0, 0]])
+        counts = np.array([3, 1, 2, 4])
+        repeated = np.repeat(unique, counts, axis=0)
+
+        components, variance, variance_ratio, scores, _ = _eigen_pca(
+            unique, counts)
+        expected = PCA(svd_solver='full').fit(repeated)
+
+        npt.assert_allclose(components, expected.components_, atol=1e-10)
+        npt.assert_allclose(variance, expected.explained_variance_)
+        npt.assert_allclose(
+            variance_ratio, expected.explained_variance_ratio_)
+        npt.assert_allclose(np.repeat(scores, counts, axis=0),
+                            expected.transform(repeated), atol=1e-10)
+
+    def test_weighted_pca_zero_weights(self):
+        rng = np.random.default_rng(0)
+        # covariance and Gram matrix paths
+        for shape in ((40, 6), (10, 30)):
+            data = rng.integers(0, 20, shape).astype(np.uint8)
+            weights = rng.integers(0, 3, shape[0])
+            weights[:2] = 0, 1
+            drawn = np.flatnonzero(weights)
+
+            obs = _eigen_pca(data, weights, 4)
+            exp = _eigen_pca(data[drawn], weights[drawn], 4)
+
+            for o, e in zip(obs[:3] + obs[4:], exp[:3] + exp[4:]):
+                npt.assert_allclose(o, e, atol=1e-10)
+            npt.assert_allclose(obs[3][drawn], exp[3], atol=1e-10)
+            # rows of zero weight are projected
+            npt.assert_allclose(obs[3][0], (data[0] - exp[4]) @ exp[0].T,
+                                atol=1e-10)
+
+    def _assert_matches_sklearn(self, data, n_components):
+        components, variance, variance_ratio, scores, _ = _eigen_pca(
+            data, n_components=n_components)
+        expected = PCA(n_components, svd_solver='full').fit(data)
+
+        npt.assert_allclose(components, expected.components_, atol=1e-8)
+        npt.assert_allclose(variance, expected.explained_variance_)
+        npt.assert_allclose(
+            variance_ratio, expected.explained_variance_ratio_)
+        npt.assert_allclose(scores, expected.transform(data), atol=1e-8)
+
+    def test_eigen_pca_covariance(self):
+        # more sequences than positions
+        data = np.random.default_rng(0).integers(0, 20, (60, 8))
+        self._assert_matches_sklearn(data.astype(np.uint8), None)
+        self._assert_matches_sklearn(data.astype(np.uint8), 3)
+
+    def test_eigen_pca_gram(self):
+        # more positions than sequences
+        data = np.random.default_rng(0).integers(0, 20, (8, 60))
+        self._assert_matches_sklearn(data.astype(np.uint8), 7)
+        self._assert_matches_sklearn(data.astype(np.uint8), 3)
+
+    def test_eigen_pca_blocks(self):
+        data = np.random.default_rng(0).integers(0, 20, (30, 12))
+        expected = _eigen_pca(data, n_components=5) + \
+            _eigen_pca(data.T, n_components=5)
+
+        with patch('q2_protein_pca._pca.PCA_BLOCK_CELLS', 16):
+            observed = _eigen_pca(data, n_components=5) + \
+                _eigen_pca(data.T, n_components=5)
+
+        for obs, exp in zip(observed, expected):
+            npt.assert_allclose(obs, exp, atol=1e-10)
+
+    def test_eigen_pca_too_many_components(self):
+        with self.assertRaisesRegex(ValueError, 'n_components=4'):
+            _eigen_pca(np.eye(3), np.ones(3, dtype=int), 4)
+
+    def test_pca_deduplicate(self):
+        input_ranks, _, _ = self._prepare_sequences()
+        # every other sequence repeated three more times, under new IDs
+        input_ranks = pd.concat([input_ranks] + [
+            input_ranks.iloc[::2].rename(index=lambda x: f'{x}-copy{i}')
+            for i in range(3)])
+
+        exp_scores, exp_loadings, _ = _pca(input_ranks, 5)
+        obs_scores, obs_loadings, _ = _pca(
+            input_ranks, 5, deduplicate=True)
+
+        npt.assert_allclose(obs_scores.samples, exp_scores.samples,
+                            atol=1e-10)
+        npt.assert_allclose(obs_loadings.samples, exp_loadings.samples,
+                            atol=1e-10)
+        npt.assert_allclose(obs_scores.eigvals, exp_scores.eigvals)
+        npt.assert_allclose(obs_scores.proportion_explained,
+                            exp_scores.proportion_explained)
+        pd.testing.assert_index_equal(obs_scores.samples.index,
+                                      exp_scores.samples.index)
+
+    def _alignment(self):
+        return pd.DataFrame({"pos1": ["A", "A", "B", "A", "C"],
+                             "pos2": ["C", "D", "D", "D", "-"],
+                             "pos3": ["E", "E", "E", "F", "F"]},
+                            index=["s0", "s1", "s2", "s3", "s4"])
+
+    def test_pca_model(self):
+        input_ranks, _, _ = self._prepare_sequences()
+
+        scores, _, model = _pca(input_ranks, 3)
+
+        self.assertIsInstance(model, FittedPCA)
+        self.assertEqual(model.n_components, 3)
+        self.assertIsNone(model.symbol_ranks)
+        self.assertEqual(list(model.positions), list(input_ranks.columns))
+        npt.assert_allclose(model.mean, input_ranks.mean())
+        npt.assert_allclose(model.variance, scores.eigvals)
+        npt.assert_allclose(model.transform(input_ranks.to_numpy()),
+                            scores.samples, atol=1e-10)
+
+    def test_pca_model_inverse_transform(self):
+        input_ranks, _, _ = self._prepare_sequences()
+
+        scores, _, model = _pca(input_ranks)
+
+        npt.assert_allclose(model.inverse_transform(scores.samples),
+                            input_ranks, atol=1e-10)
+
+    def test_project(self):
+        alignment_df = self._alignment()
+        state = _ranking_state(alignment_df)
+
+        for deduplicate in (False, True):
+            scores, _, model = _pca(state.matrix, 2, deduplicate, state)
+
+            npt.assert_allclose(_project(model, alignment_df),
+                                scores.samples, atol=1e-10)
+
+    def test_project_ranks_by_reference(self):
+        state = _ranking_state(self._alignment())
+        _, _, model = _pca(state.matrix, 2, ranking_state=state)
+        new_seqs = pd.DataFrame({"pos1": ["B", "W"], "pos2": ["C", "D"],
+                                 "pos3": ["F", "E"]}, index=["n0", "n1"])
+
+        # ranked by the reference counts; W does not occur in it at all
+        exp_ranks = np.array([[2, 1, 1], [0, 2, 2]])
+        npt.assert_allclose(_project(model, new_seqs),
+                            model.transform(exp_ranks))
+
+    def test_pca_ranking_state_mismatch(self):
+        alignment_df = self._alignment()
+        state = _ranking_state(alignment_df)
+        other_ranks = state.matrix.ranks.copy()
+        other_ranks[0, 0] = 0
+
+        for ranks in (_ranking_state(alignment_df.iloc[::-1]).matrix,
+                      _ranking_state(alignment_df.iloc[:, :2]).matrix,
+                      RankMatrix(state.matrix.ids, state.matrix.positions,
+                                 other_ranks)):
+            with self.assertRaisesRegex(ValueError, 'same sequences'):
+                _pca(ranks, 2, ranking_state=state)
+
+    def test_project_without_symbol_ranks(self):
+        state = _ranking_state(self._alignment())
+        _, _, model = _pca(state.matrix, 2)
+
+        with self.assertRaisesRegex(ValueError, 'ranking state'):
+            _project(model, self._alignment())
+
+    def test_project_different_positions(self):
+        state = _ranking_state(self._alignment())
+        _, _, model = _pca(state.matrix, 2, ranking_state=state)
+
+        with self.assertRaisesRegex(ValueError, '2 positions.*fitted to 3'):
+            _project(model, self._alignment().iloc[:, :2])
@@ -5,10 +5,22 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import gzip
+import hashlib
 import json
+import os
 
+import numpy as np
 import pandas as pd
-from q2_protein_pca._plot import _generate_spec
+import skbio
+from skbio import OrdinationResults
+
+from q2_protein_pca import plot_loadings
+from q2_protein_pca._format import PositionMappingFormat
+from q2_protein_pca._plot import (
+    _bin_loadings, _bundle_structure, _conservation_index, _encode_array,
+    _find_cached_structure, _generate_spec, _interval_bounds, _score_values,
+    _structure_format)
 from qiime2.plugin.testing import TestPluginBase
 
 from q2_protein_pca.tests.data.expected_spec import (EXPECTED_SPEC,
@@ -47,3 +59,274 @@ class PlotTests(TestPluginBase):
         self.maxDiff = None
         self.assertDictEqual(obs_spec, EXPECTED_SPEC_WITH_NANS)
         json.dumps(obs_spec)
+
+    def test_generate_spec_components_positions_on_update(self):
+        plot_data, sequence_ids = self._prepare_data()
+        plot_data = plot_data.rename(columns={'PC1': 'x', 'PC2': 'y'})
+
+        obs_spec = _generate_spec(plot_data, 'x', 'y', sequence_ids,
+                                  components=['PC1', 'PC2'])
+
+        # points must move when other components are selected
+        encode = obs_spec['marks'][0]['encode']
+        self.assertNotIn('enter', encode)
+        self.assertDictEqual(encode['update']['x'],
+                             {'scale': 'xScale', 'field': 'x'})
+        self.assertDictEqual(encode['update']['y'],
+                             {'scale': 'yScale', 'field': 'y'})
+
+    def test_bin_loadings(self):
+        plot_data, _ = self._prepare_data()
+        plot_data = plot_data.rename(columns={'max_dist': 'max_distance'})
+
+        obs_bins = _bin_loadings(plot_data, 'PC1', 'PC2', 2)
+        self.assertEqual(obs_bins['count'].sum(), 3)
+        self.assertListEqual(
+            list(obs_bins.columns),
+            ['x0', 'x1', 'y0', 'y1', 'count', 'min_rel_dist'])
+        # pos3 is the only position in the lower-left bin
+        lower_left = obs_bins[(obs_bins['x0'] == -0.5) &
+                              (obs_bins['y0'] == -0.1)]
+        self.assertEqual(lower_left['count'].item(), 1)
+        self.assertAlmostEqual(lower_left['min_rel_dist'].item(), 1.0)
+        np.testing.assert_array_less(obs_bins['x0'], obs_bins['x1'])
+
+    def test_generate_spec_lod(self):
+        plot_data, sequence_ids = self._prepare_data()
+        plot_data = plot_data.rename(columns={'max_dist': 'max_distance'})
+        bins = _bin_loadings(plot_data, 'PC1', 'PC2', 2)
+
+        obs_spec = _generate_spec(
+            plot_data, 'PC1', 'PC2', sequence_ids, bins=bins,
+            lod_threshold=2)
+        json.dumps(obs_spec)
+
+        data = {d['name']: d for d in obs_spec['data']}
+        self.assertSetEqual(set(data), {'values', 'visible', 'bins'})
+        self.assertEqual(len(data['bins']['values']), len(bins))
+        signals = {s['name']: s for s in obs_spec['signals']}
+        self.assertEqual(signals['lodThreshold']['value'], 2)
+        self.assertEqual(signals['nPositions']['value'], 3)
+        self.assertIn('lodActive', signals)
+        self.assertListEqual(
+            [m['from']['data'] for m in obs_spec['marks']],
+            ['bins', 'visible'])
+        self.assertDictEqual(
+            obs_spec['scales'][0]['domain'], {'signal': 'xdom'})
+
+    def test_generate_spec_lod_positions_on_update(self):
+        plot_data, sequence_ids = self._prepare_data()
+        plot_data = plot_data.rename(columns={'max_dist': 'max_distance'})
+        bins = _bin_loadings(plot_data, 'PC1', 'PC2', 2)
+
+        obs_spec = _generate_spec(
+            plot_data, 'PC1', 'PC2', sequence_ids, bins=bins,
+            lod_threshold=2)
+
+        # points and bins must follow the zoomed and panned scales
+        for mark, fields in zip(obs_spec['marks'],
+                                (('x0', 'y0'), ('PC1', 'PC2'))):
+            self.assertNotIn('enter', mark['encode'])
+            update = mark['encode']['update']
+            self.assertDictEqual(update['x'],
+                                 {'scale': 'xScale', 'field': fields[0]})
+            self.assertDictEqual(update['y'],
+                                 {'scale': 'yScale', 'field': fields[1]})
+
+    def test_conservation_index(self):
+        plot_data, _ = self._prepare_data()
+        plot_data = plot_data.rename(columns={'max_dist': 'max_distance'})
+        plot_data['euclid_dist'] = [0.26, 0, 0.05]
+
+        obs_order, obs_dist = _conservation_index(plot_data)
+        np.testing.assert_array_equal(obs_order, [1, 2, 0])
+        np.testing.assert_allclose(obs_dist, [0, 0.05 / 0.26, 1])
+
+    def test_encode_array(self):
+        obs = _encode_array([1, 2, 258], '<u4')
+        self.assertEqual(obs, 'AQAAAAIAAAACAQAA')
+
+    def _write_structure(self, name, compress=False):
+        fp = os.path.join(self.temp_dir.name, name)
+        opener = gzip.open if compress else open
+        with opener(fp, 'wb') as fh:
+            fh.write(b'HEADER    OXIDOREDUCTASE\nEND\n')
+        return fp
+
+    def test_structure_format(self):
+        self.assertTupleEqual(
+            _structure_format('/tmp/pdb2trx.ent.gz'), ('2trx', 'pdb'))
+        self.assertTupleEqual(
+            _structure_format('2TRX.cif'), ('2trx', 'mmcif'))
+        with self.assertRaisesRegex(ValueError, 'extension'):
+            _structure_format('2trx.txt')
+
+    def test_find_cached_structure(self):
+        exp_fp = self._write_structure('pdb2trx.ent.gz', compress=True)
+
+        self.assertEqual(
+            _find_cached_structure(self.temp_dir.name, '2TRX'), exp_fp)
+        self.assertIsNone(
+            _find_cached_structure(self.temp_dir.name, '1abc'))
+
+    def test_bundle_structure(self):
+        output_dir = os.path.join(self.temp_dir.name, 'viz')
+        os.mkdir(output_dir)
+
+        for fp in (self._write_structure('2trx.pdb'),
+                   self._write_structure('2trx.pdb.gz', compress=True)):
+            obs_name = _bundle_structure(output_dir, fp)
+            self.assertEqual(obs_name, 'structure.pdb.gz')
+            with gzip.open(os.path.join(output_dir, obs_name)) as fh:
+                self.assertEqual(fh.read(), b'HEADER    OXIDOREDUCTASE\nEND\n')
+
+    def test_generate_spec_components(self):
+        plot_data, sequence_ids = self._prepare_data()
+        plot_data = plot_data.rename(columns={'PC1': 'x', 'PC2': 'y'})
+
+        obs_spec = _generate_spec(
+            plot_data, 'x', 'y', sequence_ids,
+            components=['PC1', 'PC2', 'PC3'])
+        json.dumps(obs_spec)
+
+        signals = {s['name']: s for s in obs_spec['signals']}
+        self.assertEqual(signals['xComponent']['value'], 'PC1')
+        self.assertEqual(signals['yComponent']['value'], 'PC2')
+        self.assertListEqual(
+            signals['yComponent']['bind']['options'], ['PC1', 'PC2', 'PC3'])
+        self.assertDictEqual(
+            obs_spec['axes'][0]['title'], {'signal': 'xComponent'})
+        self.assertEqual(obs_spec['scales'][0]['domain']['field'], 'x')
+
+    def test_plot_loadings_all_components(self):
+        loadings = skbio.io.registry.read(
+            self.get_data_path('aligned-protein-pca-loadings-1.txt'),
+            into=OrdinationResults)
+        positions_mapping = PositionMappingFormat(
+            self.get_data_path('positions-mapping-1.csv'),
+            mode='r').view(pd.DataFrame)
+        output_dir = os.path.join(self.temp_dir.name, 'viz')
+        os.mkdir(output_dir)
+
+        plot_loadings(output_dir, loadings, positions_mapping)
+
+        self.assertTrue(
+            os.path.isfile(os.path.join(output_dir, 'index.html')))
+        obs_loadings = np.fromfile(
+            os.path.join(output_dir, 'loadings.bin'), dtype='<f4')
+        np.testing.assert_allclose(
+            obs_loadings.reshape(9, 9), loadings.samples.values.T,
+            rtol=1e-6, atol=1e-7)
+        obs_data = pd.read_csv(
+            os.path.join(output_dir, 'data.tsv'), sep='\t', index_col=0)
+        self.assertListEqual(
+            list(obs_data.columns[:11]),
+            [f'PC{i + 1}' for i in range(9)] +
+            ['euclid_dist', 'max_distance'])
+
+    def test_plot_loadings_structure_checksum(self):
+        loadings = skbio.io.registry.read(
+            self.get_data_path('aligned-protein-pca-loadings-1.txt'),
+            into=OrdinationResults)
+        positions_mapping = PositionMappingFormat(
+            self.get_data_path('positions-mapping-1.csv'),
+            mode='r').view(pd.DataFrame)
+        structure_fp = self._write_structure('pdb2trx.ent.gz', compress=True)
+        output_dir = os.path.join(self.temp_dir.name, 'viz')
+        os.mkdir(output_dir)
+
+        plot_loadings(output_dir, loadings, positions_mapping,
+                      pdb_file=structure_fp)
+
+        with open(structure_fp, 'rb') as fh:
+            exp = hashlib.sha256(fh.read()).hexdigest()
+        with open(os.path.join(output_dir, 'index.html')) as fh:
+            index = fh.read()
+        self.assertIn('pdb2trx.ent.gz (SHA-256: %s)' % exp, index)
+
+    def test_plot_loadings_intervals(self):
+        loadings = skbio.io.registry.read(
+            self.get_data_path('aligned-protein-pca-loadings-1.txt'),
+            into=OrdinationResults)
+        positions_mapping = PositionMappingFormat(
+            self.get_data_path('positions-mapping-1.csv'),
+            mode='r').view(pd.DataFrame)
+        intervals = pd.DataFrame(
+            {'PC1 lower': loadings.samples.iloc[:, 0] - .1,
+             'PC1 upper': loadings.samples.iloc[:, 0] + .1,
+             'PC2 lower': loadings.samples.iloc[:, 1] - .2,
+             'PC2 upper': loadings.samples.iloc[:, 1] + .2})
+        output_dir = os.path.join(self.temp_dir.name, 'viz')
+        os.mkdir(output_dir)
+
+        plot_loadings(output_dir, loadings, positions_mapping,
+                      loading_intervals=intervals)
+
+        obs_bounds = np.fromfile(
+            os.path.join(output_dir, 'intervals.bin'),
+            dtype='<f4').reshape(2, 9, 9)
+        np.testing.assert_allclose(
+            obs_bounds[:, :2], [intervals.iloc[:, [0, 2]].values.T,
+                                intervals.iloc[:, [1, 3]].values.T],
+            rtol=1e-6, atol=1e-7)
+        self.assertTrue(np.isnan(obs_bounds[:, 2:]).all())
+        obs_data = pd.read_csv(
+            os.path.join(output_dir, 'data.tsv'), sep='\t', index_col=0)
+        self.assertIn('PC1 lower', obs_data.columns)
+        self.assertIn('PC2 upper', obs_data.columns)
+
+    def test_plot_loadings_position_scores(self):
+        loadings = skbio.io.registry.read(
+            self.get_data_path('aligned-protein-pca-loadings-1.txt'),
+            into=OrdinationResults)
+        positions_mapping = PositionMappingFormat(
+            self.get_data_path('positions-mapping-1.csv'),
+            mode='r').view(pd.DataFrame)
+        scores = pd.DataFrame(
+            {'Entropy': np.linspace(0, 2, 9),
+             'Conservation': np.linspace(1, 0, 9)},
+            index=pd.Index(loadings.samples.index, name='Position'))
+        output_dir = os.path.join(self.temp_dir.name, 'viz')
+        os.mkdir(output_dir)
+
+        plot_loadings(output_dir, loadings, positions_mapping,
+                      position_scores=scores)
+
+        obs_data = pd.read_csv(
+            os.path.join(output_dir, 'data.tsv'), sep='\t', index_col=0)
+        np.testing.assert_allclose(obs_data['Entropy'], scores['Entropy'])
+        np.testing.assert_allclose(obs_data['Conservation'],
+                                   scores['Conservation'])
+
+    def test_generate_spec_scores(self):
+        data_df, sequence_ids = self._prepare_data()
+        scores = pd.DataFrame({'Entropy': [0., 1., 2.]})
+
+        spec = _generate_spec(data_df, 'PC1', 'PC2', sequence_ids,
+                              scores=scores)
+
+        signals = {signal['name']: signal for signal in spec['signals']}
+        self.assertListEqual(signals['colourBy']['bind']['options'],
+                             ['Conservation level', 'Entropy'])
+        self.assertEqual(signals['scoreDomains']['value'],
+                         {'Entropy': [0., 2.]})
+        fill = spec['marks'][-1]['encode']['update']['fill']
+        self.assertEqual(fill[0]['scale'], 'scoreColour')
+        self.assertIn("'Entropy': datum['Entropy']",
+                      spec['marks'][-1]['encode']['update']['tooltip'][
+                          'signal'])
+
+    def test_score_values_positions_mismatch(self):
+        loadings = pd.DataFrame({'PC1': [0., 1.]}, index=['pos1', 'pos2'])
+        scores = pd.DataFrame({'Entropy': [0.]}, index=['pos1'])
+
+        with self.assertRaisesRegex(ValueError, 'same positions'):
+            _score_values(scores, loadings)
+
+    def test_interval_bounds_positions_mismatch(self):
+        loadings = pd.DataFrame({'PC1': [0., 1.]}, index=['pos1', 'pos2'])
+        intervals = pd.DataFrame({'PC1 lower': [0.], 'PC1 upper': [1.]},
+                                 index=['pos1'])
+
+        with self.assertRaisesRegex(ValueError, 'same positions'):
+            _interval_bounds(intervals, loadings)
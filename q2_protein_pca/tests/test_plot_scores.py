@@ -0,0 +1,126 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+from skbio import OrdinationResults
+
+from q2_protein_pca import plot_scores
+from q2_protein_pca._plot import (
+    _encode_metadata_column, _grid_index, MISSING_CATEGORY)
+
+
+class PlotScoresTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.metadata = qiime2.Metadata.load(
+            self.get_data_path('thioredoxin-metadata.tsv'))
+        ids = self.metadata.ids
+        rng = np.random.default_rng(0)
+        self.scores = OrdinationResults(
+            short_method_name="PCA",
+            long_method_name="Principal Components Analysis",
+            eigvals=pd.Series([3.0, 2.0, 1.0]),
+            samples=pd.DataFrame(rng.normal(size=(len(ids), 3)), index=ids),
+            proportion_explained=pd.Series([0.5, 0.33, 0.17]))
+        self.output_dir = os.path.join(self.temp_dir.name, 'viz')
+        os.mkdir(self.output_dir)
+
+    def test_grid_index(self):
+        x = np.array([0.0, 1.0, 0.1, 0.9, 0.5])
+        y = np.array([0.0, 1.0, 0.9, 0.1, 0.5])
+
+        obs_order, obs_offsets, obs_extent = _grid_index(x, y, 2)
+        self.assertListEqual(obs_extent, [0.0, 1.0, 0.0, 1.0])
+        # cells: (0, 0), (0, 1), (1, 0), (1, 1)
+        np.testing.assert_array_equal(obs_offsets, [0, 1, 2, 3, 5])
+        np.testing.assert_array_equal(obs_order, [0, 2, 3, 1, 4])
+
+    def test_grid_index_single_point(self):
+        obs_order, obs_offsets, obs_extent = _grid_index(
+            np.array([1.0]), np.array([2.0]), 1)
+        self.assertListEqual(obs_extent, [0.5, 1.5, 1.5, 2.5])
+        np.testing.assert_array_equal(obs_offsets, [0, 1])
+
+    def test_encode_categorical_column(self):
+        column = self.metadata.get_column('domain')
+        ids = pd.Index(['AAF87085.1', 'AVB75452.1', 'unknown'])
+
+        obs_codes, obs_description = _encode_metadata_column(column, ids)
+        # only categories of the plotted sequences are listed
+        np.testing.assert_array_equal(obs_codes, [1, 0, MISSING_CATEGORY])
+        self.assertListEqual(
+            obs_description['categories'], ['Archaea', 'Eukarya'])
+        self.assertEqual(obs_description['name'], 'domain')
+
+    def test_encode_numeric_column(self):
+        column = qiime2.NumericMetadataColumn(pd.Series(
+            [1.5, 3.0], name='length',
+            index=pd.Index(['s1', 's2'], name='id')))
+
+        obs_values, obs_description = _encode_metadata_column(
+            column, pd.Index(['s2', 's3', 's1']))
+        np.testing.assert_array_equal(obs_values, [3.0, np.nan, 1.5])
+        self.assertEqual(obs_values.dtype, np.dtype('<f4'))
+        self.assertListEqual(obs_description['range'], [1.5, 3.0])
+
+    def test_plot_scores(self):
+        plot_scores(self.output_dir, self.scores,
+                    self.metadata.get_column('kingdom'), y_component=3)
+
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.output_dir, 'index.html')))
+        cells = np.fromfile(
+            os.path.join(self.output_dir, 'cells.bin'), dtype='<u4')
+        self.assertEqual(cells[-1], 22)
+        xy = np.fromfile(
+            os.path.join(self.output_dir, 'chunk-0.xy.bin'), dtype='<f4')
+        codes = np.fromfile(
+            os.path.join(self.output_dir, 'chunk-0.color.bin'), dtype='<u2')
+        with open(os.path.join(self.output_dir, 'chunk-0.ids.json')) as fh:
+            ids = json.load(fh)
+
+        self.assertSetEqual(set(ids), set(self.metadata.ids))
+        exp_xy = self.scores.samples.loc[ids].iloc[:, [0, 2]].values
+        np.testing.assert_allclose(xy.reshape(-1, 2), exp_xy, rtol=1e-6)
+        kingdoms = ['Animals', 'Archaebacteria', 'Eubacteria', 'Plants']
+        exp_codes = [kingdoms.index(x) for x in self.metadata.to_dataframe()
+                     .loc[ids, 'kingdom']]
+        np.testing.assert_array_equal(codes, exp_codes)
+
+    def test_plot_scores_markup_in_metadata(self):
+        ids = self.scores.samples.index
+        column = qiime2.CategoricalMetadataColumn(pd.Series(
+            [['</script><b>', 'a&b'][i % 2] for i in range(len(ids))],
+            name='<i>group</i>', index=pd.Index(ids, name='id')))
+
+        plot_scores(self.output_dir, self.scores, column)
+
+        with open(os.path.join(self.output_dir, 'index.html')) as fh:
+            html = fh.read()
+        self.assertNotIn('<b>', html)
+        self.assertNotIn('<i>', html)
+        # the manifest still parses to the original names
+        manifest = re.search(
+            r'<script id="manifest" type="application/json">(.*?)</script>',
+            html, re.DOTALL).group(1)
+        color = json.loads(manifest)['color']
+        self.assertEqual(color['name'], '<i>group</i>')
+        self.assertListEqual(color['categories'], ['</script><b>', 'a&b'])
+
+    def test_plot_scores_invalid_component(self):
+        with self.assertRaisesRegex(ValueError, 'Component 4'):
+            plot_scores(self.output_dir, self.scores, x_component=4)
@@ -0,0 +1,73 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_protein_pca import RankMatrix, SharedRankMatrix
+
+
+def _sum_ranks(matrix):
+    return matrix.name, list(matrix.positions), int(matrix.ranks.sum())
+
+
+class SharedRankMatrixTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def setUp(self):
+        super().setUp()
+        self.matrix = RankMatrix(
+            ['seq1', 'seq2', 'seq3'], ['pos1', 'pos2', 'pos3', 'pos4'],
+            np.arange(12).reshape(3, 4))
+
+    def test_from_rank_matrix(self):
+        with SharedRankMatrix.from_rank_matrix(self.matrix) as obs:
+            self.assertIsInstance(obs, RankMatrix)
+            np.testing.assert_array_equal(obs.ranks, self.matrix.ranks)
+            self.assertListEqual(list(obs.ids), list(self.matrix.ids))
+            self.assertListEqual(
+                list(obs.to_dataframe().columns), list(self.matrix.positions))
+
+    def test_pickle_maps_the_same_ranks(self):
+        with SharedRankMatrix.from_rank_matrix(self.matrix) as shared:
+            attached = pickle.loads(pickle.dumps(shared))
+            shared.ranks[0, 0] = 42
+
+            self.assertEqual(attached.name, shared.name)
+            self.assertEqual(attached.ranks[0, 0], 42)
+            self.assertListEqual(list(attached.ids), list(self.matrix.ids))
+            attached.close()
+
+    def test_pool_workers(self):
+        with SharedRankMatrix.from_rank_matrix(self.matrix) as shared:
+            for method in ('fork', 'spawn'):
+                with ProcessPoolExecutor(
+                        2, mp_context=get_context(method)) as pool:
+                    obs = list(pool.map(_sum_ranks, [shared] * 2))
+
+                self.assertListEqual(
+                    obs, [(shared.name, list(self.matrix.positions), 66)] * 2)
+
+    def test_close_frees_the_block(self):
+        shared = SharedRankMatrix.from_rank_matrix(self.matrix)
+        name = shared.name
+        shared.close()
+        shared.close()
+
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory(name=name)
+
+    def test_shape_mismatch(self):
+        with self.assertRaisesRegex(ValueError, 'does not match'):
+            SharedRankMatrix(['seq1'], ['pos1'], np.zeros((2, 1)))
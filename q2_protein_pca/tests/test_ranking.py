@@ -7,16 +7,22 @@
 # ----------------------------------------------------------------------------
 
 from itertools import islice
+import aln_ranking
+import numpy as np
 import pandas as pd
 import pandas.testing as pdt
 from q2_types.feature_data import AlignedProteinFASTAFormat
 from q2_types.feature_data._transformer import AlignedProteinIterator
 from qiime2.plugin.testing import TestPluginBase
 
-from q2_protein_pca import rank_alignment
+from q2_protein_pca import (
+    position_profile, rank_alignment, rank_alignments, score_positions)
 from q2_protein_pca._format import RankedProteinAlignmentFormat
 from q2_protein_pca._ranking import (
-    _get_occurrences, _df_from_sequences, _rank_columns)
+    _apply_symbol_ranks, _get_occurrences, _df_from_sequences,
+    _encode_alignment, _position_profile, _rank_and_score_columns,
+    _rank_columns, _ranking_state, _symbol_ranks, _update_ranks)
+from q2_protein_pca._weighting import _column_counts
 
 
 class RankingTests(TestPluginBase):
@@ -60,6 +66,126 @@ class RankingTests(TestPluginBase):
                                       index=["-", "A", "B", "C", "D"])
         pdt.assert_frame_equal(obs_occurences, exp_occurences)
 
+    def test_encode_alignment(self):
+        input_seqs = pd.DataFrame({"pos1": ["A", "-", "Z"],
+                                   "pos2": ["Y", "W", "B"]})
+
+        obs = _encode_alignment(input_seqs)
+
+        self.assertEqual(obs.dtype, np.uint8)
+        np.testing.assert_array_equal(obs, [[1, 22], [0, 20], [23, 2]])
+
+    def test_encode_alignment_unknown_characters(self):
+        input_seqs = pd.DataFrame({"pos1": ["A", "U"], "pos2": ["*", "A"]})
+
+        with self.assertRaisesRegex(ValueError, r'\*, U'):
+            _encode_alignment(input_seqs)
+
+    def test_rank_columns_duplicates(self):
+        input_seqs = pd.DataFrame({"pos1": ["A", "B", "A", "B", "B"],
+                                   "pos2": ["C", "C", "-", "C", "D"]},
+                                  index=["s0", "s1", "s2", "s3", "s4"])
+
+        obs_ranks = _rank_columns(input_seqs)
+        exp_ranks = pd.DataFrame({"pos1": [1, 2, 1, 2, 2],
+                                  "pos2": [2, 2, 0, 2, 1]},
+                                 index=["s0", "s1", "s2", "s3", "s4"],
+                                 dtype=np.uint8)
+        exp_ranks.index.name = "Sequence ID"
+        pdt.assert_frame_equal(obs_ranks, exp_ranks)
+
+    def test_rank_columns_henikoff(self):
+        input_seqs = pd.DataFrame(
+            {"pos1": ["A", "A", "A", "A", "B", "B"],
+             "pos2": ["C", "C", "C", "C", "D", "E"]},
+            index=["s0", "s1", "s2", "s3", "s4", "s5"])
+
+        obs_ranks = _rank_columns(input_seqs)
+        np.testing.assert_array_equal(obs_ranks["pos1"], [2, 2, 2, 2, 1, 1])
+
+        # the four redundant sequences weigh less than the two distinct ones
+        obs_ranks = _rank_columns(input_seqs, weighting='henikoff')
+        np.testing.assert_array_equal(obs_ranks["pos1"], [1, 1, 1, 1, 2, 2])
+
+    def test_rank_columns_metadata_weights(self):
+        input_seqs = pd.DataFrame({"pos1": ["A", "A", "B"]},
+                                  index=["s0", "s1", "s2"])
+        weights = pd.Series([1., 0.2, 0.2], index=["s2", "s1", "s0"])
+
+        obs_ranks = _rank_columns(input_seqs, weights=weights)
+
+        np.testing.assert_array_equal(obs_ranks["pos1"], [1, 1, 2])
+
+    def test_rank_columns_weights_and_weighting(self):
+        input_seqs = pd.DataFrame({"pos1": ["A", "B"]}, index=["s0", "s1"])
+        weights = pd.Series([1., 1.], index=["s0", "s1"])
+
+        with self.assertRaisesRegex(ValueError, 'not both'):
+            _rank_columns(input_seqs, weighting='identity', weights=weights)
+
+    def _random_alignment(self):
+        rng = np.random.default_rng(0)
+        encoded = rng.integers(0, 24, (300, 40)).astype(np.uint32)
+        encoded[:, :10] = rng.integers(0, 3, (300, 10))
+        # multiples of 1/4 sum exactly in any order, so ties stay ties
+        weights = rng.integers(0, 8, 300) / 4
+        return encoded, weights
+
+    def test_kernel_rank_sequences_weighted(self):
+        encoded, weights = self._random_alignment()
+
+        obs = aln_ranking.rank_sequences_weighted(encoded, weights)
+
+        exp = _apply_symbol_ranks(
+            encoded.astype(np.uint8),
+            _symbol_ranks(_column_counts(encoded, weights)))
+        np.testing.assert_array_equal(obs, exp)
+
+    def test_kernel_rank_sequences_weighted_zero_weights(self):
+        # C (3) only occurs in a sequence of zero weight
+        encoded = np.array([[1], [1], [1], [3]], dtype=np.uint32)
+        weights = np.array([1., 1., 1., 0.])
+
+        obs = aln_ranking.rank_sequences_weighted(encoded, weights)
+
+        np.testing.assert_array_equal(obs, [[1], [1], [1], [0]])
+        np.testing.assert_array_equal(obs, _apply_symbol_ranks(
+            encoded.astype(np.uint8),
+            _symbol_ranks(_column_counts(encoded, weights))))
+
+    def test_kernel_rank_sequences_weighted_weights_mismatch(self):
+        encoded, weights = self._random_alignment()
+
+        for wrong in (weights[:-1], np.append(weights, 1.)):
+            with self.assertRaisesRegex(ValueError, 'Expected 300 sequence'):
+                aln_ranking.rank_sequences_weighted(encoded, wrong)
+
+    def test_kernel_rank_and_score_sequences_weighted(self):
+        encoded, weights = self._random_alignment()
+
+        obs_ranks, obs_scores = aln_ranking.rank_and_score_sequences_weighted(
+            encoded, weights)
+
+        np.testing.assert_array_equal(
+            obs_ranks, aln_ranking.rank_sequences_weighted(encoded, weights))
+        residues = _column_counts(encoded, weights)[:, 1:]
+        totals = residues.sum(axis=1, keepdims=True)
+        freqs = residues / totals
+        with np.errstate(divide='ignore', invalid='ignore'):
+            entropy = -np.nansum(freqs * np.log2(freqs), axis=1)
+        conservation = (1 - entropy / np.log2(23)) * \
+            totals[:, 0] / weights.sum()
+        np.testing.assert_allclose(obs_scores[:, 0], entropy, atol=1e-12)
+        np.testing.assert_allclose(obs_scores[:, 1], conservation,
+                                   atol=1e-12)
+
+    def test_kernel_rank_and_score_sequences_weighted_weights_mismatch(self):
+        encoded, weights = self._random_alignment()
+
+        with self.assertRaisesRegex(ValueError, 'Expected 300 sequence'):
+            aln_ranking.rank_and_score_sequences_weighted(
+                encoded, weights[:-1])
+
     def test_rank_columns(self):
         input_seqs = pd.DataFrame({"pos1": ["A", "A", "A", "A"],
                                    "pos2": ["-", "B", "B", "D"],
@@ -72,11 +198,187 @@ class RankingTests(TestPluginBase):
                                   "pos2": [0, 2, 2, 1],
                                   "pos3": [2, 1, 2, 0],
                                   "pos4": [0, 1, 2, 0]},
-                                 index=["seq0", "seq1", "seq2", "seq3"])
+                                 index=["seq0", "seq1", "seq2", "seq3"],
+                                 dtype=np.uint8)
         exp_ranks.index.name = "Sequence ID"
         pdt.assert_frame_equal(obs_ranks, exp_ranks)
 
+    def test_rank_and_score_columns(self):
+        input_seqs = pd.DataFrame({"pos1": ["A", "A", "A", "A"],
+                                   "pos2": ["-", "B", "B", "D"],
+                                   "pos3": ["A", "C", "A", "-"],
+                                   "pos4": ["-", "D", "B", "-"]},
+                                  index=["seq0", "seq1", "seq2", "seq3"])
+
+        obs_ranks, obs_scores = _rank_and_score_columns(input_seqs)
+
+        pdt.assert_frame_equal(obs_ranks, _rank_columns(input_seqs))
+        self.assertListEqual(list(obs_scores.columns),
+                             ["Entropy", "Conservation"])
+        self.assertListEqual(list(obs_scores.index), list(input_seqs.columns))
+        # entropy over residues only; conservation is scaled down by the
+        # fraction of gaps
+        entropy = -(2 / 3 * np.log2(2 / 3) + 1 / 3 * np.log2(1 / 3))
+        np.testing.assert_allclose(
+            obs_scores["Entropy"], [0, entropy, entropy, 1])
+        np.testing.assert_allclose(
+            obs_scores["Conservation"],
+            [1, (1 - entropy / np.log2(23)) * 3 / 4,
+             (1 - entropy / np.log2(23)) * 3 / 4,
+             (1 - 1 / np.log2(23)) / 2])
+
+    def test_rank_and_score_columns_weights(self):
+        input_seqs = pd.DataFrame({"pos1": ["A", "A", "B", "-"]},
+                                  index=["s0", "s1", "s2", "s3"])
+        weights = pd.Series([1., 1., 2., 4.], index=["s0", "s1", "s2", "s3"])
+
+        _, obs_scores = _rank_and_score_columns(input_seqs, weights=weights)
+
+        # A and B weigh the same; the gap weighs half of the column
+        np.testing.assert_allclose(obs_scores["Entropy"], [1])
+        np.testing.assert_allclose(obs_scores["Conservation"],
+                                   [(1 - 1 / np.log2(23)) / 2])
+
+    def test_score_positions(self):
+        input_seqs, exp_ranks = self._prepare_sequences()
+
+        obs_scores = score_positions(input_seqs)
+
+        self.assertEqual(obs_scores.index.name, "Position")
+        self.assertListEqual(list(obs_scores.index), list(exp_ranks.columns))
+        self.assertTrue((obs_scores >= 0).all(axis=None))
+        self.assertTrue((obs_scores["Conservation"] <= 1).all())
+
+    def test_position_profile(self):
+        input_seqs = pd.DataFrame({"pos1": ["A", "A", "A", "C"],
+                                   "pos2": ["-", "-", "B", "D"]},
+                                  index=["s0", "s1", "s2", "s3"])
+
+        obs_profile, obs_consensus = _position_profile(
+            _encode_alignment(input_seqs), input_seqs.index)
+
+        self.assertEqual(obs_profile.shape, (2, 24))
+        self.assertListEqual(list(obs_profile.index), ["pos1", "pos2"])
+        self.assertEqual(obs_profile.index.name, "Position")
+        self.assertEqual(obs_profile.loc["pos1", "A"], 3)
+        self.assertEqual(obs_profile.loc["pos1", "C"], 1)
+        self.assertEqual(obs_profile.loc["pos2", "-"], 2)
+        np.testing.assert_array_equal(obs_profile.sum(axis=1), [4, 4])
+        # gaps can make up the consensus
+        self.assertEqual(obs_consensus, "A-")
+
+    def test_position_profile_frequencies_weights(self):
+        input_seqs = pd.DataFrame({"pos1": ["A", "A", "C"]},
+                                  index=["s0", "s1", "s2"])
+        weights = pd.Series([1., 1., 6.], index=["s0", "s1", "s2"])
+
+        obs_profile, obs_consensus = _position_profile(
+            _encode_alignment(input_seqs), input_seqs.index, weights=weights,
+            frequencies=True)
+
+        self.assertEqual(obs_profile.loc["pos1", "A"], .25)
+        self.assertEqual(obs_profile.loc["pos1", "C"], .75)
+        self.assertEqual(obs_consensus, "C")
+
+    def test_position_profile_action(self):
+        sequences = AlignedProteinFASTAFormat(
+            self.get_data_path('aligned-protein-sequences-1.fasta'),
+            mode='r')
+        exp_occurrences = _get_occurrences(
+            _df_from_sequences(sequences.view(AlignedProteinIterator)))
+
+        obs_profile, obs_consensus = position_profile(sequences)
+
+        pdt.assert_frame_equal(
+            obs_profile[exp_occurrences.index].T.astype(int),
+            exp_occurrences, check_names=False)
+        with obs_consensus.open() as fh:
+            # ties go to the earlier symbol
+            self.assertEqual(fh.read(), '>consensus\nAAAFFCDAA\n')
+
     def test_ranking(self):
         input_seqs, exp_ranks = self._prepare_sequences()
         obs_ranks = rank_alignment(input_seqs)
         pdt.assert_frame_equal(obs_ranks, exp_ranks)
+
+    def test_rank_alignments(self):
+        alignments = {
+            name: AlignedProteinFASTAFormat(
+                self.get_data_path(f'aligned-protein-sequences-{i}.fasta'),
+                mode='r')
+            for name, i in [('family1', 1), ('family2', 2), ('family3', 3)]}
+
+        for n_jobs in (1, 2):
+            obs = rank_alignments(alignments, n_jobs=n_jobs)
+
+            self.assertEqual(list(obs), ['family1', 'family2', 'family3'])
+            for name, alignment in alignments.items():
+                exp_ranks = rank_alignment(
+                    alignment.view(AlignedProteinIterator))
+                pdt.assert_frame_equal(obs[name].to_dataframe(), exp_ranks)
+
+    def test_symbol_ranks(self):
+        counts = np.zeros((2, 24), dtype=np.int64)
+        counts[0, :5] = [5, 3, 0, 3, 1]
+        counts[1, 0] = 4
+
+        obs = _symbol_ranks(counts)
+
+        self.assertEqual(obs.dtype, np.uint8)
+        np.testing.assert_array_equal(obs[0, :5], [0, 3, 0, 2, 1])
+        np.testing.assert_array_equal(obs[:, 5:], 0)
+        np.testing.assert_array_equal(obs[1], 0)
+
+    def test_ranking_state(self):
+        input_seqs, exp_ranks = self._prepare_sequences()
+        alignment_df = _df_from_sequences(input_seqs)
+
+        obs = _ranking_state(alignment_df)
+
+        pdt.assert_frame_equal(obs.matrix.to_dataframe(), exp_ranks)
+        np.testing.assert_array_equal(
+            obs.counts_to_dataframe().sum(axis=1), len(alignment_df))
+        self.assertEqual(obs.counts_to_dataframe().loc['pos1', 'A'], 10)
+
+    def test_update_ranks(self):
+        input_seqs, exp_ranks = self._prepare_sequences()
+        alignment_df = _df_from_sequences(input_seqs)
+        exp_state = _ranking_state(alignment_df)
+
+        obs = _ranking_state(alignment_df.iloc[:3])
+        for start, end in [(3, 4), (4, len(alignment_df))]:
+            obs = _update_ranks(obs, alignment_df.iloc[start:end])
+
+        pdt.assert_frame_equal(obs.matrix.to_dataframe(), exp_ranks)
+        np.testing.assert_array_equal(obs.counts, exp_state.counts)
+
+    def test_update_ranks_remaps_changed_positions(self):
+        input_seqs = pd.DataFrame({"pos1": ["A", "A", "B"],
+                                   "pos2": ["C", "C", "-"]},
+                                  index=["s0", "s1", "s2"])
+        new_seqs = pd.DataFrame({"pos1": ["B", "B"], "pos2": ["C", "D"]},
+                                index=["s3", "s4"])
+
+        obs = _update_ranks(_ranking_state(input_seqs), new_seqs)
+
+        exp_ranks = pd.DataFrame({"pos1": [1, 1, 2, 2, 2],
+                                  "pos2": [2, 2, 0, 2, 1]},
+                                 index=["s0", "s1", "s2", "s3", "s4"],
+                                 dtype=np.uint8)
+        exp_ranks.index.name = "Sequence ID"
+        pdt.assert_frame_equal(obs.matrix.to_dataframe(), exp_ranks)
+
+    def test_update_ranks_different_positions(self):
+        state = _ranking_state(pd.DataFrame({"pos1": ["A"], "pos2": ["C"]},
+                                            index=["s0"]))
+
+        with self.assertRaisesRegex(ValueError, '1 positions.*has 2'):
+            _update_ranks(state, pd.DataFrame({"pos1": ["A"]}, index=["s1"]))
+
+    def test_update_ranks_already_ranked(self):
+        state = _ranking_state(pd.DataFrame({"pos1": ["A", "B"]},
+                                            index=["s0", "s1"]))
+
+        with self.assertRaisesRegex(ValueError, '1 sequence.*s1'):
+            _update_ranks(state, pd.DataFrame({"pos1": ["A", "B"]},
+                                              index=["s1", "s2"]))
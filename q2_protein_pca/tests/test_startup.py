@@ -0,0 +1,98 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import importlib
+import inspect
+import json
+import subprocess
+import sys
+import textwrap
+
+from qiime2.plugin.testing import TestPluginBase
+
+import q2_protein_pca
+
+
+# seconds the plugin may add on top of importing qiime2 and q2-types
+IMPORT_BUDGET = 1.0
+
+HEAVY_MODULES = ['sklearn', 'q2templates', 'q2_alignment', 'aln_ranking']
+
+IMPLEMENTATIONS = {
+    'mafft': '_alignment',
+    'map_positions': '_alignment',
+    'filter_alignment': '_filter',
+    'rank_alignment': '_ranking',
+    'rank_alignments': '_ranking',
+    'score_positions': '_ranking',
+    'position_profile': '_ranking',
+    'create_ranking_state': '_ranking',
+    'update_ranks': '_ranking',
+    'pca': '_pca',
+    'project': '_pca',
+    'pca_bootstrap': '_bootstrap',
+    'plot_loadings': '_plot',
+    'plot_scores': '_plot',
+}
+
+
+class StartupTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def _import_plugin(self):
+        script = textwrap.dedent('''
+            import json
+            import sys
+            import time
+
+            import qiime2.plugin
+            import q2_types.feature_data
+            import q2_types.ordination
+
+            start = time.perf_counter()
+            import q2_protein_pca.plugin_setup
+            elapsed = time.perf_counter() - start
+
+            json.dump({'elapsed': elapsed, 'modules': list(sys.modules)},
+                      sys.stdout)
+        ''')
+        result = subprocess.run(
+            [sys.executable, '-c', script],
+            check=True, capture_output=True, text=True)
+        return json.loads(result.stdout)
+
+    def test_plugin_import_skips_heavy_modules(self):
+        modules = self._import_plugin()['modules']
+
+        for heavy in HEAVY_MODULES:
+            loaded = [m for m in modules
+                      if m == heavy or m.startswith(heavy + '.')]
+            self.assertEqual(loaded, [], heavy)
+
+    def test_plugin_import_within_budget(self):
+        # best of three to smooth out a cold file system cache
+        elapsed = min(self._import_plugin()['elapsed'] for _ in range(3))
+
+        self.assertLess(elapsed, IMPORT_BUDGET)
+
+    def test_shim_signatures_match_implementations(self):
+        # the shims are defined in _actions; classes and helpers such as
+        # enable_cache come from elsewhere
+        actions = [name for name in q2_protein_pca.__all__
+                   if getattr(q2_protein_pca, name).__module__ ==
+                   'q2_protein_pca._actions']
+        self.assertEqual(sorted(actions), sorted(IMPLEMENTATIONS))
+
+        for name, module in IMPLEMENTATIONS.items():
+            impl = getattr(
+                importlib.import_module('q2_protein_pca.' + module), name)
+            shim = getattr(q2_protein_pca, name)
+
+            self.assertEqual(
+                inspect.signature(shim), inspect.signature(impl), name)
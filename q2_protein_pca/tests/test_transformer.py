@@ -6,12 +6,19 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+from unittest.mock import patch
+
+import numpy as np
 import pandas as pd
 import pandas.util.testing as pdt
+import qiime2
 
 from qiime2.plugin.testing import TestPluginBase
+from q2_protein_pca import FittedPCA, OccurrenceRanks, RankMatrix
 from q2_protein_pca._format import (
-    RankedProteinAlignmentFormat, PositionMappingFormat)
+    AlignmentFilterReportFormat, LoadingIntervalsFormat, PCAModelFormat,
+    RankedProteinAlignmentFormat, PositionMappingFormat,
+    PositionProfileFormat, PositionScoresFormat, RankingStateDirectoryFormat)
 
 
 class TestTransformers(TestPluginBase):
@@ -24,7 +31,8 @@ class TestTransformers(TestPluginBase):
             [{'pos1': 2, 'pos2': 4, 'pos3': 2, 'pos4': 5},
              {'pos1': 2, 'pos2': 3, 'pos3': 1, 'pos4': 4},
              {'pos1': 2, 'pos2': 4, 'pos3': 2, 'pos4': 1}],
-            index=pd.Index(['seq0', 'seq1', 'seq2'], name='Sequence ID')
+            index=pd.Index(['seq0', 'seq1', 'seq2'], name='Sequence ID'),
+            dtype=np.uint8
         )
         self.position_map = pd.DataFrame(
             [{'seq0': 0, 'seq1': None, 'seq2': 0},
@@ -40,6 +48,33 @@ class TestTransformers(TestPluginBase):
         self.assertIsInstance(obs, pd.DataFrame)
         pdt.assert_frame_equal(obs, self.protein_seqs)
 
+    def test_ranked_aln_format_to_dataframe_numeric_ids(self):
+        ff = RankedProteinAlignmentFormat()
+        with ff.open() as fh:
+            fh.write('Sequence ID,pos1,pos2\n001,0,23\n2,1,2\n')
+        obs = self.get_transformer(
+            RankedProteinAlignmentFormat, pd.DataFrame)(ff)
+
+        exp = pd.DataFrame(
+            [[0, 23], [1, 2]], columns=['pos1', 'pos2'],
+            index=pd.Index(['001', '2'], name='Sequence ID'), dtype=np.uint8)
+        pdt.assert_frame_equal(obs, exp)
+
+    def test_ranked_aln_format_to_rank_matrix_na_like_ids(self):
+        ff = RankedProteinAlignmentFormat()
+        with ff.open() as fh:
+            fh.write('Sequence ID,pos1,pos2\nNA,0,23\nnull,1,2\n')
+        transformer = self.get_transformer(
+            RankedProteinAlignmentFormat, RankMatrix)
+
+        # with pyarrow, if installed, and with the pandas fallback
+        for modules in ({}, {'pyarrow': None}):
+            with patch.dict('sys.modules', modules):
+                obs = transformer(ff)
+
+            self.assertListEqual(list(obs.ids), ['NA', 'null'])
+            np.testing.assert_array_equal(obs.ranks, [[0, 23], [1, 2]])
+
     def test_dataframe_to_ranked_aln(self):
         transformer = self.get_transformer(
             pd.DataFrame, RankedProteinAlignmentFormat)
@@ -53,6 +88,246 @@ class TestTransformers(TestPluginBase):
         self.assertEqual(obs_lines[2], 'seq1,2,3,1,4\n')
         self.assertEqual(obs_lines[3], 'seq2,2,4,2,1\n')
 
+    def test_dataframe_to_ranked_aln_matches_pandas(self):
+        transformer = self.get_transformer(
+            pd.DataFrame, RankedProteinAlignmentFormat)
+        ranks = pd.DataFrame(
+            np.arange(24).reshape(4, 6), dtype=np.uint8,
+            columns=[f'pos{i + 1}' for i in range(6)],
+            index=pd.Index(['seq0', 'seq,1', 'seq "2"', 'seq\n3'],
+                           name='Sequence ID'))
+
+        obs = transformer(ranks)
+
+        with open(str(obs)) as fh:
+            self.assertEqual(fh.read(), ranks.to_csv())
+
+    def test_dataframe_to_ranked_aln_out_of_range(self):
+        transformer = self.get_transformer(
+            pd.DataFrame, RankedProteinAlignmentFormat)
+        ranks = self.protein_seqs.astype('int64')
+        ranks.iloc[1, 2] = 24
+
+        with self.assertRaisesRegex(ValueError, 'between 0 and 23'):
+            transformer(ranks)
+
+    def test_dataframe_to_ranked_aln_fractional(self):
+        transformer = self.get_transformer(
+            pd.DataFrame, RankedProteinAlignmentFormat)
+        ranks = self.protein_seqs.astype('float64')
+        ranks.iloc[1, 2] = 2.5
+
+        with self.assertRaisesRegex(ValueError, 'whole numbers'):
+            transformer(ranks)
+
+    def test_ranked_aln_format_to_rank_matrix(self):
+        _, obs = self.transform_format(
+            RankedProteinAlignmentFormat, RankMatrix, 'protein-ranks.csv')
+
+        self.assertIsInstance(obs, RankMatrix)
+        self.assertEqual(obs.ranks.dtype, np.uint8)
+        np.testing.assert_array_equal(obs.ranks, self.protein_seqs.values)
+        self.assertEqual(list(obs.ids), ['seq0', 'seq1', 'seq2'])
+        self.assertEqual(list(obs.positions), ['pos1', 'pos2', 'pos3', 'pos4'])
+        pdt.assert_frame_equal(obs.to_dataframe(), self.protein_seqs)
+
+    def test_ranked_aln_format_to_ndarray(self):
+        _, obs = self.transform_format(
+            RankedProteinAlignmentFormat, np.ndarray, 'protein-ranks.csv')
+
+        self.assertEqual(obs.dtype, np.uint8)
+        np.testing.assert_array_equal(obs, self.protein_seqs.values)
+
+    def test_rank_matrix_to_ranked_aln(self):
+        transformer = self.get_transformer(
+            RankMatrix, RankedProteinAlignmentFormat)
+
+        obs = transformer(RankMatrix.from_dataframe(self.protein_seqs))
+
+        with open(str(obs)) as fh:
+            self.assertEqual(fh.read(), self.protein_seqs.to_csv())
+
+    def test_rank_matrix_shape_mismatch(self):
+        with self.assertRaisesRegex(ValueError, r'\(3, 4\).*2 sequence IDs'):
+            RankMatrix(['seq0', 'seq1'], ['pos1', 'pos2', 'pos3', 'pos4'],
+                       self.protein_seqs.values)
+
+    def test_rank_matrix_invalid_ranks(self):
+        for ranks in ([[24]], [[-1]], [[256]], [[1.5]], [[np.nan]],
+                      np.array([[30]], dtype=np.uint8)):
+            with self.assertRaisesRegex(ValueError, 'between 0 and 23'):
+                RankMatrix(['seq0'], ['pos1'], ranks)
+
+    def test_ranking_state_round_trip(self):
+        counts = np.zeros((4, 24), dtype=np.int64)
+        counts[:, 1:4] = [[0, 3, 0], [0, 1, 2], [1, 2, 0], [1, 1, 1]]
+        state = OccurrenceRanks(
+            RankMatrix.from_dataframe(self.protein_seqs), counts)
+
+        ff = self.get_transformer(
+            OccurrenceRanks, RankingStateDirectoryFormat)(state)
+        ff.validate(level='max')
+        obs = self.get_transformer(
+            RankingStateDirectoryFormat, OccurrenceRanks)(ff)
+
+        pdt.assert_frame_equal(obs.matrix.to_dataframe(), self.protein_seqs)
+        self.assertEqual(obs.counts.dtype, np.int64)
+        np.testing.assert_array_equal(obs.counts, counts)
+
+    def test_occurrence_ranks_shape_mismatch(self):
+        with self.assertRaisesRegex(ValueError, r'\(4, 20\).*4 positions'):
+            OccurrenceRanks(RankMatrix.from_dataframe(self.protein_seqs),
+                            np.zeros((4, 20)))
+
+    def _pca_model(self, symbol_ranks=None):
+        rng = np.random.default_rng(0)
+        return FittedPCA(['pos1', 'pos2', 'pos3', 'pos4'], rng.random(4),
+                         rng.random((2, 4)), [2., 1.], [.5, .25],
+                         symbol_ranks)
+
+    def test_pca_model_round_trip(self):
+        symbol_ranks = np.zeros((4, 24), dtype=np.uint8)
+        symbol_ranks[:, 1:3] = [2, 1]
+
+        for model in (self._pca_model(), self._pca_model(symbol_ranks)):
+            ff = self.get_transformer(FittedPCA, PCAModelFormat)(model)
+            ff.validate(level='max')
+            obs = self.get_transformer(PCAModelFormat, FittedPCA)(ff)
+
+            for name in ('positions', 'mean', 'components', 'variance',
+                         'variance_ratio', 'symbol_ranks'):
+                np.testing.assert_array_equal(
+                    getattr(obs, name), getattr(model, name), name)
+
+    def test_pca_model_memory_mapped(self):
+        model = self._pca_model()
+        ff = self.get_transformer(FittedPCA, PCAModelFormat)(model)
+
+        obs = self.get_transformer(PCAModelFormat, FittedPCA)(ff)
+
+        self.assertFalse(obs.components.flags.writeable)
+        np.testing.assert_array_equal(obs.components, model.components)
+
+    def test_pca_model_compressed(self):
+        model = self._pca_model()
+        ff = PCAModelFormat()
+        with open(str(ff), 'wb') as fh:
+            np.savez_compressed(
+                fh, positions=model.positions, mean=model.mean,
+                components=model.components, variance=model.variance,
+                variance_ratio=model.variance_ratio)
+
+        obs = self.get_transformer(PCAModelFormat, FittedPCA)(ff)
+
+        np.testing.assert_array_equal(obs.components, model.components)
+        self.assertIsNone(obs.symbol_ranks)
+
+    def test_pca_model_shape_mismatch(self):
+        with self.assertRaisesRegex(ValueError, r'components of shape'):
+            FittedPCA(['pos1', 'pos2'], [0., 0.], np.zeros((2, 3)),
+                      [2., 1.], [.5, .25])
+
+    def test_loading_intervals_round_trip(self):
+        intervals = pd.DataFrame(
+            {'PC1 lower': [-.5, .1], 'PC1 upper': [.2, .3],
+             'PC2 lower': [0., -1.], 'PC2 upper': [0., 1.]},
+            index=pd.Index(['1', '2'], name='Position'))
+
+        ff = self.get_transformer(
+            pd.DataFrame, LoadingIntervalsFormat)(intervals)
+        ff.validate(level='max')
+        obs = self.get_transformer(LoadingIntervalsFormat, pd.DataFrame)(ff)
+
+        pdt.assert_frame_equal(obs, intervals)
+
+    def test_position_profile_round_trip(self):
+        profile = pd.DataFrame(
+            0., columns=list('-ABCDEFGHIKLMNPQRSTVWXYZ'),
+            index=pd.Index(['pos1', 'pos2'], name='Position'))
+        profile.loc['pos1', 'A'], profile.loc['pos2', 'C'] = 3., .125
+
+        ff = self.get_transformer(
+            pd.DataFrame, PositionProfileFormat)(profile)
+        ff.validate(level='max')
+        with ff.open() as fh:
+            self.assertIn('pos1,0,3,0', fh.read())
+        obs = self.get_transformer(PositionProfileFormat, pd.DataFrame)(ff)
+
+        pdt.assert_frame_equal(obs, profile)
+
+    def test_position_profile_round_trip_precision(self):
+        profile = pd.DataFrame(
+            0., columns=list('-ABCDEFGHIKLMNPQRSTVWXYZ'),
+            index=pd.Index(['pos1', 'pos2'], name='Position'))
+        profile.loc['pos1', 'A'], profile.loc['pos2', 'C'] = 123456789., .1
+        profile.loc['pos1', 'C'] = 1 / 3
+
+        ff = self.get_transformer(
+            pd.DataFrame, PositionProfileFormat)(profile)
+        with ff.open() as fh:
+            self.assertIn('pos1,0,123456789,', fh.read())
+        obs = self.get_transformer(PositionProfileFormat, pd.DataFrame)(ff)
+
+        pdt.assert_frame_equal(obs, profile, check_exact=True)
+
+    def test_position_scores_round_trip(self):
+        scores = pd.DataFrame(
+            {'Entropy': [0., 1.5], 'Conservation': [1., .25]},
+            index=pd.Index(['pos1', 'pos2'], name='Position'))
+
+        ff = self.get_transformer(pd.DataFrame, PositionScoresFormat)(scores)
+        ff.validate(level='max')
+        obs = self.get_transformer(PositionScoresFormat, pd.DataFrame)(ff)
+
+        pdt.assert_frame_equal(obs, scores)
+
+    def test_position_scores_to_metadata(self):
+        ff = self.get_transformer(pd.DataFrame, PositionScoresFormat)(
+            pd.DataFrame({'Entropy': [1.5], 'Conservation': [.25]},
+                         index=pd.Index(['pos2'], name='Position')))
+
+        obs = self.get_transformer(PositionScoresFormat, qiime2.Metadata)(ff)
+
+        self.assertEqual(
+            obs.get_column('Conservation').get_value('pos2'), .25)
+
+    def test_alignment_filter_report_round_trip(self):
+        report = pd.DataFrame(
+            {'Kind': ['sequence', 'position'], 'Gap fraction': [.9, 1.]},
+            index=pd.Index(['sequence:1', 'position:pos3'], name='ID'))
+
+        ff = self.get_transformer(
+            pd.DataFrame, AlignmentFilterReportFormat)(report)
+        ff.validate(level='max')
+        obs = self.get_transformer(
+            AlignmentFilterReportFormat, pd.DataFrame)(ff)
+
+        pdt.assert_frame_equal(obs, report)
+
+    def test_alignment_filter_report_to_metadata(self):
+        ff = self.get_transformer(
+            pd.DataFrame, AlignmentFilterReportFormat)(pd.DataFrame(
+                {'Kind': ['sequence', 'position'], 'Gap fraction': [.9, 1.]},
+                index=pd.Index(['sequence:pos3', 'position:pos3'],
+                               name='ID')))
+
+        obs = self.get_transformer(
+            AlignmentFilterReportFormat, qiime2.Metadata)(ff)
+
+        kinds = obs.get_column('Kind')
+        self.assertEqual(kinds.get_value('sequence:pos3'), 'sequence')
+        self.assertEqual(kinds.get_value('position:pos3'), 'position')
+
+    def test_empty_alignment_filter_report_to_metadata(self):
+        ff = self.get_transformer(
+            pd.DataFrame, AlignmentFilterReportFormat)(pd.DataFrame(
+                {'Kind': [], 'Gap fraction': []},
+                index=pd.Index([], name='ID')))
+
+        with self.assertRaisesRegex(ValueError, 'Nothing was removed'):
+            self.get_transformer(
+                AlignmentFilterReportFormat, qiime2.Metadata)(ff)
+
     def test_position_map_format_to_dataframe(self):
         _, obs = self.transform_format(
             PositionMappingFormat, pd.DataFrame, 'positions-mapping-3.csv')
@@ -0,0 +1,89 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2022, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_protein_pca._weighting import (
+    _henikoff_weights, _identity_weights, _metadata_weights)
+
+
+class WeightingTests(TestPluginBase):
+
+    package = 'q2_protein_pca.tests'
+
+    def test_henikoff_weights(self):
+        encoded = np.array([[1, 2], [1, 3], [1, 3]], dtype=np.uint8)
+
+        obs = _henikoff_weights(encoded, np.ones(3))
+
+        np.testing.assert_allclose(obs, [1.25, 0.875, 0.875])
+
+    def test_henikoff_weights_deduplicated(self):
+        encoded = np.array([[1, 2], [1, 3]], dtype=np.uint8)
+
+        obs = _henikoff_weights(encoded, np.array([1., 2.]))
+
+        np.testing.assert_allclose(obs, [1.25, 0.875])
+
+    def test_henikoff_weights_ignore_gaps(self):
+        encoded = np.array([[1, 0], [1, 3], [1, 3]], dtype=np.uint8)
+
+        obs = _henikoff_weights(encoded, np.ones(3))
+
+        np.testing.assert_allclose(obs, [0.5, 1.25, 1.25])
+
+    def test_identity_weights(self):
+        rng = np.random.default_rng(0)
+        encoded = rng.integers(0, 24, (50, 30)).astype(np.uint8)
+        encoded[10:20] = encoded[0]
+        encoded[20:25, :27] = encoded[1, :27]
+        identity = (encoded[:, np.newaxis] == encoded).mean(axis=2)
+        exp = 1 / (identity >= 0.9).sum(axis=1)
+
+        obs = _identity_weights(encoded, np.ones(50), 0.9)
+        np.testing.assert_allclose(obs, exp)
+
+        with patch('q2_protein_pca._weighting.IDENTITY_BLOCK_PAIRS', 7):
+            obs = _identity_weights(encoded, np.ones(50), 0.9)
+        np.testing.assert_allclose(obs, exp)
+
+    def test_identity_weights_deduplicated(self):
+        encoded = np.array([[1, 2], [1, 3]], dtype=np.uint8)
+
+        obs = _identity_weights(encoded, np.array([1., 2.]), 0.5)
+
+        np.testing.assert_allclose(obs, [1 / 3, 1 / 3])
+
+    def test_metadata_weights(self):
+        weights = pd.Series([2., 1., 0.5], index=['s3', 's1', 's2'])
+
+        obs = _metadata_weights(weights, pd.Index(['s1', 's2', 's3']))
+
+        np.testing.assert_array_equal(obs, [1., 0.5, 2.])
+
+    def test_metadata_weights_missing(self):
+        weights = pd.Series([1., np.nan], index=['s1', 's2'])
+
+        with self.assertRaisesRegex(ValueError, '2 sequence.*s2, s3'):
+            _metadata_weights(weights, pd.Index(['s1', 's2', 's3']))
+
+    def test_metadata_weights_negative(self):
+        weights = pd.Series([1., -1.], index=['s1', 's2'])
+
+        with self.assertRaisesRegex(ValueError, 'non-negative'):
+            _metadata_weights(weights, pd.Index(['s1', 's2']))
+
+    def test_metadata_weights_all_zero(self):
+        weights = pd.Series([0., 0.], index=['s1', 's2'])
+
+        with self.assertRaisesRegex(ValueError, 'not all zero'):
+            _metadata_weights(weights, pd.Index(['s1', 's2']))
@@ -1,8 +1,13 @@
 use ndarray::{Axis, Array2, ArrayView2, ArrayView1};
-use numpy::{IntoPyArray, PyReadonlyArray2, PyArray2};
+use numpy::{IntoPyArray, PyReadonlyArray1, PyReadonlyArray2, PyArray2};
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::{pymodule, PyModule, PyResult, Python};
+use std::cmp::Ordering;
 use std::collections::HashMap;
 
+// number of non-gap symbols residues are encoded with
+const N_RESIDUES: f64 = 23.0;
+
 
 #[pymodule]
 fn aln_ranking(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
@@ -18,14 +23,7 @@ fn aln_ranking(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
             .map(|occ| _convert_to_ranks(&occ))
             .collect();
 
-        let mut seq_ranked: Array2<u32> = Array2::from_elem(seq.raw_dim(), 0);
-        for (i, col) in seq.axis_iter(Axis(1)).enumerate() {
-            let current_ranks = &z[i];
-            for (j, elem) in col.iter().enumerate() {
-                seq_ranked[[j, i]] = current_ranks[elem];
-            }
-        }
-        seq_ranked
+        _apply_ranks(&seq, &z)
         }
 
         #[pyfn(m, "rank_sequences")]
@@ -35,10 +33,93 @@ fn aln_ranking(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
             rank_sequences(seq.as_array()).into_pyarray(py)
         }
 
+        #[pyfn(m, "rank_sequences_weighted")]
+        fn rank_sequences_weighted_py<'py>(
+            py: Python<'py>, seq: PyReadonlyArray2<'_, u32>,
+            weights: PyReadonlyArray1<'_, f64>
+        ) -> PyResult<&'py PyArray2<u32>> {
+            let (seq, weights) = (seq.as_array(), weights.as_array());
+            _check_weights(&seq, &weights)?;
+            Ok(rank_sequences_weighted(seq, weights).into_pyarray(py))
+        }
+
+        #[pyfn(m, "rank_and_score_sequences_weighted")]
+        fn rank_and_score_sequences_weighted_py<'py>(
+            py: Python<'py>, seq: PyReadonlyArray2<'_, u32>,
+            weights: PyReadonlyArray1<'_, f64>
+        ) -> PyResult<(&'py PyArray2<u32>, &'py PyArray2<f64>)> {
+            let (seq, weights) = (seq.as_array(), weights.as_array());
+            _check_weights(&seq, &weights)?;
+            let (ranks, scores) =
+                rank_and_score_sequences_weighted(seq, weights);
+            Ok((ranks.into_pyarray(py), scores.into_pyarray(py)))
+        }
+
         Ok(())
     }
 
 
+// Same as rank_sequences, but residues are counted with the weight of their
+// sequence (row), e.g. the number of identical sequences it stands for or a
+// redundancy-correcting sequence weight. There must be one weight per row
+// (see _check_weights). Residues only found in rows of zero weight are not
+// counted and get rank 0, like gaps.
+fn rank_sequences_weighted(
+    seq: ArrayView2<'_, u32>, weights: ArrayView1<'_, f64>
+) -> Array2<u32> {
+
+    let x: Vec<_> = seq.axis_iter(Axis(1))
+        .map(|col| _count_weighted_occurrences(&col, &weights))
+        .collect();
+    let y: Vec<_> = x.iter()
+        .map(|occ| _sort_occurrences(&occ))
+        .collect();
+    let z: Vec<_> = y.iter()
+        .map(|occ| _convert_to_ranks(&occ))
+        .collect();
+
+    _apply_ranks(&seq, &z)
+}
+
+// Same as rank_sequences_weighted, but also returns the Shannon entropy and
+// the gap-aware conservation (columns) of every position (rows), derived
+// from the same weighted occurrence counts as the ranks.
+fn rank_and_score_sequences_weighted(
+    seq: ArrayView2<'_, u32>, weights: ArrayView1<'_, f64>
+) -> (Array2<u32>, Array2<f64>) {
+
+    let total = weights.sum();
+    let x: Vec<_> = seq.axis_iter(Axis(1))
+        .map(|col| _count_weighted_occurrences(&col, &weights))
+        .collect();
+    let mut scores: Array2<f64> = Array2::zeros((x.len(), 2));
+    for (i, occ) in x.iter().enumerate() {
+        let (entropy, conservation) = _score_occurrences(&occ, total);
+        scores[[i, 0]] = entropy;
+        scores[[i, 1]] = conservation;
+    }
+    let y: Vec<_> = x.iter()
+        .map(|occ| _sort_occurrences(&occ))
+        .collect();
+    let z: Vec<_> = y.iter()
+        .map(|occ| _convert_to_ranks(&occ))
+        .collect();
+
+    (_apply_ranks(&seq, &z), scores)
+}
+
+// Rows without a weight would silently be left uncounted.
+fn _check_weights(
+    seq: &ArrayView2<u32>, weights: &ArrayView1<f64>
+) -> PyResult<()> {
+    if weights.len() != seq.nrows() {
+        return Err(PyValueError::new_err(format!(
+            "Expected {} sequence weights, found {}.",
+            seq.nrows(), weights.len())));
+    }
+    Ok(())
+}
+
 fn _count_occurrences(seq: &ArrayView1<u32>) -> HashMap<u32, u32> {
     let mut char_counts: HashMap<u32, u32> = HashMap::new();
 
@@ -50,15 +131,67 @@ fn _count_occurrences(seq: &ArrayView1<u32>) -> HashMap<u32, u32> {
     char_counts
 }
 
-fn _sort_occurrences(occur_map: &HashMap<u32, u32>) -> Vec<(&u32, &u32)> {
+fn _count_weighted_occurrences(
+    seq: &ArrayView1<u32>, weights: &ArrayView1<f64>
+) -> HashMap<u32, f64> {
+    let mut char_counts: HashMap<u32, f64> = HashMap::new();
+
+    for (&c, &w) in seq.iter().zip(weights.iter()) {
+        if c != 0 && w != 0.0 {
+            *char_counts.entry(c).or_insert(0.0) += w;
+        }
+    }
+    char_counts
+}
+
+// Shannon entropy (in bits) of the residue frequencies at a position, gaps
+// excluded, and its gap-aware conservation (Capra & Singh, 2007): one minus
+// the entropy relative to its maximum, scaled by the weighted fraction of
+// sequences without a gap at the position. Positions that are all gaps have
+// neither entropy nor conservation.
+fn _score_occurrences(
+    occur_map: &HashMap<u32, f64>, total: f64
+) -> (f64, f64) {
+    let residues: f64 = occur_map.values().sum();
+    if residues <= 0.0 || total <= 0.0 {
+        return (0.0, 0.0);
+    }
+    let entropy: f64 = occur_map.values()
+        .filter(|&&count| count > 0.0)
+        .map(|&count| {
+            let p = count / residues;
+            -p * p.log2()
+        })
+        .sum();
+    let conservation = (1.0 - entropy / N_RESIDUES.log2()) * residues / total;
+    (entropy.max(0.0), conservation.max(0.0))
+}
+
+fn _apply_ranks(
+    seq: &ArrayView2<u32>, ranks: &Vec<HashMap<u32, u32>>
+) -> Array2<u32> {
+    let mut seq_ranked: Array2<u32> = Array2::from_elem(seq.raw_dim(), 0);
+    for (i, col) in seq.axis_iter(Axis(1)).enumerate() {
+        let current_ranks = &ranks[i];
+        for (j, elem) in col.iter().enumerate() {
+            // residues that were not counted rank 0
+            seq_ranked[[j, i]] = current_ranks.get(elem).copied().unwrap_or(0);
+        }
+    }
+    seq_ranked
+}
+
+fn _sort_occurrences<T: PartialOrd>(
+    occur_map: &HashMap<u32, T>
+) -> Vec<(&u32, &T)> {
     let mut count_vec: Vec<_> = occur_map.iter().collect();
     count_vec.sort_by(|a, b| {
-        b.1.cmp(a.1).then(a.0.cmp(b.0))
+        b.1.partial_cmp(a.1).unwrap_or(Ordering::Equal).then(a.0.cmp(b.0))
     });
     count_vec
 }
 
-fn _convert_to_ranks(sorted_occurrs: &Vec<(&u32, &u32)>) -> HashMap<u32, u32> {
+fn _convert_to_ranks<T>(sorted_occurrs: &Vec<(&u32, &T)>) -> HashMap<u32, u32> {
     let mut ranks: HashMap<u32, u32> = HashMap::new();
     let occurs_len = sorted_occurrs.len();
     for (i, pair) in sorted_occurrs.iter().enumerate()  {
@@ -83,6 +216,122 @@ mod tests {
         assert_eq!(obs, exp)
     }
 
+    #[test]
+    fn test_count_weighted_occurences() {
+        let input = ArrayView1::from(&[0, 2, 0, 1, 2]);
+        let weights = ArrayView1::from(&[5.0, 1.0, 1.0, 3.0, 0.5]);
+
+        let obs = _count_weighted_occurrences(&input, &weights);
+        let mut exp = HashMap::new();
+        exp.insert(1, 3.0);
+        exp.insert(2, 1.5);
+
+        assert_eq!(obs, exp)
+    }
+
+    #[test]
+    fn test_count_weighted_occurences_zero_weights() {
+        let input = ArrayView1::from(&[1, 2, 2]);
+        let weights = ArrayView1::from(&[0.0, 1.0, 0.0]);
+
+        let obs = _count_weighted_occurrences(&input, &weights);
+        let mut exp = HashMap::new();
+        exp.insert(2, 1.0);
+
+        assert_eq!(obs, exp)
+    }
+
+    #[test]
+    fn test_rank_sequences_weighted() {
+        let input: Array2<u32> = Array2::from_shape_vec(
+            (4, 2), vec![1, 0, 1, 2, 3, 2, 3, 4]).unwrap();
+        let weights = ArrayView1::from(&[1.0, 1.0, 0.5, 0.5]);
+
+        let obs = rank_sequences_weighted(input.view(), weights);
+        let exp: Array2<u32> = Array2::from_shape_vec(
+            (4, 2), vec![2, 0, 2, 2, 1, 2, 1, 1]).unwrap();
+
+        assert_eq!(obs, exp)
+    }
+
+    #[test]
+    fn test_rank_sequences_weighted_zero_weights() {
+        let input: Array2<u32> =
+            Array2::from_shape_vec((4, 1), vec![1, 1, 1, 3]).unwrap();
+        let weights = ArrayView1::from(&[1.0, 1.0, 1.0, 0.0]);
+
+        let obs = rank_sequences_weighted(input.view(), weights);
+        let exp: Array2<u32> =
+            Array2::from_shape_vec((4, 1), vec![1, 1, 1, 0]).unwrap();
+
+        assert_eq!(obs, exp)
+    }
+
+    #[test]
+    fn test_rank_and_score_sequences_weighted() {
+        let input: Array2<u32> = Array2::from_shape_vec(
+            (4, 2), vec![1, 0, 1, 2, 3, 2, 3, 4]).unwrap();
+        let weights = ArrayView1::from(&[1.0, 1.0, 0.5, 0.5]);
+
+        let (ranks, scores) =
+            rank_and_score_sequences_weighted(input.view(), weights);
+
+        assert_eq!(ranks, rank_sequences_weighted(input.view(), weights));
+        // residues weigh 2 and 1 at the first position, 1.5 and 0.5 out of
+        // a total weight of 3 at the second
+        let entropy0 = -(2.0f64 / 3.0 * (2.0f64 / 3.0).log2()
+                         + 1.0 / 3.0 * (1.0f64 / 3.0).log2());
+        let entropy1 = -(0.75f64 * 0.75f64.log2() + 0.25 * 0.25f64.log2());
+        assert!((scores[[0, 0]] - entropy0).abs() < 1e-12);
+        assert!((scores[[1, 0]] - entropy1).abs() < 1e-12);
+        assert!((scores[[0, 1]] - (1.0 - entropy0 / 23f64.log2())).abs()
+                < 1e-12);
+        assert!((scores[[1, 1]]
+                 - (1.0 - entropy1 / 23f64.log2()) * 2.0 / 3.0).abs()
+                < 1e-12);
+    }
+
+    #[test]
+    fn test_score_occurrences() {
+        let mut input = HashMap::new();
+        input.insert(1, 2.0);
+        input.insert(2, 2.0);
+
+        let (entropy, conservation) = _score_occurrences(&input, 8.0);
+
+        assert!((entropy - 1.0).abs() < 1e-12);
+        assert!(
+            (conservation - (1.0 - 1.0 / 23f64.log2()) * 0.5).abs() < 1e-12);
+    }
+
+    #[test]
+    fn test_score_occurrences_conserved() {
+        let mut input = HashMap::new();
+        input.insert(5, 3.0);
+
+        assert_eq!(_score_occurrences(&input, 3.0), (0.0, 1.0));
+        assert_eq!(_score_occurrences(&HashMap::new(), 3.0), (0.0, 0.0));
+    }
+
+    #[test]
+    fn test_apply_ranks() {
+        let input: Array2<u32> =
+            Array2::from_shape_vec((3, 2), vec![1, 0, 2, 3, 1, 3]).unwrap();
+        let mut col0 = HashMap::new();
+        col0.insert(0, 0);
+        col0.insert(1, 2);
+        col0.insert(2, 1);
+        let mut col1 = HashMap::new();
+        col1.insert(0, 0);
+        col1.insert(3, 1);
+
+        let obs = _apply_ranks(&input.view(), &vec![col0, col1]);
+        let exp: Array2<u32> =
+            Array2::from_shape_vec((3, 2), vec![2, 0, 1, 1, 2, 1]).unwrap();
+
+        assert_eq!(obs, exp)
+    }
+
     #[test]
     fn test_sort_occurences() {
         let mut input = HashMap::new();
@@ -99,6 +348,20 @@ mod tests {
         assert_eq!(test, true);
     }
 
+    #[test]
+    fn test_sort_weighted_occurences() {
+        let mut input = HashMap::new();
+        input.insert(1, 0.5);
+        input.insert(2, 1.25);
+        input.insert(3, 0.5);
+
+        let obs = _sort_occurrences(&input);
+        let exp: [(&u32, &f64); 3] = [(&2, &1.25), (&1, &0.5), (&3, &0.5)];
+        let test = exp.iter().zip(obs).all(|(e, o)| *e == o);
+
+        assert_eq!(test, true);
+    }
+
     #[test]
     fn test_convert_to_ranks() {
         let input = vec![(&3, &4), (&4, &4), (&2, &3), (&1, &2), (&6, &2)];
@@ -35,7 +35,8 @@ setup(
             'assets/loadings/vega/licenses/*',
             'assets/loadings/pdb-litemol/*',
             'assets/loadings/pdb-litemol/license/*',
-            'assets/loadings/assets/fonts/*'
+            'assets/loadings/assets/fonts/*',
+            'assets/scores/index.html'
         ],
         'q2_protein_pca.tests': ['data/*'],
     },